@@ -0,0 +1,73 @@
+"""
+Script para crear y rellenar la tabla contadores_no_leidos
+- Una fila por usuario con sus notificaciones y mensajes no leídos
+- Índice parcial ix_notificaciones_no_leidas para los conteos de respaldo
+- Se puede volver a ejecutar: recalcula los contadores (igual que la conciliación)
+"""
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+async def add_contadores_no_leidos():
+    try:
+        # Conectar a la base de datos
+        database_url = os.getenv("DATABASE_URL")
+        asyncpg_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        conn = await asyncpg.connect(asyncpg_url)
+
+        print("✅ Conexión exitosa a la base de datos")
+        print("\n" + "="*60)
+
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS contadores_no_leidos (
+            id_usuario INTEGER PRIMARY KEY REFERENCES usuarios (id_usuario) ON DELETE CASCADE,
+            notificaciones INTEGER NOT NULL DEFAULT 0,
+            mensajes INTEGER NOT NULL DEFAULT 0,
+            fecha_actualizacion TIMESTAMP DEFAULT now()
+        );
+        """)
+        print("✅ contadores_no_leidos      : tabla disponible")
+
+        # CONCURRENTLY no bloquea las escrituras en notificaciones (no admite transacción)
+        await conn.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notificaciones_no_leidas
+        ON notificaciones (id_usuario)
+        WHERE estado_notificacion = 'no_leida';
+        """)
+        print("✅ ix_notificaciones_no_leidas: índice disponible")
+
+        resultado = await conn.execute("""
+        INSERT INTO contadores_no_leidos (id_usuario, notificaciones, mensajes)
+        SELECT u.id_usuario,
+               (SELECT count(*) FROM notificaciones n
+                WHERE n.id_usuario = u.id_usuario AND n.estado_notificacion = 'no_leida'),
+               (SELECT count(*) FROM mensajes m
+                WHERE m.id_destinatario = u.id_usuario AND m.estado_mensaje <> 'leido')
+        FROM usuarios u
+        ON CONFLICT (id_usuario) DO UPDATE
+        SET notificaciones = EXCLUDED.notificaciones,
+            mensajes = EXCLUDED.mensajes,
+            fecha_actualizacion = now();
+        """)
+        print(f"✅ Backfill                  : {resultado.split()[-1]} usuarios")
+
+        fila = await conn.fetchrow("""
+        SELECT coalesce(sum(notificaciones), 0) AS notificaciones, coalesce(sum(mensajes), 0) AS mensajes
+        FROM contadores_no_leidos;
+        """)
+        print(f"📊 No leídos -> Notificaciones: {fila['notificaciones']} | Mensajes: {fila['mensajes']}")
+
+        await conn.close()
+        print("\n✅ Proceso completado exitosamente!")
+
+    except Exception as e:
+        print(f"❌ Error al crear contadores_no_leidos: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    asyncio.run(add_contadores_no_leidos())
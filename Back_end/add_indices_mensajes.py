@@ -0,0 +1,50 @@
+"""
+Script para agregar los índices de la bandeja de mensajes
+- ix_mensajes_remitente / ix_mensajes_destinatario: mensajes de un usuario
+- ix_mensajes_no_leidos: conteo de no leídos por conversación (índice parcial)
+- ix_mensajes_conversacion: historial paginado de una conversación
+"""
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+INDICES = {
+    "ix_mensajes_remitente": "ON mensajes (id_remitente, id_mensaje)",
+    "ix_mensajes_destinatario": "ON mensajes (id_destinatario, id_mensaje)",
+    "ix_mensajes_no_leidos": "ON mensajes (id_destinatario, id_remitente) WHERE estado_mensaje <> 'leido'",
+    "ix_mensajes_conversacion": "ON mensajes (LEAST(id_remitente, id_destinatario), GREATEST(id_remitente, id_destinatario), id_mensaje)",
+}
+
+async def add_indices_mensajes():
+    try:
+        # Conectar a la base de datos
+        database_url = os.getenv("DATABASE_URL")
+        asyncpg_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        conn = await asyncpg.connect(asyncpg_url)
+
+        print("✅ Conexión exitosa a la base de datos")
+        print("\n" + "="*60)
+
+        # CONCURRENTLY no bloquea las escrituras en mensajes (no admite transacción)
+        for nombre, definicion in INDICES.items():
+            await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre} {definicion};")
+            print(f"✅ {nombre:<26}: índice disponible")
+
+        await conn.execute("ANALYZE mensajes;")
+        total = await conn.fetchval("SELECT count(*) FROM mensajes;")
+        print(f"📊 Mensajes: {total}")
+
+        await conn.close()
+        print("\n✅ Proceso completado exitosamente!")
+
+    except Exception as e:
+        print(f"❌ Error al agregar los índices de mensajes: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    asyncio.run(add_indices_mensajes())
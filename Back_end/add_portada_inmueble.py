@@ -0,0 +1,54 @@
+"""
+Script para agregar la columna url_portada a la tabla inmuebles
+- La portada es la primera imagen subida de cada inmueble
+- Rellena la columna para los inmuebles que ya tienen imágenes
+"""
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+async def add_portada_inmueble():
+    try:
+        # Conectar a la base de datos
+        database_url = os.getenv("DATABASE_URL")
+        asyncpg_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        conn = await asyncpg.connect(asyncpg_url)
+
+        print("✅ Conexión exitosa a la base de datos")
+        print("\n" + "="*60)
+
+        # Agregar la columna si no existe
+        await conn.execute("""
+        ALTER TABLE inmuebles
+        ADD COLUMN IF NOT EXISTS url_portada VARCHAR(255);
+        """)
+        print("✅ url_portada         : columna disponible")
+
+        # Rellenar con la primera imagen de cada inmueble
+        resultado = await conn.execute("""
+        UPDATE inmuebles i
+        SET url_portada = primera.url_imagen
+        FROM (
+            SELECT DISTINCT ON (id_inmueble) id_inmueble, url_imagen
+            FROM imagenes_inmueble
+            ORDER BY id_inmueble, id_imagen
+        ) AS primera
+        WHERE i.id_inmueble = primera.id_inmueble
+        AND i.url_portada IS NULL;
+        """)
+        print(f"✅ Portadas asignadas : {resultado}")
+
+        await conn.close()
+        print("\n✅ Proceso completado exitosamente!")
+
+    except Exception as e:
+        print(f"❌ Error al agregar la portada: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    asyncio.run(add_portada_inmueble())
@@ -0,0 +1,78 @@
+"""
+Script para agregar la columna roles_mask a la tabla usuarios
+- Máscara de bits de roles: arrendatario=1, arrendador=2, admin=4 (utils/roles.py)
+- Se rellena a partir de tipo_usuario (roles separados por coma)
+- Índice parcial para listar arrendadores
+"""
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+async def add_roles_mask():
+    try:
+        # Conectar a la base de datos
+        database_url = os.getenv("DATABASE_URL")
+        asyncpg_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        conn = await asyncpg.connect(asyncpg_url)
+
+        print("✅ Conexión exitosa a la base de datos")
+        print("\n" + "="*60)
+
+        await conn.execute("""
+        ALTER TABLE usuarios
+        ADD COLUMN IF NOT EXISTS roles_mask INTEGER NOT NULL DEFAULT 1;
+        """)
+        print("✅ roles_mask          : columna disponible (valor inicial 1 = arrendatario)")
+
+        # Backfill desde tipo_usuario ("admin" y "administrador" son el mismo rol)
+        resultado = await conn.execute("""
+        WITH roles AS (
+            SELECT id_usuario,
+                   string_to_array(replace(lower(coalesce(tipo_usuario, '')), ' ', ''), ',') AS lista
+            FROM usuarios
+        ), mascaras AS (
+            SELECT id_usuario,
+                   (CASE WHEN 'arrendatario' = ANY(lista) THEN 1 ELSE 0 END)
+                 | (CASE WHEN 'arrendador' = ANY(lista) THEN 2 ELSE 0 END)
+                 | (CASE WHEN lista && ARRAY['admin', 'administrador'] THEN 4 ELSE 0 END) AS mascara
+            FROM roles
+        )
+        UPDATE usuarios u
+        SET roles_mask = CASE WHEN m.mascara = 0 THEN 1 ELSE m.mascara END
+        FROM mascaras m
+        WHERE u.id_usuario = m.id_usuario
+          AND u.roles_mask <> CASE WHEN m.mascara = 0 THEN 1 ELSE m.mascara END;
+        """)
+        print(f"✅ Backfill            : {resultado.split()[-1]} usuarios actualizados")
+
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS ix_usuarios_arrendadores
+        ON usuarios (id_usuario)
+        WHERE (roles_mask & 2) <> 0;
+        """)
+        print("✅ ix_usuarios_arrendadores: índice disponible")
+
+        # Resumen por rol
+        filas = await conn.fetch("""
+        SELECT
+            count(*) FILTER (WHERE (roles_mask & 1) <> 0) AS arrendatarios,
+            count(*) FILTER (WHERE (roles_mask & 2) <> 0) AS arrendadores,
+            count(*) FILTER (WHERE (roles_mask & 4) <> 0) AS admins
+        FROM usuarios;
+        """)
+        print(f"📊 Arrendatarios: {filas[0]['arrendatarios']} | Arrendadores: {filas[0]['arrendadores']} | Admins: {filas[0]['admins']}")
+
+        await conn.close()
+        print("\n✅ Proceso completado exitosamente!")
+
+    except Exception as e:
+        print(f"❌ Error al agregar roles_mask: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    asyncio.run(add_roles_mask())
@@ -0,0 +1,47 @@
+"""
+Script para agregar la columna token_version a la tabla usuarios
+- Cada token JWT lleva la versión vigente en el claim "ver"
+- Incrementar la columna revoca todos los tokens emitidos antes
+"""
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+async def add_token_version():
+    try:
+        # Conectar a la base de datos
+        database_url = os.getenv("DATABASE_URL")
+        asyncpg_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        conn = await asyncpg.connect(asyncpg_url)
+
+        print("✅ Conexión exitosa a la base de datos")
+        print("\n" + "="*60)
+
+        await conn.execute("""
+        ALTER TABLE usuarios
+        ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+        """)
+        print("✅ token_version       : columna disponible (valor inicial 0)")
+
+        # Índice parcial: el servidor solo carga usuarios con revocaciones
+        await conn.execute("""
+        CREATE INDEX IF NOT EXISTS ix_usuarios_token_version
+        ON usuarios (id_usuario, token_version)
+        WHERE token_version > 0;
+        """)
+        print("✅ ix_usuarios_token_version: índice disponible")
+
+        await conn.close()
+        print("\n✅ Proceso completado exitosamente!")
+
+    except Exception as e:
+        print(f"❌ Error al agregar token_version: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    asyncio.run(add_token_version())
@@ -1,125 +1,165 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from schemas.user import LoginUsuario, RegistroUsuario, UsuarioMostrar, UsuarioPerfilCompleto
+from schemas.user import LoginUsuario, RegistroUsuario, UsuarioMostrar, UsuarioPerfilCompleto, RefreshTokenRequest
 from schemas.user import CambiarPassword, UsuarioActualizar, CambiarCelular
 from db.database import obtener_sesion
-from services.user import buscar_usuario_por_email, buscar_usuario_por_celular, crear_usuario, actualizar_usuario
-from utils.security.seguridad import verificar_password, hashear_password, es_password_hasheada
-from utils.security.jwt import crear_token, obtener_usuario_actual
+from services.user import buscar_usuario_por_email, buscar_usuario_por_celular, actualizar_usuario
+from services.user import programar_rehash_password, registrar_usuario, UsuarioDuplicado
+from services.migracion_passwords import migracion_passwords
+from utils.security.seguridad import verificar_password_async, hashear_password_async, necesita_rehash
+from utils.security.jwt import crear_token, obtener_usuario_actual, claims_usuario, EXPIRACION_MINUTOS, require_roles
+from utils.security.refresh_tokens import (
+    emitir_refresh_token, rotar_refresh_token, revocar_refresh_token, RefreshTokenInvalido
+)
+from utils.security.versiones_token import versiones_token, revocar_tokens_usuario
+from utils.security.cache_usuarios import invalidar_usuario
+from utils.security.throttling import limitador_login
 from utils.security.error_messages import AuthErrorMessages
 from schemas.verification import PhoneVerification, CodeVerification
-from services.whatsapp import WhatsAppService
+from services.whatsapp import whatsapp_service
+from services.cola_whatsapp import cola_whatsapp
 from schemas.user import CambiarPassword, UsuarioActualizar, CambiarCelular
 from models.usuario import Usuario
 from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/auth", tags=["Autenticación"])
 
-#verification de telefono
-whatsapp_service = WhatsAppService()
-
 # 🚪 LOGIN - OAuth2 compatible con Swagger
 @router.post("/login")
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(), 
     db: AsyncSession = Depends(obtener_sesion)
 ):
+    # Rechazar ataques de fuerza bruta antes de cualquier trabajo de bcrypt
+    await limitador_login.verificar(form_data.username, request.client.host if request.client else None)
+
     # En OAuth2PasswordRequestForm, el número de celular viene en form_data.username
     usuario = await buscar_usuario_por_celular(db, form_data.username)
     
-    if not usuario or not verificar_password(form_data.password, usuario.password):
+    if not usuario or not await verificar_password_async(form_data.password, usuario.password):
+        await limitador_login.registrar_fallo(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=AuthErrorMessages.INVALID_CREDENTIALS,
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    token = crear_token({
-        "sub": usuario.num_celular,
-        "id": usuario.id_usuario,
-        "rol": usuario.tipo_usuario
-    })
+    await limitador_login.registrar_exito(form_data.username)
+    if necesita_rehash(usuario.password):
+        programar_rehash_password(usuario, form_data.password)
+
+    token = crear_token(claims_usuario(usuario))
+    refresh_token, _ = emitir_refresh_token(db, usuario)
+    await db.commit()
 
     return {
         "access_token": token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
+        "expires_in": EXPIRACION_MINUTOS * 60,
         "usuario": usuario.num_celular,
         "rol": usuario.tipo_usuario
     }
 
 # 🚪 LOGIN ALTERNATIVO - Para usar con JSON (opcional)
 @router.post("/login-json")
-async def login_json(datos: LoginUsuario, db: AsyncSession = Depends(obtener_sesion)):
+async def login_json(datos: LoginUsuario, request: Request, db: AsyncSession = Depends(obtener_sesion)):
+    await limitador_login.verificar(datos.num_celular, request.client.host if request.client else None)
+
     usuario = await buscar_usuario_por_celular(db, datos.num_celular)
     
-    if not usuario or not verificar_password(datos.password, usuario.password):
+    if not usuario or not await verificar_password_async(datos.password, usuario.password):
+        await limitador_login.registrar_fallo(datos.num_celular)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=AuthErrorMessages.INVALID_CREDENTIALS
         )
 
-    token = crear_token({
-        "sub": usuario.num_celular,
-        "id": usuario.id_usuario,
-        "rol": usuario.tipo_usuario
-    })
+    await limitador_login.registrar_exito(datos.num_celular)
+    if necesita_rehash(usuario.password):
+        programar_rehash_password(usuario, datos.password)
+
+    token = crear_token(claims_usuario(usuario))
+    refresh_token, _ = emitir_refresh_token(db, usuario)
+    await db.commit()
 
     return {
         "access_token": token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
+        "expires_in": EXPIRACION_MINUTOS * 60,
         "usuario": usuario.num_celular,
         "rol": usuario.tipo_usuario
     }
 
+# 🔄 REFRESH - Renovar el token de acceso sin volver a enviar la contraseña
+@router.post("/refresh")
+async def refrescar_token(datos: RefreshTokenRequest, db: AsyncSession = Depends(obtener_sesion)):
+    """
+    Emite un nuevo token de acceso y rota el refresh token.
+    
+    - No verifica contraseña (sin bcrypt): mucho más barato que /auth/login
+    - El refresh token usado queda revocado; guarda el nuevo que se devuelve
+    - Reutilizar un refresh token ya rotado revoca toda la sesión
+    """
+    try:
+        usuario, nuevo_refresh_token = await rotar_refresh_token(db, datos.refresh_token)
+    except RefreshTokenInvalido:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.REFRESH_TOKEN_INVALID,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return {
+        "access_token": crear_token(claims_usuario(usuario)),
+        "refresh_token": nuevo_refresh_token,
+        "token_type": "bearer",
+        "expires_in": EXPIRACION_MINUTOS * 60
+    }
+
+# 🚪 LOGOUT - Revocar el refresh token
+@router.post("/logout")
+async def logout(datos: RefreshTokenRequest, db: AsyncSession = Depends(obtener_sesion)):
+    """
+    Revoca el refresh token. El token de acceso actual expira por sí solo.
+    """
+    await revocar_refresh_token(db, datos.refresh_token)
+    return {"mensaje": "Sesión cerrada exitosamente"}
+
 # 📝 REGISTRO (mejorado con manejo de errores)
 @router.post("/registro", status_code=status.HTTP_201_CREATED)
 async def registro(datos: RegistroUsuario, db: AsyncSession = Depends(obtener_sesion)):
+    # Hashear antes de abrir la transacción (bcrypt corre en el pool dedicado)
+    datos_dict = datos.dict()
+    datos_dict['password'] = await hashear_password_async(datos.password)
+    # Asegurar que siempre inicie como arrendatario
+    datos_dict['tipo_usuario'] = 'arrendatario'
+
     try:
-        # Verificar si el email ya existe
-        usuario_existente_email = await buscar_usuario_por_email(db, datos.email)
-        if usuario_existente_email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=AuthErrorMessages.EMAIL_ALREADY_EXISTS
-            )
-        
-        # Verificar si el número de celular ya existe
-        usuario_existente_celular = await buscar_usuario_por_celular(db, datos.num_celular)
-        if usuario_existente_celular:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El número de celular ya está registrado"
-            )
-        
-        # Crear nuevo usuario
-        datos_dict = datos.dict()
-        # Asegurar que siempre inicie como arrendatario
-        datos_dict['tipo_usuario'] = 'arrendatario'
-        nuevo_usuario = await crear_usuario(db, datos_dict)
-        return {
-            "mensaje": "Usuario registrado exitosamente", 
-            "usuario_id": nuevo_usuario.id_usuario,
-            "rol": nuevo_usuario.tipo_usuario
-        }
-        
-    except IntegrityError as e:
+        # Un solo INSERT ... RETURNING; los duplicados los detectan las restricciones únicas
+        nuevo_usuario = await registrar_usuario(db, datos_dict)
+        await db.commit()
+    except UsuarioDuplicado as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=AuthErrorMessages.EMAIL_ALREADY_EXISTS if e.campo == "email" else AuthErrorMessages.PHONE_ALREADY_EXISTS
+        )
+    except IntegrityError:
         await db.rollback()
-        if "usuarios_email_key" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=AuthErrorMessages.EMAIL_ALREADY_EXISTS
-            )
-        elif "usuarios_num_celular_key" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=AuthErrorMessages.PHONE_ALREADY_EXISTS
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=AuthErrorMessages.INTERNAL_SERVER_ERROR
-            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=AuthErrorMessages.INTERNAL_SERVER_ERROR
+        )
+
+    return {
+        "mensaje": "Usuario registrado exitosamente", 
+        "usuario_id": nuevo_usuario.id_usuario,
+        "rol": nuevo_usuario.tipo_usuario
+    }
 
 # 👤 PERFIL
 @router.get("/perfil", response_model=UsuarioPerfilCompleto)
@@ -203,6 +243,7 @@ async def actualizar_perfil(
                 detail=AuthErrorMessages.USER_NOT_FOUND_GENERAL
             )
         
+        invalidar_usuario(usuario_actual.id_usuario)
         return usuario_actualizado
         
     except ValueError as e:
@@ -242,16 +283,20 @@ async def cambiar_password(
     db: AsyncSession = Depends(obtener_sesion),
     usuario_actual: Usuario = Depends(obtener_usuario_actual)
 ):
-    if not verificar_password(datos.password_actual, usuario_actual.password):
+    if not await verificar_password_async(datos.password_actual, usuario_actual.password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=AuthErrorMessages.CURRENT_PASSWORD_INCORRECT
         )
     
-    nuevo_password_hash = hashear_password(datos.password_nueva)
+    nuevo_password_hash = await hashear_password_async(datos.password_nueva)
     usuario_actual.password = nuevo_password_hash
+    # Invalidar los tokens emitidos con la contraseña anterior
+    nueva_version = revocar_tokens_usuario(usuario_actual)
     
     await db.commit()
+    invalidar_usuario(usuario_actual.id_usuario)
+    versiones_token.registrar(usuario_actual.id_usuario, nueva_version)
     return {"mensaje": "Password actualizada exitosamente"}
 
 # 📱 CAMBIAR CELULAR
@@ -272,7 +317,7 @@ async def cambiar_celular(
     """
     try:
         # Verificar contraseña actual
-        if not verificar_password(datos.password, usuario_actual.password):
+        if not await verificar_password_async(datos.password, usuario_actual.password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Contraseña incorrecta"
@@ -305,8 +350,12 @@ async def cambiar_celular(
         usuario_actual.celular_verificado = False  # Marcar como no verificado
         from datetime import datetime
         usuario_actual.fecha_actualizacion = datetime.now()
+        # Los tokens existentes llevan el celular anterior como "sub"
+        nueva_version = revocar_tokens_usuario(usuario_actual)
         
         await db.commit()
+        invalidar_usuario(usuario_actual.id_usuario)
+        versiones_token.registrar(usuario_actual.id_usuario, nueva_version)
         await db.refresh(usuario_actual)
         
         return usuario_actual
@@ -324,12 +373,22 @@ async def cambiar_celular(
 
 # ENDPOINT: Enviar código de verificación por WhatsApp
 @router.post("/enviar-codigo")
-async def enviar_codigo(phone: PhoneVerification):
-    success = await whatsapp_service.send_verification_code(phone.phone_number)
-    if success:
-        return {"message": "Código enviado exitosamente"}
-    else:
-        raise HTTPException(status_code=500, detail=AuthErrorMessages.CODE_SEND_ERROR)
+async def enviar_codigo(phone: PhoneVerification, db: AsyncSession = Depends(obtener_sesion)):
+    # Estado cacheado del microservicio: si está caído no se encola un código que no llegará
+    if not await whatsapp_service.check_whatsapp_service_status():
+        raise HTTPException(status_code=503, detail=AuthErrorMessages.WHATSAPP_UNAVAILABLE)
+    # El envío lo hace la cola de WhatsApp en segundo plano
+    code = await whatsapp_service.generate_code(phone.phone_number)
+    cola_whatsapp.encolar(
+        db,
+        phone.phone_number,
+        whatsapp_service.build_verification_message(code),
+        tipo="otp",
+        expira_en=datetime.now() + timedelta(minutes=5)
+    )
+    await db.commit()
+    cola_whatsapp.notificar()
+    return {"message": "Código enviado exitosamente"}
 
 # ENDPOINT: Verificar código de WhatsApp
 @router.post("/verificar-codigo")
@@ -340,48 +399,30 @@ async def verificar_codigo(verification: CodeVerification):
     else:
         raise HTTPException(status_code=400, detail=AuthErrorMessages.INVALID_VERIFICATION_CODE)
 
-# ENDPOINT: Corregir contraseñas no hasheadas (TEMPORAL - SOLO PARA DESARROLLO)
-@router.post("/corregir-passwords")
-async def corregir_passwords(db: AsyncSession = Depends(obtener_sesion)):
+# ENDPOINT: Corregir contraseñas no hasheadas (trabajo por lotes en segundo plano)
+@router.post("/corregir-passwords", status_code=status.HTTP_202_ACCEPTED)
+async def corregir_passwords(
+    reanudar: bool = True,
+    usuario_actual: Usuario = Depends(require_roles("admin"))
+):
     """
-    Endpoint temporal para corregir contraseñas que no están hasheadas correctamente.
-    SOLO USAR EN DESARROLLO.
+    Inicia la migración de contraseñas en texto plano a bcrypt.
+    
+    - Procesa usuarios por lotes (keyset) y hashea en un pool de procesos
+    - No bloquea la API; consultar el avance en GET /auth/corregir-passwords/estado
+    - reanudar=true continúa desde el último lote confirmado si hubo una interrupción
     """
-    try:
-        from sqlalchemy import select, update
-        from models.usuario import Usuario
-        
-        # Buscar todos los usuarios
-        resultado = await db.execute(select(Usuario))
-        usuarios = resultado.scalars().all()
-        
-        usuarios_corregidos = 0
-        
-        for usuario in usuarios:
-            # Verificar si la contraseña no está hasheada
-            if not es_password_hasheada(usuario.password):
-                # Hashear la contraseña en texto plano
-                nuevo_hash = hashear_password(usuario.password)
-                
-                # Actualizar en la base de datos
-                await db.execute(
-                    update(Usuario)
-                    .where(Usuario.id_usuario == usuario.id_usuario)
-                    .values(password=nuevo_hash)
-                )
-                usuarios_corregidos += 1
-        
-        await db.commit()
-        
-        return {
-            "message": f"Se corrigieron {usuarios_corregidos} contraseñas",
-            "usuarios_procesados": len(usuarios),
-            "usuarios_corregidos": usuarios_corregidos
-        }
-        
-    except Exception as e:
-        await db.rollback()
+    if not migracion_passwords.iniciar(reanudar=reanudar):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al corregir contraseñas: {str(e)}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ya hay una migración de contraseñas en curso"
         )
+    return {
+        "message": "Migración de contraseñas iniciada",
+        "progreso": migracion_passwords.progreso()
+    }
+
+# ENDPOINT: Progreso de la migración de contraseñas
+@router.get("/corregir-passwords/estado")
+async def estado_corregir_passwords(usuario_actual: Usuario = Depends(require_roles("admin"))):
+    return migracion_passwords.progreso()
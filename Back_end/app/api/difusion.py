@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional
+from db.database import obtener_sesion
+from models.difusion import Difusion, DifusionDestinatario
+from models.inmueble import Inmueble
+from models.usuario import Usuario
+from schemas.difusion import DifusionCrear, DifusionOut, DifusionProgreso, DifusionDestinatarioOut
+from services.difusion import difusor
+from utils.security.jwt import require_roles
+
+router = APIRouter(prefix="/difusiones", tags=["Difusiones"])
+
+# POST /difusiones/ - Crear y lanzar una difusión por WhatsApp (solo administradores)
+@router.post("/", response_model=DifusionOut, status_code=status.HTTP_202_ACCEPTED)
+async def crear_difusion(
+    datos: DifusionCrear,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin"))
+):
+    """
+    Envía un mensaje de WhatsApp a toda una audiencia en segundo plano.
+    Responde al instante; el avance se consulta en GET /difusiones/{id}.
+    """
+    if datos.id_inmueble is not None and await db.get(Inmueble, datos.id_inmueble) is None:
+        raise HTTPException(status_code=404, detail="Inmueble no encontrado")
+
+    return await difusor.crear(
+        db,
+        id_creador=usuario_actual.id_usuario,
+        audiencia=datos.audiencia.value,
+        mensaje=datos.mensaje,
+        id_inmueble=datos.id_inmueble
+    )
+
+# GET /difusiones/ - Listar difusiones recientes (solo administradores)
+@router.get("/", response_model=List[DifusionOut])
+async def listar_difusiones(
+    limite: int = 20,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin", lectura=True))
+):
+    resultado = await db.execute(
+        select(Difusion).order_by(Difusion.id_difusion.desc()).limit(min(limite, 100))
+    )
+    return resultado.scalars().all()
+
+# GET /difusiones/{id_difusion} - Progreso de una difusión (solo administradores)
+@router.get("/{id_difusion}", response_model=DifusionProgreso)
+async def obtener_difusion(
+    id_difusion: int,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin", lectura=True))
+):
+    progreso = await difusor.progreso(db, id_difusion)
+    if progreso is None:
+        raise HTTPException(status_code=404, detail="Difusión no encontrada")
+    return DifusionProgreso(
+        **DifusionOut.model_validate(progreso["difusion"]).model_dump(),
+        por_estado=progreso["por_estado"]
+    )
+
+# GET /difusiones/{id_difusion}/destinatarios - Estado de entrega por destinatario (solo administradores)
+@router.get("/{id_difusion}/destinatarios", response_model=List[DifusionDestinatarioOut])
+async def listar_destinatarios(
+    id_difusion: int,
+    estado: Optional[str] = None,
+    despues_de: int = 0,
+    limite: int = 100,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin", lectura=True))
+):
+    """
+    Paginación por id_usuario: pasar en despues_de el último id_usuario recibido.
+    """
+    consulta = (
+        select(DifusionDestinatario)
+        .where(DifusionDestinatario.id_difusion == id_difusion, DifusionDestinatario.id_usuario > despues_de)
+        .order_by(DifusionDestinatario.id_usuario)
+        .limit(min(limite, 1000))
+    )
+    if estado:
+        consulta = consulta.where(DifusionDestinatario.estado == estado)
+    resultado = await db.execute(consulta)
+    return resultado.scalars().all()
+
+# POST /difusiones/{id_difusion}/cancelar - Detener una difusión (solo administradores)
+@router.post("/{id_difusion}/cancelar")
+async def cancelar_difusion(
+    id_difusion: int,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin"))
+):
+    if not await difusor.cancelar(db, id_difusion):
+        raise HTTPException(status_code=400, detail="La difusión no existe o ya terminó")
+    return {"mensaje": "Difusión cancelada"}
+
+# POST /difusiones/{id_difusion}/reintentar - Reenviar a los destinatarios fallidos (solo administradores)
+@router.post("/{id_difusion}/reintentar", status_code=status.HTTP_202_ACCEPTED)
+async def reintentar_difusion(
+    id_difusion: int,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin"))
+):
+    reintentos = await difusor.reintentar_fallidos(db, id_difusion)
+    if reintentos is None:
+        raise HTTPException(status_code=400, detail="La difusión no existe o fue cancelada")
+    return {"mensaje": "Reintento iniciado" if reintentos else "No hay destinatarios fallidos", "destinatarios": reintentos}
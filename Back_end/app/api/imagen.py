@@ -41,6 +41,11 @@ async def subir_imagen_inmueble(
     )
     
     db.add(nueva_imagen)
+    
+    # La primera imagen del inmueble se usa como portada en los listados
+    if not inmueble.url_portada:
+        inmueble.url_portada = imagen_data.url_imagen
+    
     await db.commit()
     await db.refresh(nueva_imagen)
     
@@ -79,6 +84,21 @@ async def eliminar_imagen(
     
     # Eliminar registro de la base de datos
     await db.delete(imagen)
+    
+    # Si era la portada, reemplazarla por la siguiente imagen disponible
+    inmueble = await db.get(Inmueble, imagen.id_inmueble)
+    if inmueble and inmueble.url_portada == imagen.url_imagen:
+        result = await db.execute(
+            select(ImagenInmueble.url_imagen)
+            .where(
+                ImagenInmueble.id_inmueble == imagen.id_inmueble,
+                ImagenInmueble.id_imagen != imagen.id_imagen
+            )
+            .order_by(ImagenInmueble.id_imagen)
+            .limit(1)
+        )
+        inmueble.url_portada = result.scalar_one_or_none()
+    
     await db.commit()
 
 # GET /imagenes/{id_inmueble} - Listar imágenes por inmueble
@@ -87,22 +107,21 @@ async def listar_imagenes_inmueble(
     id_inmueble: int,
     db: AsyncSession = Depends(obtener_sesion)
 ):
-    # Verificar que el inmueble existe
-    result = await db.execute(
-        select(Inmueble).where(Inmueble.id_inmueble == id_inmueble)
-    )
-    inmueble = result.scalar_one_or_none()
-    
-    if not inmueble:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Inmueble no encontrado"
-        )
-    
     # Obtener imágenes del inmueble
     result = await db.execute(
-        select(ImagenInmueble).where(ImagenInmueble.id_inmueble == id_inmueble)
+        select(ImagenInmueble)
+        .where(ImagenInmueble.id_inmueble == id_inmueble)
+        .order_by(ImagenInmueble.id_imagen)
     )
     imagenes = result.scalars().all()
     
+    # Solo si no hay imágenes hace falta distinguir "sin imágenes" de "no existe"
+    if not imagenes:
+        inmueble = await db.get(Inmueble, id_inmueble)
+        if not inmueble:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Inmueble no encontrado"
+            )
+    
     return imagenes
@@ -1,19 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils.roles import tiene_rol, agregar_rol, es_arrendatario, es_arrendador
-from sqlalchemy import update
-from models import Inmueble, CaracteristicasInmueble
+from utils.roles import tiene_rol, agregar_rol, es_arrendatario, es_arrendador, mascara_desde_tipo
+from sqlalchemy import update, func
+from models import Inmueble, CaracteristicasInmueble, EstadisticaInmueble
 from models.usuario import Usuario
 from db.database import obtener_sesion
 from typing import List, Optional
 from schemas.inmueble import (
     InmuebleCreate, InmuebleCreateCompleto, InmuebleOut, 
-    InmuebleUpdate, EstadoInmueble, InmuebleCreateResponse
+    InmuebleUpdate, EstadoInmueble, InmuebleCreateResponse, OrdenInmuebleEnum
 )
 from typing import Dict, Any
 from sqlalchemy.future import select
 from utils.security.jwt import obtener_usuario_actual
+from services.contador_vistas import contador_vistas
+from utils.security.cache_usuarios import invalidar_usuario
 from pydantic import ValidationError
 import traceback  
 
@@ -21,6 +23,26 @@ import traceback
 INMUEBLE_NO_ENCONTRADO = "Inmueble no encontrado"
 INMUEBLE_CREADO = "Inmueble creado exitosamente"
 
+# Relaciones opcionales que se pueden incrustar con ?include=
+INCLUDE_DESCRIPCION = "Relaciones a incluir separadas por coma (disponible: imagenes)"
+
+def _parsear_include(include: Optional[str]) -> set:
+    """Convierte 'imagenes,otra' en {'imagenes', 'otra'}"""
+    if not include:
+        return set()
+    return {parte.strip().lower() for parte in include.split(",") if parte.strip()}
+
+def _serializar_imagenes(inmueble: Inmueble) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id_imagen": imagen.id_imagen,
+            "id_inmueble": imagen.id_inmueble,
+            "url_imagen": imagen.url_imagen,
+            "fecha_subida": imagen.fecha_subida
+        }
+        for imagen in inmueble.imagenes
+    ]
+
 router = APIRouter(prefix="/inmuebles", tags=["inmuebles"])
 
 # POST: Crear nuevo inmueble (completo)
@@ -123,10 +145,12 @@ async def crear_inmueble(
                 await db.execute(
                     update(Usuario)
                     .where(Usuario.id_usuario == usuario_actual.id_usuario)
-                    .values(tipo_usuario=nuevos_roles)
+                    .values(tipo_usuario=nuevos_roles, roles_mask=mascara_desde_tipo(nuevos_roles))
                 )
         
         await db.commit()
+        if nuevos_roles != roles_actuales:
+            invalidar_usuario(usuario_actual.id_usuario)
         await db.refresh(inmueble)
         
         return InmuebleCreateResponse(
@@ -204,14 +228,38 @@ async def crear_inmueble_simple(
 
 # GET: Listar inmuebles filtrados
 @router.get("/", response_model=List[InmuebleOut])
-async def listar_inmuebles(tipo_inmueble: Optional[str] = None, db: AsyncSession = Depends(obtener_sesion)):
+async def listar_inmuebles(
+    tipo_inmueble: Optional[str] = None,
+    orden: Optional[OrdenInmuebleEnum] = None,
+    include: Optional[str] = Query(None, description=INCLUDE_DESCRIPCION),
+    db: AsyncSession = Depends(obtener_sesion)
+):
+    """
+    Listar inmuebles, opcionalmente filtrados por tipo.
+    
+    - **orden=populares**: ordena por número de vistas (de mayor a menor)
+    - **include=imagenes**: incrusta las imágenes de todos los inmuebles de la página
+      (una sola consulta adicional con IN, en vez de un GET /imagenes/{id} por tarjeta)
+    
+    La portada (primera imagen) se incluye siempre sin consultas extra.
+    """
     try:
-        # Usar joinedload para cargar características en una sola consulta
-        from sqlalchemy.orm import joinedload
+        # Usar joinedload para cargar características y estadísticas en una sola consulta
+        from sqlalchemy.orm import joinedload, selectinload
         
-        stmt = select(Inmueble).options(joinedload(Inmueble.caracteristicas))
+        incluir = _parsear_include(include)
+        stmt = select(Inmueble).options(
+            joinedload(Inmueble.caracteristicas),
+            joinedload(Inmueble.estadisticas)
+        )
+        if "imagenes" in incluir:
+            stmt = stmt.options(selectinload(Inmueble.imagenes))
         if tipo_inmueble:
             stmt = stmt.where(Inmueble.tipo_inmueble == tipo_inmueble)
+        if orden == OrdenInmuebleEnum.populares:
+            stmt = stmt.outerjoin(
+                EstadisticaInmueble, EstadisticaInmueble.id_inmueble == Inmueble.id_inmueble
+            ).order_by(func.coalesce(EstadisticaInmueble.vistas, 0).desc(), Inmueble.id_inmueble)
         
         result = await db.execute(stmt)
         inmuebles = result.unique().scalars().all()
@@ -249,8 +297,14 @@ async def listar_inmuebles(tipo_inmueble: Optional[str] = None, db: AsyncSession
                 "aire_acondicionado": caracteristicas.aire_acondicionado if caracteristicas else False,
                 "servicio_lavanderia": caracteristicas.servicio_lavanderia if caracteristicas else False,
                 "camaras_seguridad": caracteristicas.camaras_seguridad if caracteristicas else False,
-                "mascotas_permitidas": caracteristicas.mascotas_permitidas if caracteristicas else False
+                "mascotas_permitidas": caracteristicas.mascotas_permitidas if caracteristicas else False,
+                # Popularidad (incluye vistas aún no volcadas a la BD)
+                "vistas": contador_vistas.total_vistas(inmueble),
+                # Imágenes
+                "portada": inmueble.url_portada
             }
+            if "imagenes" in incluir:
+                inmueble_data["imagenes"] = _serializar_imagenes(inmueble)
             inmuebles_con_caracteristicas.append(inmueble_data)
         
         return inmuebles_con_caracteristicas
@@ -263,33 +317,45 @@ async def listar_inmuebles(tipo_inmueble: Optional[str] = None, db: AsyncSession
 
 # GET: Ver detalle de inmueble
 @router.get("/{id_inmueble}", response_model=InmuebleOut)
-async def detalle_inmueble(id_inmueble: int, db: AsyncSession = Depends(obtener_sesion)):
+async def detalle_inmueble(
+    id_inmueble: int,
+    include: Optional[str] = Query(None, description=INCLUDE_DESCRIPCION),
+    db: AsyncSession = Depends(obtener_sesion)
+):
     """
     Obtener los detalles completos de un inmueble específico.
     
     Incluye toda la información del inmueble y sus características.
+    Con **include=imagenes** también devuelve sus imágenes.
+    Cada consulta cuenta como una vista (se persiste en lote, no por petición).
     """
     try:
-        # Buscar el inmueble
-        result = await db.execute(
-            select(Inmueble).where(Inmueble.id_inmueble == id_inmueble)
+        from sqlalchemy.orm import joinedload, selectinload
+        
+        incluir = _parsear_include(include)
+        
+        # Buscar el inmueble junto con sus características y estadísticas
+        stmt = (
+            select(Inmueble)
+            .options(joinedload(Inmueble.caracteristicas), joinedload(Inmueble.estadisticas))
+            .where(Inmueble.id_inmueble == id_inmueble)
         )
+        if "imagenes" in incluir:
+            stmt = stmt.options(selectinload(Inmueble.imagenes))
+        result = await db.execute(stmt)
         inmueble = result.scalars().first()
         
         if not inmueble:
             raise HTTPException(status_code=404, detail=INMUEBLE_NO_ENCONTRADO)
         
-        # Buscar las características del inmueble de forma asíncrona
-        result_caracteristicas = await db.execute(
-            select(CaracteristicasInmueble).where(CaracteristicasInmueble.id_inmueble == id_inmueble)
-        )
-        caracteristicas = result_caracteristicas.scalars().first()
+        caracteristicas = inmueble.caracteristicas
+        contador_vistas.registrar_vista(id_inmueble)
         
         # Calcular precio final con comisión
         COMISION_UBIKHA = 0.10
         precio_final = inmueble.precio_mensual * (1 + COMISION_UBIKHA)
         
-        return {
+        inmueble_data = {
             "id_inmueble": inmueble.id_inmueble,
             "id_propietario": inmueble.id_propietario,
             "titulo": inmueble.titulo,
@@ -313,8 +379,16 @@ async def detalle_inmueble(id_inmueble: int, db: AsyncSession = Depends(obtener_
             "aire_acondicionado": caracteristicas.aire_acondicionado if caracteristicas else False,
             "servicio_lavanderia": caracteristicas.servicio_lavanderia if caracteristicas else False,
             "camaras_seguridad": caracteristicas.camaras_seguridad if caracteristicas else False,
-            "mascotas_permitidas": caracteristicas.mascotas_permitidas if caracteristicas else False
+            "mascotas_permitidas": caracteristicas.mascotas_permitidas if caracteristicas else False,
+            # Popularidad
+            "vistas": contador_vistas.total_vistas(inmueble),
+            # Imágenes
+            "portada": inmueble.url_portada
         }
+        if "imagenes" in incluir:
+            inmueble_data["imagenes"] = _serializar_imagenes(inmueble)
+        
+        return inmueble_data
         
     except HTTPException:
         raise  # Re-lanzar HTTPExceptions sin modificar
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from models.mensaje import Mensaje
+from models.usuario import Usuario
 from db.database import obtener_sesion
-from typing import List
-from schemas.mensaje import MensajeCreate, MensajeOut
+from typing import List, Optional
+from schemas.mensaje import MensajeCreate, MensajeOut, ConversacionOut, LeidosOut
+from services.mensaje import bandeja, historial, marcar_leidos, publicar_mensaje, guardar_mensaje, cambiar_estado, contar_no_leidos
+from services.pubsub import bus_eventos, canal_usuario
+from utils.security.jwt import obtener_usuario_actual, obtener_usuario_lectura, obtener_usuario_token
 
 router = APIRouter(prefix="/mensajes", tags=["mensajes"])
 
@@ -18,36 +23,122 @@ async def listar_conversaciones(id_usuario: int = Query(...), db: AsyncSession =
     mensajes = result.scalars().all()
     return mensajes
 
-# GET: Obtener mensajes entre dos usuarios
+# GET: Bandeja de entrada (una fila por conversación)
+@router.get("/bandeja", response_model=List[ConversacionOut])
+async def obtener_bandeja(
+    antes: Optional[int] = Query(None, description="id_mensaje del último mensaje de la página anterior"),
+    limite: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
+):
+    """
+    Conversaciones del usuario autenticado con el último mensaje y los no
+    leídos, de la más reciente a la más antigua.
+
+    Para la siguiente página, pasar en antes el ultimo_mensaje.id_mensaje
+    de la última conversación recibida.
+    """
+    return await bandeja(db, usuario_actual.id_usuario, antes, limite)
+
+# GET: Total de mensajes no leídos (badge)
+@router.get("/no-leidos/count")
+async def contar_mensajes_no_leidos(
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
+):
+    # Contador mantenido en cada cambio (O(1)); ver services/contadores_no_leidos.py
+    return {"count": await contar_no_leidos(db, usuario_actual.id_usuario)}
+
+# GET: Obtener mensajes entre dos usuarios (paginado hacia atrás)
 @router.get("/{otro_usuario}", response_model=List[MensajeOut])
 async def obtener_mensajes(
     otro_usuario: int,
+    response: Response,
     id_usuario: int = Query(...),
+    antes: Optional[int] = Query(None, description="id_mensaje del mensaje más antiguo ya cargado"),
+    limite: int = Query(50, ge=1, le=200),
     db: AsyncSession = Depends(obtener_sesion)
 ):
-    stmt = select(Mensaje).where(
-        ((Mensaje.id_remitente == id_usuario) & (Mensaje.id_destinatario == otro_usuario)) |
-        ((Mensaje.id_remitente == otro_usuario) & (Mensaje.id_destinatario == id_usuario))
-    ).order_by(Mensaje.fecha_envio)
-    result = await db.execute(stmt)
-    mensajes = result.scalars().all()
+    """
+    Últimos mensajes de la conversación en orden cronológico.
+
+    Si hay mensajes más antiguos, la cabecera X-Cursor-Antes trae el valor
+    de antes para pedir la página anterior.
+    """
+    mensajes, hay_mas = await historial(db, id_usuario, otro_usuario, antes, limite)
+    if hay_mas:
+        response.headers["X-Cursor-Antes"] = str(mensajes[0].id_mensaje)
     return mensajes
 
 # POST: Enviar nuevo mensaje
 @router.post("/", response_model=MensajeOut)
 async def enviar_mensaje(mensaje_data: MensajeCreate, db: AsyncSession = Depends(obtener_sesion)):
-    nuevo_mensaje = Mensaje(**mensaje_data.dict())
-    db.add(nuevo_mensaje)
-    await db.commit()
-    await db.refresh(nuevo_mensaje)
+    nuevo_mensaje = await guardar_mensaje(db, Mensaje(**mensaje_data.dict()))
+    await publicar_mensaje(nuevo_mensaje)
     return nuevo_mensaje
 
+# WebSocket: mensajes nuevos en tiempo real
+@router.websocket("/ws")
+async def mensajes_en_vivo(websocket: WebSocket, token: str = Query(...)):
+    """
+    Empuja {"tipo": "mensaje", "mensaje": {...}} por cada mensaje enviado o
+    recibido por el usuario del token (JWT de acceso en ?token=) y
+    {"tipo": "leidos", ...} cuando una conversación se marca como leída.
+
+    Al reconectar, el cliente recupera lo perdido con GET /mensajes/bandeja.
+    Con un token no válido se rechaza el handshake (HTTP 403); si el cliente
+    no consume los eventos a tiempo se cierra con 1013.
+    """
+    # Validación sin estado: una conexión abierta no consulta la tabla usuarios
+    try:
+        usuario = await obtener_usuario_token(token)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    suscripcion = bus_eventos.suscribir(canal_usuario(usuario.id_usuario))
+
+    async def escuchar():
+        # El cliente no envía datos; recibir solo detecta la desconexión
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            suscripcion.cerrar()
+
+    escucha = asyncio.create_task(escuchar())
+    try:
+        while (evento := await suscripcion.recibir()) is not None:
+            await websocket.send_json(evento)
+        if suscripcion.desbordada:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        bus_eventos.cancelar(suscripcion)
+        escucha.cancel()
+
+# PUT: Marcar como leída una conversación hasta un mensaje
+@router.put("/{otro_usuario}/leidos", response_model=LeidosOut)
+async def marcar_conversacion_leida(
+    otro_usuario: int,
+    hasta: Optional[int] = Query(None, description="id_mensaje del último mensaje visto (incluido); sin valor, todos"),
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+):
+    """
+    Marca como leídos los mensajes que el usuario autenticado recibió de
+    otro_usuario con un solo UPDATE y devuelve los no leídos que quedan en la
+    conversación y en total.
+    """
+    return await marcar_leidos(db, usuario_actual.id_usuario, otro_usuario, hasta)
+
 # PUT: Marcar como leído
 @router.put("/{id}/estado", response_model=dict)
 async def marcar_leido(id: int, estado: str = Query(...), db: AsyncSession = Depends(obtener_sesion)):
     mensaje = await db.get(Mensaje, id)
     if not mensaje:
         raise HTTPException(status_code=404, detail="Mensaje no encontrado")
-    mensaje.estado_mensaje = estado
-    await db.commit()
+    await cambiar_estado(db, id, estado)
     return {"message": f"Estado del mensaje cambiado a '{estado}'"}
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends
+from models.usuario import Usuario
+from utils.security.jwt import require_roles
+from services.contador_vistas import contador_vistas
+from utils.security.seguridad import metricas_bcrypt
+from utils.security.cache_usuarios import cache_usuarios
+from utils.security.cache_tokens import cache_tokens
+from utils.security.versiones_token import versiones_token
+from utils.security import refresh_tokens
+from utils.security.throttling import limitador_login
+from utils.security.codigos_verificacion import almacen_codigos
+from services.whatsapp import metricas_http_whatsapp, monitor_whatsapp
+from services.cola_whatsapp import cola_whatsapp
+from services.difusion import difusor
+from services.pubsub import bus_eventos
+from services.contadores_no_leidos import contadores_no_leidos
+
+router = APIRouter(prefix="/metricas", tags=["Métricas"])
+
+# GET /metricas/ - Métricas internas del proceso (por worker, solo administradores)
+@router.get("/")
+async def obtener_metricas(usuario_actual: Usuario = Depends(require_roles("admin", lectura=True))):
+    """
+    Métricas en memoria de este proceso: pool de bcrypt, contadores de vistas, etc.
+    Con varios workers de uvicorn cada uno reporta solo sus propios valores
+    (salvo la profundidad de la cola WhatsApp, que se lee de la tabla compartida).
+    """
+    return {
+        "bcrypt": metricas_bcrypt.snapshot(),
+        "cache_usuarios": cache_usuarios.metricas(),
+        "cache_tokens": cache_tokens.metricas(),
+        "versiones_token": versiones_token.metricas(),
+        "refresh_tokens": refresh_tokens.metricas(),
+        "throttling_login": limitador_login.metricas(),
+        "codigos_verificacion": almacen_codigos.metricas(),
+        "vistas_inmuebles": contador_vistas.metricas(),
+        "whatsapp_http": metricas_http_whatsapp.snapshot(),
+        "whatsapp_estado": monitor_whatsapp.metricas(),
+        "difusiones": difusor.metricas(),
+        "eventos": bus_eventos.metricas(),
+        "contadores_no_leidos": contadores_no_leidos.metricas(),
+        "cola_whatsapp": {**cola_whatsapp.metricas(), "profundidad": await cola_whatsapp.profundidad()}
+    }
@@ -1,20 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
 from db.database import obtener_sesion
 from models.notificacion import Notificacion
 from models.usuario import Usuario
-from schemas.notificacion import NotificacionOut, NotificacionUpdate
-from utils.security.jwt import obtener_usuario_actual
+from schemas.notificacion import NotificacionOut, NotificacionUpdate, NotificacionCrear
+from services.notificacion import (
+    flujo_notificaciones, crear_notificacion, marcar_notificacion, contar_no_leidas as contar_no_leidas_usuario
+)
+from utils.security.jwt import obtener_usuario_actual, obtener_usuario_lectura, obtener_usuario_token, require_roles
+from utils.security.error_messages import AuthErrorMessages
 
 router = APIRouter(prefix="/notificaciones", tags=["Notificaciones"])
 
+# El token puede llegar en la cabecera o, para EventSource (sin cabeceras), en ?token=
+oauth2_opcional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
+
 # GET /notificaciones/ - Ver notificaciones del usuario
 @router.get("/", response_model=List[NotificacionOut])
 async def ver_notificaciones(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     result = await db.execute(
         select(Notificacion)
@@ -25,6 +34,18 @@ async def ver_notificaciones(
     
     return notificaciones
 
+# POST /notificaciones/ - Enviar una notificación a un usuario (solo administradores)
+@router.post("/", response_model=NotificacionOut, status_code=status.HTTP_201_CREATED)
+async def enviar_notificacion(
+    datos: NotificacionCrear,
+    db: AsyncSession = Depends(obtener_sesion),
+    usuario_actual: Usuario = Depends(require_roles("admin"))
+):
+    """Guarda la notificación, suma al contador de no leídas y la empuja por /notificaciones/stream"""
+    if await db.get(Usuario, datos.id_usuario) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
+    return await crear_notificacion(db, datos.id_usuario, datos.mensaje)
+
 # PUT /notificaciones/{id} - Marcar como leída
 @router.put("/{id_notificacion}", response_model=NotificacionOut)
 async def marcar_como_leida(
@@ -33,14 +54,10 @@ async def marcar_como_leida(
     db: AsyncSession = Depends(obtener_sesion),
     usuario_actual: Usuario = Depends(obtener_usuario_actual)
 ):
-    # Verificar que la notificación existe y pertenece al usuario
-    result = await db.execute(
-        select(Notificacion).where(
-            Notificacion.id_notificacion == id_notificacion,
-            Notificacion.id_usuario == usuario_actual.id_usuario
-        )
+    # Solo notificaciones del propio usuario; el contador se ajusta si cambia entre leída y no leída
+    notificacion = await marcar_notificacion(
+        db, id_notificacion, usuario_actual.id_usuario, notificacion_data.estado_notificacion.value
     )
-    notificacion = result.scalar_one_or_none()
     
     if not notificacion:
         raise HTTPException(
@@ -48,25 +65,48 @@ async def marcar_como_leida(
             detail="Notificación no encontrada"
         )
     
-    notificacion.estado_notificacion = notificacion_data.estado_notificacion.value
-    await db.commit()
-    await db.refresh(notificacion)
-    
     return notificacion
 
+# GET /notificaciones/stream - Notificaciones en tiempo real (Server-Sent Events)
+@router.get("/stream")
+async def stream_notificaciones(
+    token: Optional[str] = Query(None, description="JWT de acceso, para EventSource"),
+    token_cabecera: Optional[str] = Depends(oauth2_opcional),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Flujo text/event-stream con las notificaciones nuevas (event: notificacion,
+    id = id_notificacion) y el conteo de no leídas (event: no_leidas).
+
+    Reemplaza el sondeo de GET /notificaciones/ y /no-leidas/count. Al
+    reconectar, EventSource envía Last-Event-ID y se reenvían las
+    notificaciones perdidas.
+    """
+    credencial = token_cabecera or token
+    if not credencial:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.TOKEN_INVALID,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Validación sin estado: la conexión no consulta la tabla usuarios
+    usuario = await obtener_usuario_token(credencial)
+    ultimo_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    return StreamingResponse(
+        flujo_notificaciones(usuario.id_usuario, ultimo_id),
+        media_type="text/event-stream",
+        # Sin caché ni buffering en proxies (nginx) para que cada evento salga al momento
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # GET /notificaciones/no-leidas - Contar notificaciones no leídas
 @router.get("/no-leidas/count")
 async def contar_no_leidas(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
-    result = await db.execute(
-        select(Notificacion)
-        .where(
-            Notificacion.id_usuario == usuario_actual.id_usuario,
-            Notificacion.estado_notificacion == "no_leida"
-        )
-    )
-    count = len(result.scalars().all())
+    # Contador mantenido en cada cambio (O(1)); ver services/contadores_no_leidos.py
+    count = await contar_no_leidas_usuario(db, usuario_actual.id_usuario)
     
     return {"count": count}
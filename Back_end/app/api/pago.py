@@ -6,7 +6,7 @@ from db.database import obtener_sesion
 from models.reserva import Pago, Reserva
 from models.usuario import Usuario
 from schemas.reserva import PagoCreate, PagoOut, PagoUpdate
-from utils.security.jwt import obtener_usuario_actual
+from utils.security.jwt import obtener_usuario_actual, obtener_usuario_lectura
 
 router = APIRouter(prefix="/pagos", tags=["Pagos"])
 
@@ -51,7 +51,7 @@ async def registrar_pago(
 async def listar_pagos_reserva(
     id_reserva: int,
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     # Verificar que la reserva pertenece al usuario
     result = await db.execute(
@@ -12,7 +12,7 @@ from schemas.reporte import (
     ReporteCreate, ReporteCreateCompleto, ReporteCreateResponse,
     ReporteOut, ReporteUpdate, TipoReporteEnum
 )
-from utils.security.jwt import obtener_usuario_actual
+from utils.security.jwt import obtener_usuario_actual, obtener_usuario_lectura, require_roles
 
 router = APIRouter(prefix="/reportes", tags=["Reportes"])
 
@@ -186,15 +186,8 @@ async def enviar_reporte_legacy(
 @router.get("/", response_model=List[ReporteOut])
 async def listar_reportes(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(require_roles("admin"))
 ):
-    # Verificar que el usuario es administrador
-    if usuario_actual.tipo_usuario != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden ver todos los reportes"
-        )
-    
     result = await db.execute(
         select(Reporte).order_by(Reporte.fecha_reporte.desc())
     )
@@ -208,15 +201,8 @@ async def cambiar_estado_reporte(
     id_reporte: int,
     reporte_data: ReporteUpdate,
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(require_roles("admin"))
 ):
-    # Verificar que el usuario es administrador
-    if usuario_actual.tipo_usuario != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden cambiar el estado de los reportes"
-        )
-    
     # Verificar que el reporte existe
     result = await db.execute(
         select(Reporte).where(Reporte.id_reporte == id_reporte)
@@ -244,7 +230,7 @@ async def cambiar_estado_reporte(
 @router.get("/mis-reportes", response_model=List[ReporteOut])
 async def ver_mis_reportes(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     result = await db.execute(
         select(Reporte).where(Reporte.id_usuario == usuario_actual.id_usuario)
@@ -260,19 +246,12 @@ async def ver_mis_reportes(
 @router.get("/admin/pendientes", response_model=List[ReporteOut])
 async def ver_reportes_pendientes_admin(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(require_roles("admin"))
 ):
     """
     Ver todos los reportes pendientes de revisión.
     Solo accesible para administradores.
     """
-    # Verificar que el usuario sea administrador
-    if usuario_actual.tipo_usuario != "administrador":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permisos para acceder a esta información"
-        )
-    
     # Obtener reportes pendientes con información del inmueble y usuario
     result = await db.execute(
         select(Reporte)
@@ -305,19 +284,12 @@ async def ver_reportes_pendientes_admin(
 async def ver_todos_reportes_admin(
     estado: str = None,
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(require_roles("admin"))
 ):
     """
     Ver todos los reportes, opcionalmente filtrados por estado.
     Solo accesible para administradores.
     """
-    # Verificar que el usuario sea administrador
-    if usuario_actual.tipo_usuario != "administrador":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permisos para acceder a esta información"
-        )
-    
     # Construir query con filtro opcional
     query = select(Reporte).options(joinedload(Reporte.inmueble), joinedload(Reporte.usuario))
     
@@ -353,19 +325,12 @@ async def resolver_reporte_admin(
     id_reporte: int,
     reporte_update: ReporteUpdate,
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(require_roles("admin"))
 ):
     """
     Resolver un reporte marcándolo como resuelto, rechazado, etc.
     Solo accesible para administradores.
     """
-    # Verificar que el usuario sea administrador
-    if usuario_actual.tipo_usuario != "administrador":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permisos para realizar esta acción"
-        )
-    
     # Buscar el reporte
     result = await db.execute(
         select(Reporte).where(Reporte.id_reporte == id_reporte)
@@ -398,18 +363,11 @@ async def resolver_reporte_admin(
 @router.get("/admin/estadisticas")
 async def obtener_estadisticas_reportes(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(require_roles("admin"))
 ):
     """
     Obtener estadísticas de reportes para el panel administrativo.
     """
-    # Verificar que el usuario sea administrador
-    if usuario_actual.tipo_usuario != "administrador":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="No tienes permisos para acceder a esta información"
-        )
-    
     # Contar reportes por estado
     from sqlalchemy import func
     
@@ -7,7 +7,7 @@ from models.resena import Resena
 from models.inmueble import Inmueble
 from models.usuario import Usuario
 from schemas.resena import ResenaCreate, ResenaOut, ResenaUpdate
-from utils.security.jwt import obtener_usuario_actual
+from utils.security.jwt import obtener_usuario_actual, obtener_usuario_lectura
 
 router = APIRouter(prefix="/resenas", tags=["Reseñas"])
 
@@ -70,7 +70,7 @@ async def crear_resena(
 @router.get("/mis-resenas", response_model=List[ResenaOut])
 async def ver_mis_resenas(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     result = await db.execute(
         select(Resena).where(Resena.id_usuario == usuario_actual.id_usuario)
@@ -6,7 +6,7 @@ from db.database import obtener_sesion
 from models.reserva import Reserva
 from models.usuario import Usuario
 from schemas.reserva import ReservaCreate, ReservaOut, ReservaUpdate, ListaReservasResponse
-from utils.security.jwt import obtener_usuario_actual
+from utils.security.jwt import obtener_usuario_actual, obtener_usuario_lectura
 
 router = APIRouter(prefix="/reservas", tags=["Reservas"])
 
@@ -34,7 +34,7 @@ async def crear_reserva(
 @router.get("/", response_model=ListaReservasResponse)
 async def listar_reservas_usuario(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     """
     Lista todas las reservas del usuario autenticado.
@@ -85,7 +85,7 @@ async def listar_reservas_usuario(
 @router.get("/simple", response_model=List[ReservaOut])
 async def listar_reservas_simple(
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     """
     Lista reservas en formato simple (solo array).
@@ -102,7 +102,7 @@ async def listar_reservas_simple(
 async def obtener_detalle_reserva(
     id_reserva: int,
     db: AsyncSession = Depends(obtener_sesion),
-    usuario_actual: Usuario = Depends(obtener_usuario_actual)
+    usuario_actual: Usuario = Depends(obtener_usuario_lectura)
 ):
     result = await db.execute(
         select(Reserva).where(
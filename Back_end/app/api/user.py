@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import delete
@@ -13,8 +13,12 @@ from models.favorito import Favorito
 from models.mensaje import Mensaje
 from models.notificacion import Notificacion
 from schemas.user import UsuarioCrear, UsuarioMostrar
-from utils.security.seguridad import hashear_password
+from utils.security.seguridad import hashear_password_async
 from schemas.user import UsuarioEstado
+from utils.security.cache_usuarios import invalidar_usuario
+from utils.security.versiones_token import versiones_token, revocar_tokens_usuario
+from services.user import listar_arrendadores
+from services.contadores_no_leidos import contadores_no_leidos
 import traceback
 
 # Constantes
@@ -28,6 +32,14 @@ async def listar_usuarios(db: AsyncSession = Depends(obtener_sesion)):
     resultado = await db.execute(select(User))
     return resultado.scalars().all()
 
+@router.get("/arrendadores", response_model=list[UsuarioMostrar])
+async def listar_usuarios_arrendadores(
+    limite: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(obtener_sesion)
+):
+    return await listar_arrendadores(db, limite, offset)
+
 @router.get("/{email}", response_model=UsuarioMostrar)
 async def obtener_usuario(email: str, db: AsyncSession = Depends(obtener_sesion)):
     resultado = await db.execute(select(User).where(User.email == email))
@@ -45,7 +57,7 @@ async def crear_usuario(datos: UsuarioCrear, db: AsyncSession = Depends(obtener_
         num_celular=datos.num_celular,
         fecha_nacimiento=datos.fecha_nacimiento,
         email=datos.email,
-        password=hashear_password(datos.password),
+        password=await hashear_password_async(datos.password),
     )
     db.add(nuevo_usuario)
     await db.commit()
@@ -62,7 +74,12 @@ async def cambiar_estado_usuario(email: str, datos: UsuarioEstado, db: AsyncSess
     if not usuario:
         raise HTTPException(status_code=404, detail=USUARIO_NO_ENCONTRADO)
     usuario.activo = datos.activo
+    # Al desactivar la cuenta se revocan todos sus tokens
+    nueva_version = revocar_tokens_usuario(usuario) if not datos.activo else None
     await db.commit()
+    invalidar_usuario(usuario.id_usuario)
+    if nueva_version is not None:
+        versiones_token.registrar(usuario.id_usuario, nueva_version)
     await db.refresh(usuario)
     return usuario
 
@@ -109,7 +126,9 @@ async def eliminar_usuario(email: str, db: AsyncSession = Depends(obtener_sesion
             "inmuebles": 0
         }
         
-        # 1. PRIMERO: Eliminar mensajes (enviados y recibidos por el usuario)
+        # 1. PRIMERO: Eliminar mensajes (enviados y recibidos por el usuario),
+        # descontando antes sus no leídos de los contadores de los destinatarios
+        await contadores_no_leidos.descontar_mensajes_de(db, user_id)
         result = await db.execute(delete(Mensaje).where(Mensaje.id_remitente == user_id))
         eliminados["mensajes"] += result.rowcount
         
@@ -170,6 +189,7 @@ async def eliminar_usuario(email: str, db: AsyncSession = Depends(obtener_sesion
         # 10. FINALMENTE: Eliminar el usuario
         await db.delete(usuario)
         await db.commit()
+        invalidar_usuario(user_id)
         
         return {
             "mensaje": f"Usuario '{email}' eliminado correctamente",
@@ -1,9 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from schemas.verification import PhoneVerification, CodeVerification
-from services.whatsapp import WhatsAppService
+from services.whatsapp import whatsapp_service
 
 router = APIRouter(prefix="/verification", tags=["verification"])
-whatsapp_service = WhatsAppService()
 
 @router.post("/send-code")
 async def send_verification_code(phone: PhoneVerification):
@@ -14,6 +13,6 @@ async def send_verification_code(phone: PhoneVerification):
 
 @router.post("/verify-code")
 async def verify_code(verification: CodeVerification):
-    if whatsapp_service.verify_code(verification.phone_number, verification.code):
+    if await whatsapp_service.verify_code(verification.phone_number, verification.code):
         return {"verified": True}
     raise HTTPException(status_code=400, detail="Invalid verification code")
@@ -7,12 +7,16 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from db.database import obtener_sesion
-from services.whatsapp import WhatsAppService
-from services.user import buscar_usuario_por_email, buscar_usuario_por_telefono, crear_usuario
+from services.whatsapp import whatsapp_service, monitor_whatsapp
+from services.cola_whatsapp import cola_whatsapp
+from services.user import buscar_usuario_por_telefono, registrar_usuario, UsuarioDuplicado
 from schemas.verification import PhoneVerification, CodeVerification, VerificationResponse
 from schemas.user import RegistroUsuario, UsuarioMostrar, RegistroCompletarWhatsApp
-from utils.security.seguridad import hashear_password
-from utils.security.jwt import crear_token
+from utils.security.seguridad import hashear_password_async
+from utils.security.jwt import crear_token, claims_usuario, EXPIRACION_MINUTOS
+from utils.security.refresh_tokens import emitir_refresh_token
+from utils.security.error_messages import AuthErrorMessages
+from datetime import datetime, timedelta
 import logging
 
 # Configurar logging
@@ -21,15 +25,13 @@ logger = logging.getLogger(__name__)
 # Router para WhatsApp Auth
 router = APIRouter(prefix="/whatsapp-auth", tags=["WhatsApp Authentication"])
 
-# Instancia del servicio WhatsApp
-whatsapp_service = WhatsAppService()
-
 @router.get("/service/status")
 async def verificar_estado_whatsapp():
     """
     🔍 Verificar estado del servicio WhatsApp
     
     Endpoint para verificar si el microservicio de WhatsApp está disponible
+    (estado del último sondeo en segundo plano y del circuit breaker)
     """
     try:
         is_connected = await whatsapp_service.check_whatsapp_service_status()
@@ -80,7 +82,7 @@ async def enviar_codigo_registro(
                 detail="Este número de teléfono ya está registrado. Usa el login en su lugar."
             )
         
-        # Verificar estado del servicio WhatsApp
+        # Verificar estado del servicio WhatsApp (cacheado por el monitor: si está caído se responde al instante)
         service_available = await whatsapp_service.check_whatsapp_service_status()
         if not service_available:
             raise HTTPException(
@@ -88,21 +90,24 @@ async def enviar_codigo_registro(
                 detail="El servicio de WhatsApp no está disponible en este momento"
             )
         
-        # Enviar código de verificación
-        success = await whatsapp_service.send_verification_code(phone_data.phone_number)
+        # Generar el código y encolar su envío: el worker lo entrega en segundo plano
+        code = await whatsapp_service.generate_code(phone_data.phone_number)
+        cola_whatsapp.encolar(
+            db,
+            phone_data.phone_number,
+            whatsapp_service.build_verification_message(code),
+            tipo="otp",
+            expira_en=datetime.now() + timedelta(minutes=5)
+        )
+        await db.commit()
+        cola_whatsapp.notificar()
         
-        if success:
-            logger.info(f"Código de registro enviado a {phone_data.phone_number}")
-            return VerificationResponse(
-                success=True,
-                message="Código de verificación enviado exitosamente",
-                data={"telefono": phone_data.phone_number}  # Solo 9 dígitos
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al enviar el código de verificación"
-            )
+        logger.info(f"Código de registro encolado para {phone_data.phone_number}")
+        return VerificationResponse(
+            success=True,
+            message="Código de verificación enviado exitosamente",
+            data={"telefono": phone_data.phone_number}  # Solo 9 dígitos
+        )
             
     except HTTPException:
         raise
@@ -193,28 +198,12 @@ async def completar_registro(
             )
         
         # Verificar que el teléfono haya sido verificado previamente
-        if not whatsapp_service.is_phone_verified(numero_limpio):
+        if not await whatsapp_service.is_phone_verified(numero_limpio):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Este número de teléfono no ha sido verificado. Complete primero el proceso de verificación por WhatsApp."
             )
         
-        # Verificar que el email no esté ya registrado
-        usuario_email_existente = await buscar_usuario_por_email(db, datos_registro.email)
-        if usuario_email_existente:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Este email ya está registrado"
-            )
-        
-        # Verificar que el teléfono no esté ya registrado
-        usuario_telefono_existente = await buscar_usuario_por_telefono(db, numero_limpio)
-        if usuario_telefono_existente:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Este número de teléfono ya está registrado"
-            )
-        
         # Preparar datos para crear el usuario
         datos_usuario = {
             'email': datos_registro.email,
@@ -223,30 +212,32 @@ async def completar_registro(
             'apellido_materno': datos_registro.apellido_materno,
             'num_celular': numero_limpio,
             'fecha_nacimiento': datos_registro.fecha_nacimiento,
-            'password': hashear_password(datos_registro.password),
+            'password': await hashear_password_async(datos_registro.password),
             'celular_verificado': True,  # Marcar como verificado (este campo SÍ existe)
             'tipo_usuario': 'arrendatario'  # Siempre inicia como arrendatario
         }
         
-        # Crear el usuario
-        nuevo_usuario = await crear_usuario(db, datos_usuario)
+        # Crear el usuario: un solo INSERT ... RETURNING, los duplicados los detectan
+        # las restricciones únicas (UsuarioDuplicado)
+        nuevo_usuario = await registrar_usuario(db, datos_usuario)
         
-        # Crear token de acceso
-        token = crear_token({
-            "sub": numero_limpio,
-            "id": nuevo_usuario.id_usuario,
-            "rol": nuevo_usuario.tipo_usuario
-        })
+        # Crear token de acceso (usuario y refresh token se confirman en un solo commit)
+        token = crear_token(claims_usuario(nuevo_usuario))
+        refresh_token, _ = emitir_refresh_token(db, nuevo_usuario)
         
-        # Enviar mensaje de bienvenida por WhatsApp
-        try:
-            await whatsapp_service.send_welcome_message(numero_limpio, datos_registro.nombres)
-        except Exception as e:
-            logger.warning(f"Error al enviar mensaje de bienvenida: {e}")
-            # No fallar el registro si no se puede enviar el mensaje de bienvenida
+        # Mensaje de bienvenida: se encola en la misma transacción que el usuario
+        # y lo envía un worker; un fallo de WhatsApp ya no afecta al registro
+        cola_whatsapp.encolar(
+            db,
+            numero_limpio,
+            whatsapp_service.build_welcome_message(datos_registro.nombres),
+            tipo="bienvenida"
+        )
+        await db.commit()
+        cola_whatsapp.notificar()
         
         # Limpiar la verificación completada
-        whatsapp_service.remove_verified_phone(numero_limpio)
+        await whatsapp_service.remove_verified_phone(numero_limpio)
         
         logger.info(f"Usuario registrado exitosamente: {nuevo_usuario.id_usuario}")
         
@@ -263,26 +254,22 @@ async def completar_registro(
                 "celular_verificado": nuevo_usuario.celular_verificado  # Usar el campo que SÍ existe
             },
             "access_token": token,
-            "token_type": "bearer"
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+            "expires_in": EXPIRACION_MINUTOS * 60
         }
         
-    except IntegrityError as e:
+    except UsuarioDuplicado as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=AuthErrorMessages.EMAIL_ALREADY_EXISTS if e.campo == "email" else AuthErrorMessages.PHONE_ALREADY_EXISTS
+        )
+    except IntegrityError:
         await db.rollback()
-        if "usuarios_email_key" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Este email ya está registrado"
-            )
-        elif "usuarios_num_celular_key" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Este número de teléfono ya está registrado"
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error de integridad en la base de datos"
-            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error de integridad en la base de datos"
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -308,15 +295,16 @@ async def obtener_estadisticas_verificacion():
     """
     try:
         # Limpiar códigos expirados
-        expired_count = whatsapp_service.clean_expired_codes()
+        expired_count = await whatsapp_service.clean_expired_codes()
         
         # Obtener estadísticas
-        pending_count = whatsapp_service.get_pending_verifications_count()
+        pending_count = await whatsapp_service.get_pending_verifications_count()
         
         return {
             "pending_verifications": pending_count,
             "expired_codes_cleaned": expired_count,
-            "service_status": await whatsapp_service.check_whatsapp_service_status()
+            "service_status": await whatsapp_service.check_whatsapp_service_status(),
+            "monitor": monitor_whatsapp.metricas()
         }
         
     except Exception as e:
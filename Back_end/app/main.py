@@ -1,11 +1,24 @@
 from fastapi import FastAPI
 from api import auth, base, user as user_router, favorito, inmueble
-from api import mensaje, reserva, pago, imagen, resena, notificacion, reporte, whatsapp_auth
+from api import mensaje, reserva, pago, imagen, resena, notificacion, reporte, whatsapp_auth, metricas, difusion
 from utils.security import cors
-from utils.exceptions.error_handlers import global_exception_handler, database_exception_handler
+from utils.exceptions.error_handlers import global_exception_handler, database_exception_handler, servicio_saturado_handler
+from utils.exceptions.error_handlers import login_bloqueado_handler
+from utils.security.seguridad import BcryptSaturado, cerrar_executor_bcrypt
+from utils.security.throttling import LoginBloqueado
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 from utils.Command.red import imprimir_info_servidor
+from services.contador_vistas import contador_vistas
+from services.migracion_passwords import migracion_passwords
+from services.whatsapp import iniciar_cliente_whatsapp, cerrar_cliente_whatsapp, monitor_whatsapp
+from services.cola_whatsapp import cola_whatsapp
+from services.difusion import difusor
+from services.pubsub import bus_eventos
+from services.contadores_no_leidos import contadores_no_leidos
+from utils.security.versiones_token import versiones_token
+from utils.security.refresh_tokens import cargar_revocados
+from utils.security.codigos_verificacion import almacen_codigos
 import uvicorn
 import os
 
@@ -23,6 +36,8 @@ app = FastAPI(
 # Aplicar manejadores de errores globales
 app.add_exception_handler(Exception, global_exception_handler)
 app.add_exception_handler(SQLAlchemyError, database_exception_handler)
+app.add_exception_handler(BcryptSaturado, servicio_saturado_handler)
+app.add_exception_handler(LoginBloqueado, login_bloqueado_handler)
 
 #aplicar el cors
 cors.aplicar_cors(app)
@@ -43,6 +58,43 @@ app.include_router(notificacion.router)
 app.include_router(reporte.router)
 # WhatsApp Authentication Router
 app.include_router(whatsapp_auth.router)
+# Difusiones masivas por WhatsApp
+app.include_router(difusion.router)
+# Métricas internas
+app.include_router(metricas.router)
+
+# Tareas de fondo
+@app.on_event("startup")
+async def iniciar_tareas_de_fondo():
+    contador_vistas.iniciar()
+    versiones_token.iniciar()
+    await cargar_revocados()
+    await almacen_codigos.iniciar()
+    await iniciar_cliente_whatsapp()
+    monitor_whatsapp.iniciar()
+    cola_whatsapp.iniciar()
+    await difusor.reanudar_pendientes()
+    bus_eventos.iniciar()
+    contadores_no_leidos.iniciar()
+
+@app.on_event("shutdown")
+async def detener_tareas_de_fondo():
+    # Volcar las vistas acumuladas antes de apagar
+    await contador_vistas.detener()
+    await versiones_token.detener()
+    await almacen_codigos.detener()
+    # La migración de contraseñas se reanuda desde su checkpoint
+    await migracion_passwords.detener()
+    # Los mensajes pendientes siguen en la tabla cola_whatsapp
+    await cola_whatsapp.detener()
+    # Las difusiones en curso se reanudan al volver a arrancar
+    await difusor.detener()
+    # Cierra las conexiones WebSocket abiertas
+    await bus_eventos.detener()
+    await contadores_no_leidos.detener()
+    await monitor_whatsapp.detener()
+    await cerrar_cliente_whatsapp()
+    cerrar_executor_bcrypt()
 
 if __name__ == "__main__":
     imprimir_info_servidor()
@@ -7,3 +7,8 @@ from .mensaje import Mensaje
 from .notificacion import Notificacion
 from .imagen_inmueble import ImagenInmueble
 from .reporte import Reporte
+from .estadistica_inmueble import EstadisticaInmueble
+from .refresh_token import RefreshToken
+from .mensaje_whatsapp import MensajeWhatsApp
+from .difusion import Difusion, DifusionDestinatario
+from .contador_no_leidos import ContadorNoLeidos
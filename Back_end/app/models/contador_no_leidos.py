@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from db.database import Base
+
+class ContadorNoLeidos(Base):
+    """No leídos por usuario, mantenidos en la misma transacción que los cambios (services/contadores_no_leidos.py)"""
+    __tablename__ = "contadores_no_leidos"
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario", ondelete="CASCADE"), primary_key=True)
+    notificaciones = Column(Integer, nullable=False, default=0, server_default="0")
+    mensajes = Column(Integer, nullable=False, default=0, server_default="0")
+    fecha_actualizacion = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"<ContadorNoLeidos(id_usuario={self.id_usuario}, notificaciones={self.notificaciones}, mensajes={self.mensajes})>"
@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy.sql import func
+from db.database import Base
+
+class Difusion(Base):
+    """Envío masivo de un mensaje de WhatsApp a una audiencia (services/difusion.py)"""
+    __tablename__ = "difusiones"
+    id_difusion = Column(Integer, primary_key=True, index=True)
+    id_creador = Column(Integer, ForeignKey("usuarios.id_usuario", ondelete="SET NULL"), nullable=True)  # NULL si se eliminó el usuario
+    audiencia = Column(String(30), nullable=False)  # favoritos_inmueble, arrendadores, arrendatarios, todos
+    id_inmueble = Column(Integer, ForeignKey("inmuebles.id_inmueble", ondelete="SET NULL"), nullable=True)  # Solo para favoritos_inmueble
+    mensaje = Column(Text, nullable=False)
+    estado = Column(String(20), nullable=False, default="pendiente")  # pendiente, en_curso, completada, cancelada, error
+    total_destinatarios = Column(Integer, nullable=False, default=0)
+    enviados = Column(Integer, nullable=False, default=0)
+    fallidos = Column(Integer, nullable=False, default=0)
+    ultimo_error = Column(String(255), nullable=True)
+    fecha_creacion = Column(DateTime, server_default=func.now())
+    fecha_inicio = Column(DateTime, nullable=True)
+    fecha_fin = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Difusion(id_difusion={self.id_difusion}, audiencia='{self.audiencia}', estado='{self.estado}')>"
+
+class DifusionDestinatario(Base):
+    """Estado de entrega por destinatario; se materializa al iniciar la difusión"""
+    __tablename__ = "difusion_destinatarios"
+    id_difusion = Column(Integer, ForeignKey("difusiones.id_difusion", ondelete="CASCADE"), primary_key=True)
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario", ondelete="CASCADE"), primary_key=True)
+    telefono = Column(String(20), nullable=False)
+    estado = Column(String(20), nullable=False, default="pendiente")  # pendiente, enviado, fallido
+    ultimo_error = Column(String(255), nullable=True)
+    fecha_envio = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Recorrido por lotes de los pendientes y conteos por estado
+        Index("ix_difusion_destinatarios_estado", "id_difusion", "estado", "id_usuario"),
+    )
+
+    def __repr__(self):
+        return f"<DifusionDestinatario(id_difusion={self.id_difusion}, id_usuario={self.id_usuario}, estado='{self.estado}')>"
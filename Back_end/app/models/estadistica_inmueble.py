@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from db.database import Base
+from sqlalchemy.orm import relationship
+
+class EstadisticaInmueble(Base):
+    __tablename__ = "estadisticas_inmueble"
+    id_inmueble = Column(Integer, ForeignKey("inmuebles.id_inmueble", ondelete="CASCADE"), primary_key=True)
+    vistas = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    fecha_actualizacion = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    inmueble = relationship("Inmueble", back_populates="estadisticas")
+
+    def __repr__(self):
+        return f"<EstadisticaInmueble(id_inmueble={self.id_inmueble}, vistas={self.vistas})>"
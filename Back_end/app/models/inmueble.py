@@ -15,14 +15,16 @@ class Inmueble(Base):
     estado = Column(String(20), default="disponible")
     calificacion_promedio = Column(Float, default=0.0)
     total_resenas = Column(Integer, default=0)
+    url_portada = Column(String(255), nullable=True)  # Primera imagen, precalculada para los listados
 
     propietario = relationship("Usuario", back_populates="inmuebles")
     caracteristicas = relationship("CaracteristicasInmueble", back_populates="inmueble", uselist=False)
     reservas = relationship("Reserva", back_populates="inmueble")
     favoritos = relationship("Favorito", back_populates="inmueble")
     resenas = relationship("Resena", back_populates="inmueble")
-    imagenes = relationship("ImagenInmueble", back_populates="inmueble")
+    imagenes = relationship("ImagenInmueble", back_populates="inmueble", order_by="ImagenInmueble.id_imagen")
     reportes = relationship("Reporte", back_populates="inmueble")
+    estadisticas = relationship("EstadisticaInmueble", back_populates="inmueble", uselist=False, passive_deletes=True)
 
     def __repr__(self):
         return f"<Inmueble(id_inmueble={self.id_inmueble}, titulo='{self.titulo}')>"
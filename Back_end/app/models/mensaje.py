@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from db.database import Base
 from sqlalchemy.orm import relationship
 
+ESTADO_LEIDO = "leido"  # Cualquier otro estado_mensaje cuenta como no leído
+
 class Mensaje(Base):
     __tablename__ = "mensajes"
     id_mensaje = Column(Integer, primary_key=True, index=True)
@@ -15,5 +17,20 @@ class Mensaje(Base):
     remitente = relationship("Usuario", foreign_keys=[id_remitente], backref="mensajes_enviados")
     destinatario = relationship("Usuario", foreign_keys=[id_destinatario], backref="mensajes_recibidos")
 
+    __table_args__ = (
+        # Bandeja: mensajes enviados y recibidos por un usuario (BitmapOr de ambos índices)
+        Index("ix_mensajes_remitente", "id_remitente", "id_mensaje"),
+        Index("ix_mensajes_destinatario", "id_destinatario", "id_mensaje"),
+        # Historial de una conversación por páginas: (par de usuarios sin orden, id_mensaje)
+        Index(
+            "ix_mensajes_conversacion",
+            func.least(id_remitente, id_destinatario),
+            func.greatest(id_remitente, id_destinatario),
+            "id_mensaje"
+        ),
+        # Conteo de no leídos por conversación sin leer los mensajes ya leídos
+        Index("ix_mensajes_no_leidos", "id_destinatario", "id_remitente", postgresql_where=text(f"estado_mensaje <> '{ESTADO_LEIDO}'")),
+    )
+
     def __repr__(self):
         return f"<Mensaje(id_mensaje={self.id_mensaje}, remitente={self.id_remitente}, destinatario={self.id_destinatario})>"
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, text
+from sqlalchemy.sql import func
+from db.database import Base
+
+class MensajeWhatsApp(Base):
+    """Mensaje saliente en la cola de WhatsApp (services/cola_whatsapp.py)"""
+    __tablename__ = "cola_whatsapp"
+    id_mensaje = Column(Integer, primary_key=True, index=True)
+    telefono = Column(String(20), nullable=False)
+    mensaje = Column(Text, nullable=False)
+    tipo = Column(String(20), nullable=False)  # otp, bienvenida
+    prioridad = Column(Integer, nullable=False, default=10)  # Menor número = se envía antes
+    estado = Column(String(20), nullable=False, default="pendiente", server_default="pendiente")  # pendiente, enviando, enviado, fallido
+    intentos = Column(Integer, nullable=False, default=0, server_default="0")
+    max_intentos = Column(Integer, nullable=False, default=5)
+    proximo_intento = Column(DateTime, nullable=False, server_default=func.now())
+    reclamado_en = Column(DateTime, nullable=True)  # Inicio del envío; permite recuperar mensajes de un worker caído
+    expira_en = Column(DateTime, nullable=True)  # Pasada esta fecha ya no tiene sentido enviarlo (p. ej. OTP)
+    ultimo_error = Column(String(255), nullable=True)
+    fecha_creacion = Column(DateTime, server_default=func.now())
+    fecha_envio = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Los workers solo recorren los mensajes pendientes, en orden de prioridad
+        Index("ix_cola_whatsapp_pendientes", "prioridad", "proximo_intento", postgresql_where=text("estado = 'pendiente'")),
+        Index("ix_cola_whatsapp_enviando", "reclamado_en", postgresql_where=text("estado = 'enviando'")),
+    )
+
+    def __repr__(self):
+        return f"<MensajeWhatsApp(id_mensaje={self.id_mensaje}, tipo='{self.tipo}', estado='{self.estado}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from db.database import Base
 from sqlalchemy.orm import relationship
@@ -13,5 +13,10 @@ class Notificacion(Base):
 
     usuario = relationship("Usuario", back_populates="notificaciones")
 
+    __table_args__ = (
+        # Conteo de no leídas por usuario (respaldo y conciliación de contadores_no_leidos)
+        Index("ix_notificaciones_no_leidas", "id_usuario", postgresql_where=text("estado_notificacion = 'no_leida'")),
+    )
+
     def __repr__(self):
         return f"<Notificacion(id_notificacion={self.id_notificacion}, id_usuario={self.id_usuario}, estado_notificacion='{self.estado_notificacion}')>"
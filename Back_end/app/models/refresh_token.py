@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy.sql import func
+from db.database import Base
+from sqlalchemy.orm import relationship
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    id_token = Column(String(64), primary_key=True)  # SHA-256 del jti; el token en claro nunca se guarda
+    id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario", ondelete="CASCADE"), nullable=False, index=True)
+    fecha_creacion = Column(DateTime, server_default=func.now())
+    fecha_expiracion = Column(DateTime, nullable=False)
+    revocado = Column(Boolean, nullable=False, default=False, server_default="false")
+    reemplazado_por = Column(String(64), nullable=True)  # Token emitido al rotar este
+
+    usuario = relationship("Usuario")
+
+    def __repr__(self):
+        return f"<RefreshToken(id_usuario={self.id_usuario}, revocado={self.revocado})>"
@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, text
 from sqlalchemy.sql import func
 from db.database import Base  # Importamos la Base declarativa
 from sqlalchemy import Float, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+from utils.roles import mascara_desde_tipo, filtro_rol, ROL_ARRENDADOR
+
+def _mascara_inicial(context):
+    # Al insertar, la máscara se deriva de tipo_usuario si no se indicó
+    return mascara_desde_tipo(context.get_current_parameters().get("tipo_usuario"))
 
 # Modelo Usuario
 class Usuario(Base):
@@ -20,7 +25,9 @@ class Usuario(Base):
     fecha_registro = Column(DateTime, server_default=func.now())
     fecha_actualizacion = Column(DateTime, onupdate=func.now())
     tipo_usuario = Column(String(50), default="arrendatario")  # Puede contener múltiples roles separados por coma
+    roles_mask = Column(Integer, nullable=False, default=_mascara_inicial, server_default="1")  # Bits de utils.roles
     activo = Column(Boolean, default=True)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # Se incrementa para revocar tokens
     # Nota: telefono_verificado no existe en la BD, usar celular_verificado
     notificaciones = relationship("Notificacion", back_populates="usuario")
 
@@ -30,5 +37,18 @@ class Usuario(Base):
     resenas = relationship("Resena", back_populates="usuario")
     reportes = relationship("Reporte", back_populates="usuario")
 
+    __table_args__ = (
+        # Solo los usuarios con revocaciones se cargan en el mapa de versiones
+        Index("ix_usuarios_token_version", "id_usuario", "token_version", postgresql_where=text("token_version > 0")),
+        # Consulta "todos los arrendadores" sin recorrer la tabla completa
+        Index("ix_usuarios_arrendadores", "id_usuario", postgresql_where=filtro_rol(roles_mask, ROL_ARRENDADOR)),
+    )
+
+    @validates("tipo_usuario")
+    def _sincronizar_roles_mask(self, clave, tipo_usuario):
+        # Mantiene roles_mask alineado cuando se asigna tipo_usuario desde el ORM
+        self.roles_mask = mascara_desde_tipo(tipo_usuario)
+        return tipo_usuario
+
     def __repr__(self):
         return f"<Usuario(id_usuario={self.id_usuario}, email='{self.email}', tipo_usuario='{self.tipo_usuario}')>"
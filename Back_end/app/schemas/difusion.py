@@ -0,0 +1,55 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Dict
+from datetime import datetime
+from enum import Enum
+
+class AudienciaEnum(str, Enum):
+    favoritos_inmueble = "favoritos_inmueble"  # Usuarios que guardaron el inmueble (p. ej. bajó de precio)
+    arrendadores = "arrendadores"
+    arrendatarios = "arrendatarios"
+    todos = "todos"
+
+# Schema para crear una difusión
+class DifusionCrear(BaseModel):
+    audiencia: AudienciaEnum = Field(..., description="Destinatarios de la difusión")
+    mensaje: str = Field(..., min_length=1, max_length=1000, description="Texto que se enviará por WhatsApp")
+    id_inmueble: Optional[int] = Field(None, description="Obligatorio para la audiencia favoritos_inmueble")
+
+    @model_validator(mode="after")
+    def validar_inmueble(self):
+        if self.audiencia == AudienciaEnum.favoritos_inmueble and self.id_inmueble is None:
+            raise ValueError("id_inmueble es obligatorio para la audiencia favoritos_inmueble")
+        return self
+
+# Schema para mostrar una difusión
+class DifusionOut(BaseModel):
+    id_difusion: int
+    id_creador: Optional[int] = None
+    audiencia: str
+    id_inmueble: Optional[int] = None
+    mensaje: str
+    estado: str
+    total_destinatarios: int
+    enviados: int
+    fallidos: int
+    ultimo_error: Optional[str] = None
+    fecha_creacion: Optional[datetime] = None
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Schema con el progreso por estado de los destinatarios
+class DifusionProgreso(DifusionOut):
+    por_estado: Dict[str, int] = {}
+
+class DifusionDestinatarioOut(BaseModel):
+    id_usuario: int
+    telefono: str
+    estado: str
+    ultimo_error: Optional[str] = None
+    fecha_envio: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from enum import Enum
+from schemas.imagen import ImagenOut
 
 # Enums para validaciones
 class TipoInmuebleEnum(str, Enum):
@@ -16,6 +17,9 @@ class EstadoInmuebleEnum(str, Enum):
     rechazado = "rechazado"
     pausado = "pausado"
 
+class OrdenInmuebleEnum(str, Enum):
+    populares = "populares"
+
 # Schema para crear inmueble (completo)
 class InmuebleCreateCompleto(BaseModel):
     # Datos básicos del inmueble
@@ -193,6 +197,11 @@ class InmuebleOut(BaseModel):
     servicio_lavanderia: bool = False
     camaras_seguridad: bool = False
     mascotas_permitidas: bool = False
+    # Popularidad
+    vistas: int = 0
+    # Imágenes
+    portada: Optional[str] = None
+    imagenes: Optional[List[ImagenOut]] = None  # Solo con include=imagenes
 
     class Config:
         from_attributes = True
@@ -17,3 +17,17 @@ class MensajeOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+# Una fila de la bandeja: la conversación con otro usuario
+class ConversacionOut(BaseModel):
+    id_otro_usuario: int
+    nombres: str
+    apellido_paterno: str
+    ultimo_mensaje: MensajeOut
+    no_leidos: int
+
+# Resultado de marcar una conversación como leída
+class LeidosOut(BaseModel):
+    marcados: int
+    no_leidos_conversacion: int
+    no_leidos_total: int
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 from enum import Enum
@@ -17,5 +17,9 @@ class NotificacionOut(BaseModel):
     class Config:
         from_attributes = True
 
+class NotificacionCrear(BaseModel):
+    id_usuario: int
+    mensaje: str = Field(..., min_length=1, max_length=255)
+
 class NotificacionUpdate(BaseModel):
     estado_notificacion: EstadoNotificacionEnum
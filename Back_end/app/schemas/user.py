@@ -6,6 +6,9 @@ class LoginUsuario(BaseModel):
     num_celular: str = Field(..., description="Número de celular para el login")
     password: str
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., description="Refresh token recibido en el login o en el último refresh")
+
 class UsuarioCrear(BaseModel):
     nombres: str
     apellido_paterno: str
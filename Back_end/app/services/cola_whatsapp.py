@@ -0,0 +1,361 @@
+"""
+Cola persistente de mensajes salientes de WhatsApp.
+
+Los endpoints ya no esperan al microservicio WhatsApp (hasta 30 s con
+timeout): insertan el mensaje en la tabla cola_whatsapp, dentro de su
+propia transacción, y responden de inmediato. Un grupo de workers asíncronos:
+
+- reclama un mensaje a la vez con FOR UPDATE SKIP LOCKED, en orden de
+  prioridad (OTP antes que bienvenida), así varios procesos de uvicorn
+  pueden compartir la cola sin enviar dos veces
+- envía fuera de la transacción y registra el resultado; con el circuito
+  de WhatsApp abierto el mensaje se pospone sin gastar intentos
+- reintenta con backoff exponencial (con jitter) y, agotados los intentos
+  o vencido el mensaje (un OTP que ya expiró), lo deja como "fallido"
+  (dead letter) con el último error; un rechazo 4xx (MensajeRechazado) va
+  directo a "fallido" sin reintentos
+- devuelve a la cola los mensajes de un worker que murió a mitad de envío
+
+El texto de un OTP contiene el código en claro: al quedar enviado o fallido
+se reemplaza por OTP_REDACTADO, y el mantenimiento redacta también los que
+vencieron sin llegar a procesarse. Los enviados se borran pasada la retención.
+"""
+
+import asyncio
+import logging
+import os
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import SessionLocal
+from models.mensaje_whatsapp import MensajeWhatsApp
+from services.whatsapp import WhatsAppService, MensajeRechazado
+from utils.circuito import CircuitoAbierto
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_COLA_WORKERS = int(os.getenv("WHATSAPP_COLA_WORKERS", "4"))
+WHATSAPP_COLA_MAX_INTENTOS = int(os.getenv("WHATSAPP_COLA_MAX_INTENTOS", "5"))
+WHATSAPP_COLA_BACKOFF_BASE = float(os.getenv("WHATSAPP_COLA_BACKOFF_BASE", "2"))
+WHATSAPP_COLA_BACKOFF_MAX = float(os.getenv("WHATSAPP_COLA_BACKOFF_MAX", "300"))
+# Espera máxima de un worker sin trabajo (otros procesos no pueden despertarlo)
+WHATSAPP_COLA_INTERVALO = float(os.getenv("WHATSAPP_COLA_INTERVALO", "1"))
+# Un mensaje "enviando" más antiguo que esto pertenece a un worker caído
+WHATSAPP_COLA_VISIBILIDAD = float(os.getenv("WHATSAPP_COLA_VISIBILIDAD", "120"))
+WHATSAPP_COLA_INTERVALO_MANTENIMIENTO = float(os.getenv("WHATSAPP_COLA_INTERVALO_MANTENIMIENTO", "60"))
+WHATSAPP_COLA_RETENCION_DIAS = int(os.getenv("WHATSAPP_COLA_RETENCION_DIAS", "7"))
+
+# Menor número = mayor prioridad
+PRIORIDAD_OTP = 0
+PRIORIDAD_BIENVENIDA = 10
+PRIORIDADES = {"otp": PRIORIDAD_OTP, "bienvenida": PRIORIDAD_BIENVENIDA}
+
+# Texto que reemplaza al de un OTP que ya no se va a enviar
+OTP_REDACTADO = "[OTP redactado]"
+
+
+class ColaWhatsApp:
+    """Workers que vacían la tabla cola_whatsapp (una instancia por proceso)"""
+
+    def __init__(
+        self,
+        workers: int = WHATSAPP_COLA_WORKERS,
+        max_intentos: int = WHATSAPP_COLA_MAX_INTENTOS,
+        backoff_base: float = WHATSAPP_COLA_BACKOFF_BASE,
+        backoff_max: float = WHATSAPP_COLA_BACKOFF_MAX,
+        intervalo: float = WHATSAPP_COLA_INTERVALO,
+    ):
+        self.workers = max(1, workers)
+        self.max_intentos = max_intentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.intervalo = intervalo
+        self._servicio = WhatsAppService()
+        self._evento = asyncio.Event()
+        self._tareas: list = []
+        self._mantenimiento: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.encolados = Counter()
+        self.enviados = Counter()
+        self.reintentos = 0
+        self.pospuestos = 0
+        self.fallidos = Counter()
+        self.expirados = 0
+        self.rechazados = 0
+        self.rescatados = 0
+        self.purgados = 0
+        self.redactados = 0
+        self.errores_worker = 0
+
+    # ---------- productores ----------
+
+    def encolar(
+        self,
+        db: AsyncSession,
+        telefono: str,
+        mensaje: str,
+        tipo: str,
+        prioridad: Optional[int] = None,
+        expira_en: Optional[datetime] = None,
+    ) -> MensajeWhatsApp:
+        """
+        Agrega el mensaje a la sesión sin confirmar: se persiste con el commit
+        del endpoint (junto con el usuario, por ejemplo). Llamar a notificar()
+        después del commit para que los workers no esperen al siguiente sondeo.
+        """
+        registro = MensajeWhatsApp(
+            telefono=telefono,
+            mensaje=mensaje,
+            tipo=tipo,
+            prioridad=PRIORIDADES.get(tipo, PRIORIDAD_BIENVENIDA) if prioridad is None else prioridad,
+            estado="pendiente",
+            intentos=0,
+            max_intentos=self.max_intentos,
+            proximo_intento=datetime.now(),
+            expira_en=expira_en
+        )
+        db.add(registro)
+        self.encolados[tipo] += 1
+        return registro
+
+    def notificar(self) -> None:
+        """Despierta a los workers de este proceso"""
+        self._evento.set()
+
+    # ---------- workers ----------
+
+    async def _reclamar(self) -> Optional[dict]:
+        """Marca como "enviando" el siguiente mensaje vencido; None si no hay"""
+        ahora = datetime.now()
+        siguiente = (
+            select(MensajeWhatsApp.id_mensaje)
+            .where(MensajeWhatsApp.estado == "pendiente", MensajeWhatsApp.proximo_intento <= ahora)
+            .order_by(MensajeWhatsApp.prioridad, MensajeWhatsApp.proximo_intento)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        sentencia = (
+            update(MensajeWhatsApp)
+            .where(MensajeWhatsApp.id_mensaje == siguiente)
+            .values(estado="enviando", intentos=MensajeWhatsApp.intentos + 1, reclamado_en=ahora)
+            .returning(
+                MensajeWhatsApp.id_mensaje, MensajeWhatsApp.telefono, MensajeWhatsApp.mensaje,
+                MensajeWhatsApp.tipo, MensajeWhatsApp.intentos, MensajeWhatsApp.max_intentos,
+                MensajeWhatsApp.expira_en, MensajeWhatsApp.reclamado_en
+            )
+            .execution_options(synchronize_session=False)
+        )
+        async with SessionLocal() as db:
+            fila = (await db.execute(sentencia)).mappings().first()
+            await db.commit()
+        return dict(fila) if fila else None
+
+    async def _finalizar(self, mensaje: dict, **valores) -> None:
+        if mensaje["tipo"] == "otp" and valores.get("estado") in ("enviado", "fallido"):
+            # El código no vuelve a hacer falta: no dejarlo en claro en la tabla
+            valores["mensaje"] = OTP_REDACTADO
+        # Solo si nadie lo reclamó de nuevo (p. ej. rescatado tras superar la visibilidad)
+        async with SessionLocal() as db:
+            await db.execute(
+                update(MensajeWhatsApp)
+                .where(
+                    MensajeWhatsApp.id_mensaje == mensaje["id_mensaje"],
+                    MensajeWhatsApp.estado == "enviando",
+                    MensajeWhatsApp.reclamado_en == mensaje["reclamado_en"]
+                )
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    def _retraso(self, intentos: int) -> float:
+        retraso = min(self.backoff_max, self.backoff_base * (2 ** (intentos - 1)))
+        return retraso * random.uniform(0.5, 1.0)
+
+    async def _procesar(self, mensaje: dict) -> None:
+        ahora = datetime.now()
+        if mensaje["expira_en"] and mensaje["expira_en"] <= ahora:
+            self.expirados += 1
+            self.fallidos[mensaje["tipo"]] += 1
+            logger.warning(f"Mensaje {mensaje['id_mensaje']} ({mensaje['tipo']}) expiró sin enviarse")
+            await self._finalizar(mensaje, estado="fallido", ultimo_error="Expirado antes de enviarse")
+            return
+
+        try:
+            await self._servicio.send_message(mensaje["telefono"], mensaje["mensaje"])
+        except CircuitoAbierto as e:
+            # El servicio está caído: se pospone sin gastar un intento
+            self.pospuestos += 1
+            await self._finalizar(
+                mensaje,
+                estado="pendiente",
+                intentos=mensaje["intentos"] - 1,
+                proximo_intento=datetime.now() + timedelta(seconds=max(e.retry_after, self.intervalo))
+            )
+            return
+        except MensajeRechazado as e:
+            # 4xx: el mensaje no es válido y reintentarlo daría el mismo error
+            error = f"{e.__class__.__name__}: {e}"[:255]
+            self.rechazados += 1
+            self.fallidos[mensaje["tipo"]] += 1
+            logger.error(f"Mensaje {mensaje['id_mensaje']} ({mensaje['tipo']}) rechazado por el servicio: {error}")
+            await self._finalizar(mensaje, estado="fallido", ultimo_error=error)
+            return
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"[:255]
+            if mensaje["intentos"] >= mensaje["max_intentos"]:
+                self.fallidos[mensaje["tipo"]] += 1
+                logger.error(f"Mensaje {mensaje['id_mensaje']} ({mensaje['tipo']}) descartado tras {mensaje['intentos']} intentos: {error}")
+                await self._finalizar(mensaje, estado="fallido", ultimo_error=error)
+            else:
+                self.reintentos += 1
+                retraso = self._retraso(mensaje["intentos"])
+                logger.warning(f"Mensaje {mensaje['id_mensaje']} falló (intento {mensaje['intentos']}), reintento en {retraso:.1f}s: {error}")
+                await self._finalizar(
+                    mensaje,
+                    estado="pendiente",
+                    ultimo_error=error,
+                    proximo_intento=datetime.now() + timedelta(seconds=retraso)
+                )
+            return
+
+        self.enviados[mensaje["tipo"]] += 1
+        await self._finalizar(mensaje, estado="enviado", fecha_envio=datetime.now(), ultimo_error=None)
+
+    async def _worker(self, numero: int) -> None:
+        while True:
+            try:
+                self._evento.clear()
+                mensaje = await self._reclamar()
+                if mensaje is None:
+                    try:
+                        await asyncio.wait_for(self._evento.wait(), timeout=self.intervalo)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._procesar(mensaje)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Un fallo de la BD no debe matar al worker
+                self.errores_worker += 1
+                logger.error(f"Error en el worker {numero} de la cola WhatsApp: {e}")
+                await asyncio.sleep(self.intervalo)
+
+    # ---------- mantenimiento ----------
+
+    async def rescatar_huerfanos(self) -> int:
+        """Devuelve a "pendiente" los mensajes de workers que murieron enviando"""
+        limite = datetime.now() - timedelta(seconds=WHATSAPP_COLA_VISIBILIDAD)
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                update(MensajeWhatsApp)
+                .where(MensajeWhatsApp.estado == "enviando", MensajeWhatsApp.reclamado_en < limite)
+                .values(estado="pendiente", proximo_intento=datetime.now())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self.rescatados += resultado.rowcount or 0
+        return resultado.rowcount or 0
+
+    async def purgar_enviados(self) -> int:
+        """Borra los mensajes enviados más antiguos que la retención"""
+        limite = datetime.now() - timedelta(days=WHATSAPP_COLA_RETENCION_DIAS)
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                delete(MensajeWhatsApp)
+                .where(MensajeWhatsApp.estado == "enviado", MensajeWhatsApp.fecha_envio < limite)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self.purgados += resultado.rowcount or 0
+        return resultado.rowcount or 0
+
+    async def redactar_otp(self) -> int:
+        """Reemplaza el texto de los OTP fallidos o vencidos que aún lo guardan en claro"""
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                update(MensajeWhatsApp)
+                .where(
+                    MensajeWhatsApp.tipo == "otp",
+                    MensajeWhatsApp.mensaje != OTP_REDACTADO,
+                    or_(
+                        MensajeWhatsApp.estado.in_(("enviado", "fallido")),
+                        MensajeWhatsApp.expira_en <= datetime.now()
+                    )
+                )
+                .values(mensaje=OTP_REDACTADO)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self.redactados += resultado.rowcount or 0
+        return resultado.rowcount or 0
+
+    async def _ciclo_mantenimiento(self) -> None:
+        while True:
+            try:
+                if await self.rescatar_huerfanos():
+                    self.notificar()
+                await self.purgar_enviados()
+                await self.redactar_otp()
+            except Exception as e:
+                logger.error(f"Error en el mantenimiento de la cola WhatsApp: {e}")
+            await asyncio.sleep(WHATSAPP_COLA_INTERVALO_MANTENIMIENTO)
+
+    # ---------- ciclo de vida ----------
+
+    def iniciar(self) -> None:
+        """Arranca los workers (llamar en el startup de la app)"""
+        if self._tareas:
+            return
+        self._evento = asyncio.Event()
+        self._tareas = [asyncio.create_task(self._worker(numero)) for numero in range(self.workers)]
+        self._mantenimiento = asyncio.create_task(self._ciclo_mantenimiento())
+
+    async def detener(self) -> None:
+        """Detiene los workers; un envío interrumpido se reintenta tras la visibilidad"""
+        tareas = self._tareas + ([self._mantenimiento] if self._mantenimiento else [])
+        for tarea in tareas:
+            tarea.cancel()
+        for tarea in tareas:
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+        self._tareas = []
+        self._mantenimiento = None
+
+    async def profundidad(self) -> dict:
+        """Mensajes en la tabla por estado (compartida por todos los procesos)"""
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                select(MensajeWhatsApp.estado, func.count()).group_by(MensajeWhatsApp.estado)
+            )
+            return {estado: cantidad for estado, cantidad in resultado.all()}
+
+    def metricas(self) -> dict:
+        return {
+            "workers": len([tarea for tarea in self._tareas if not tarea.done()]),
+            "encolados": dict(self.encolados),
+            "enviados": dict(self.enviados),
+            "reintentos": self.reintentos,
+            "pospuestos": self.pospuestos,
+            "fallidos": dict(self.fallidos),
+            "expirados": self.expirados,
+            "rechazados": self.rechazados,
+            "rescatados": self.rescatados,
+            "purgados": self.purgados,
+            "redactados": self.redactados,
+            "errores_worker": self.errores_worker
+        }
+
+
+# Instancia compartida por toda la aplicación
+cola_whatsapp = ColaWhatsApp()
@@ -0,0 +1,157 @@
+"""
+Contador de vistas de inmuebles con escritura diferida (write-behind).
+
+Cada visita a un inmueble solo incrementa un contador en memoria; los
+incrementos acumulados se vuelcan en lote a la tabla estadisticas_inmueble
+cada pocos segundos y al apagar el servidor, evitando un UPDATE por visita.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from db.database import SessionLocal
+from models.estadistica_inmueble import EstadisticaInmueble
+from models.inmueble import Inmueble
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre volcados a la base de datos (segundos)
+INTERVALO_VOLCADO_SEGUNDOS = float(os.getenv("VISTAS_INTERVALO_VOLCADO", "5"))
+
+
+class ContadorVistas:
+    """Acumula vistas por inmueble en memoria y las persiste en lote"""
+
+    def __init__(self, intervalo: float = INTERVALO_VOLCADO_SEGUNDOS):
+        self.intervalo = intervalo
+        self._pendientes: Dict[int, int] = defaultdict(int)
+        # Incrementos que se están escribiendo en este momento
+        self._en_vuelo: Dict[int, int] = {}
+        self._lock = asyncio.Lock()
+        self._tarea: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.vistas_registradas = 0
+        self.vistas_volcadas = 0
+        self.volcados = 0
+        self.errores_volcado = 0
+
+    def registrar_vista(self, id_inmueble: int) -> None:
+        """Registra una vista sin tocar la base de datos"""
+        self._pendientes[id_inmueble] += 1
+        self.vistas_registradas += 1
+
+    def vistas_pendientes(self, id_inmueble: int) -> int:
+        """Vistas aún no persistidas de un inmueble"""
+        return self._pendientes.get(id_inmueble, 0) + self._en_vuelo.get(id_inmueble, 0)
+
+    def total_vistas(self, inmueble: Inmueble) -> int:
+        """Vistas persistidas (relación estadisticas cargada) más las pendientes"""
+        persistidas = inmueble.estadisticas.vistas if inmueble.estadisticas else 0
+        return persistidas + self.vistas_pendientes(inmueble.id_inmueble)
+
+    def _devolver(self, lote: Dict[int, int]) -> None:
+        for id_inmueble, vistas in lote.items():
+            self._pendientes[id_inmueble] += vistas
+
+    async def volcar(self) -> int:
+        """
+        Escribe los incrementos acumulados con un único upsert.
+
+        Returns:
+            int: Número de inmuebles actualizados
+        """
+        async with self._lock:
+            if not self._pendientes:
+                return 0
+
+            lote = dict(self._pendientes)
+            self._pendientes = defaultdict(int)
+            self._en_vuelo = lote
+            confirmado = False
+
+            try:
+                async with SessionLocal() as db:
+                    # Descartar inmuebles eliminados desde que se registró la vista
+                    resultado = await db.execute(
+                        select(Inmueble.id_inmueble).where(Inmueble.id_inmueble.in_(list(lote)))
+                    )
+                    existentes = set(resultado.scalars().all())
+                    filas = [
+                        {"id_inmueble": id_inmueble, "vistas": vistas}
+                        for id_inmueble, vistas in lote.items()
+                        if id_inmueble in existentes
+                    ]
+
+                    if filas:
+                        stmt = insert(EstadisticaInmueble).values(filas)
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[EstadisticaInmueble.id_inmueble],
+                            set_={
+                                "vistas": EstadisticaInmueble.vistas + stmt.excluded.vistas,
+                                "fecha_actualizacion": func.now()
+                            }
+                        )
+                        await db.execute(stmt)
+                        await db.commit()
+                    confirmado = True
+
+                self.volcados += 1
+                self.vistas_volcadas += sum(fila["vistas"] for fila in filas)
+                return len(filas)
+
+            except asyncio.CancelledError:
+                # Cancelado (p. ej. en el shutdown) antes de confirmar: el lote no se pierde
+                if not confirmado:
+                    self._devolver(lote)
+                raise
+
+            except Exception as e:
+                # Devolver los incrementos para reintentarlos en el siguiente ciclo
+                self._devolver(lote)
+                self.errores_volcado += 1
+                logger.error(f"Error al volcar vistas de inmuebles: {e}")
+                return 0
+
+            finally:
+                self._en_vuelo = {}
+
+    async def _ciclo_volcado(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self.volcar()
+
+    def iniciar(self) -> None:
+        """Arranca la tarea de volcado periódico (llamar en el startup de la app)"""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._ciclo_volcado())
+
+    async def detener(self) -> None:
+        """Detiene la tarea periódica y vuelca lo pendiente (llamar en el shutdown)"""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        await self.volcar()
+
+    def metricas(self) -> dict:
+        return {
+            "vistas_registradas": self.vistas_registradas,
+            "vistas_volcadas": self.vistas_volcadas,
+            "vistas_pendientes": sum(self._pendientes.values()),
+            "volcados": self.volcados,
+            "errores_volcado": self.errores_volcado
+        }
+
+
+# Instancia compartida por toda la aplicación
+contador_vistas = ContadorVistas()
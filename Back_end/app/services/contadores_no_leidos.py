@@ -0,0 +1,332 @@
+"""
+Contadores de no leídos por usuario (notificaciones y mensajes).
+
+Contar filas no leídas en cada refresco del badge es O(n) por usuario. La
+tabla contadores_no_leidos guarda una fila por usuario que se ajusta en la
+misma transacción que el cambio que la motiva:
+
+- nueva notificación / nuevo mensaje recibido   -> +1
+- marcar como leída(s)                          -> -k
+- eliminar un usuario                           -> -k a quienes tenían sin
+                                                   leer mensajes suyos
+
+ajustar() hace un UPDATE por clave primaria; si el usuario aún no tiene fila
+la crea con un COUNT (que ya incluye el cambio de la transacción), así nunca
+arranca de cero con datos previos.
+
+La lectura es O(1): caché en memoria por worker (TTL corto + generaciones,
+como cache_usuarios) y, si falla, un SELECT por clave primaria; sin fila se
+responde con COUNT en SQL. Un job periódico concilia los contadores con los
+conteos reales por lotes de usuarios y corrige la deriva (p. ej. cambios
+hechos directamente en la BD). Cada lote bloquea primero sus filas de
+contador (FOR UPDATE, en orden) y después cuenta: un ajuste ya aplicado pero
+sin confirmar se espera y queda incluido en el conteo, y uno posterior
+espera al lote y suma su delta sobre el valor corregido. Solo se corrigen
+las filas bloqueadas; una fila creada por ajustar() mientras corre el lote
+ya partió de un COUNT propio y no se pisa con el conteo del lote, que no
+incluye ese cambio.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, update, func, or_, and_, event, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal
+from models.contador_no_leidos import ContadorNoLeidos
+from models.mensaje import Mensaje, ESTADO_LEIDO
+from models.notificacion import Notificacion
+from models.usuario import Usuario
+
+logger = logging.getLogger(__name__)
+
+CONTADORES_CACHE_TTL_SEGUNDOS = float(os.getenv("CONTADORES_CACHE_TTL", "10"))
+CONTADORES_CACHE_MAX_ENTRADAS = int(os.getenv("CONTADORES_CACHE_MAX", "50000"))
+CONTADORES_INTERVALO_CONCILIACION = float(os.getenv("CONTADORES_INTERVALO_CONCILIACION", "3600"))
+CONTADORES_LOTE_CONCILIACION = int(os.getenv("CONTADORES_LOTE_CONCILIACION", "1000"))
+
+NOTIFICACION_NO_LEIDA = "no_leida"
+
+# Literales (no parámetros) para que el planner use los índices parciales
+_NOTIFICACION_NO_LEIDA = Notificacion.estado_notificacion == literal_column(f"'{NOTIFICACION_NO_LEIDA}'")
+_MENSAJE_NO_LEIDO = Mensaje.estado_mensaje != literal_column(f"'{ESTADO_LEIDO}'")
+
+# Ids con contadores ajustados en la transacción en curso (Session.info)
+_CLAVE_SESION = "contadores_no_leidos"
+
+
+def _conteo_notificaciones(id_usuario):
+    return (
+        select(func.count())
+        .select_from(Notificacion)
+        .where(Notificacion.id_usuario == id_usuario, _NOTIFICACION_NO_LEIDA)
+        .scalar_subquery()
+    )
+
+def _conteo_mensajes(id_usuario):
+    return (
+        select(func.count())
+        .select_from(Mensaje)
+        .where(Mensaje.id_destinatario == id_usuario, _MENSAJE_NO_LEIDO)
+        .scalar_subquery()
+    )
+
+
+class ContadoresNoLeidos:
+    def __init__(
+        self,
+        ttl: float = CONTADORES_CACHE_TTL_SEGUNDOS,
+        max_entradas: int = CONTADORES_CACHE_MAX_ENTRADAS,
+        intervalo_conciliacion: float = CONTADORES_INTERVALO_CONCILIACION,
+        lote_conciliacion: int = CONTADORES_LOTE_CONCILIACION
+    ):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.intervalo_conciliacion = intervalo_conciliacion
+        self.lote_conciliacion = lote_conciliacion
+        self._cache: "OrderedDict[int, Tuple[float, Dict[str, int]]]" = OrderedDict()
+        # Se incrementa en cada invalidación para descartar lecturas concurrentes obsoletas
+        self._generaciones: Dict[int, int] = {}
+        self._tarea: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.aciertos = 0
+        self.fallos = 0
+        self.respaldos_count = 0
+        self.ajustes = 0
+        self.filas_creadas = 0
+        self.conciliaciones = 0
+        self.filas_corregidas = 0
+        self.errores_conciliacion = 0
+
+    # ---- caché ----
+    def invalidar(self, id_usuario: int) -> None:
+        self._generaciones[id_usuario] = self._generaciones.get(id_usuario, 0) + 1
+        self._cache.pop(id_usuario, None)
+
+    def _guardar(self, id_usuario: int, valores: Dict[str, int], generacion: int) -> None:
+        if self._generaciones.get(id_usuario, 0) != generacion:
+            return
+        self._cache[id_usuario] = (time.monotonic() + self.ttl, valores)
+        self._cache.move_to_end(id_usuario)
+        while len(self._cache) > self.max_entradas:
+            self._cache.popitem(last=False)
+
+    # ---- escritura (dentro de la transacción del llamador) ----
+    async def ajustar(self, db: AsyncSession, id_usuario: int, notificaciones: int = 0, mensajes: int = 0) -> None:
+        """Suma los deltas al contador del usuario; no hace commit.
+
+        Llamar después de que el cambio esté en la sesión (se hace flush) y
+        antes del commit del llamador, para que ambos se confirmen juntos.
+        """
+        if not notificaciones and not mensajes:
+            return
+        await db.flush()
+        self.ajustes += 1
+        db.sync_session.info.setdefault(_CLAVE_SESION, set()).add(id_usuario)
+        self.invalidar(id_usuario)
+
+        resultado = await db.execute(
+            update(ContadorNoLeidos)
+            .where(ContadorNoLeidos.id_usuario == id_usuario)
+            .values(
+                notificaciones=func.greatest(ContadorNoLeidos.notificaciones + notificaciones, 0),
+                mensajes=func.greatest(ContadorNoLeidos.mensajes + mensajes, 0),
+                fecha_actualizacion=func.now()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if resultado.rowcount:
+            return
+
+        # Primera vez: se parte del conteo real, que ya incluye este cambio
+        stmt = insert(ContadorNoLeidos).values(
+            id_usuario=id_usuario,
+            notificaciones=_conteo_notificaciones(id_usuario),
+            mensajes=_conteo_mensajes(id_usuario)
+        )
+        stmt = stmt.on_conflict_do_update(
+            # Otra transacción creó la fila entre el UPDATE y el INSERT
+            index_elements=[ContadorNoLeidos.id_usuario],
+            set_={
+                "notificaciones": func.greatest(ContadorNoLeidos.notificaciones + notificaciones, 0),
+                "mensajes": func.greatest(ContadorNoLeidos.mensajes + mensajes, 0),
+                "fecha_actualizacion": func.now()
+            }
+        )
+        await db.execute(stmt)
+        self.filas_creadas += 1
+
+    async def descontar_mensajes_de(self, db: AsyncSession, id_remitente: int) -> None:
+        """Resta a cada destinatario los no leídos enviados por id_remitente; no hace commit.
+
+        Llamar antes de borrar esos mensajes (p. ej. al eliminar el usuario),
+        en la misma transacción: un solo UPDATE agrupado por destinatario.
+        """
+        por_destinatario = (
+            select(Mensaje.id_destinatario, func.count().label("no_leidos"))
+            .where(Mensaje.id_remitente == id_remitente, Mensaje.id_destinatario != id_remitente, _MENSAJE_NO_LEIDO)
+            .group_by(Mensaje.id_destinatario)
+            .subquery()
+        )
+        ids = (await db.execute(
+            update(ContadorNoLeidos)
+            .where(ContadorNoLeidos.id_usuario == por_destinatario.c.id_destinatario)
+            .values(
+                mensajes=func.greatest(ContadorNoLeidos.mensajes - por_destinatario.c.no_leidos, 0),
+                fecha_actualizacion=func.now()
+            )
+            .returning(ContadorNoLeidos.id_usuario)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        if ids:
+            self.ajustes += 1
+            db.sync_session.info.setdefault(_CLAVE_SESION, set()).update(ids)
+            for id_usuario in ids:
+                self.invalidar(id_usuario)
+
+    # ---- lectura ----
+    async def obtener(self, db: AsyncSession, id_usuario: int) -> Dict[str, int]:
+        """{"notificaciones": n, "mensajes": m} no leídos del usuario"""
+        entrada = self._cache.get(id_usuario)
+        if entrada is not None and time.monotonic() < entrada[0]:
+            self._cache.move_to_end(id_usuario)
+            self.aciertos += 1
+            return dict(entrada[1])
+        self.fallos += 1
+
+        generacion = self._generaciones.get(id_usuario, 0)
+        fila = (await db.execute(
+            select(ContadorNoLeidos.notificaciones, ContadorNoLeidos.mensajes)
+            .where(ContadorNoLeidos.id_usuario == id_usuario)
+        )).first()
+        if fila is None:
+            # Usuario sin fila todavía: conteo directo en SQL
+            self.respaldos_count += 1
+            fila = (await db.execute(
+                select(_conteo_notificaciones(id_usuario), _conteo_mensajes(id_usuario))
+            )).first()
+
+        valores = {"notificaciones": fila[0], "mensajes": fila[1]}
+        self._guardar(id_usuario, valores, generacion)
+        return dict(valores)
+
+    # ---- conciliación ----
+    async def conciliar(self) -> int:
+        """Recalcula los contadores de todos los usuarios por lotes; devuelve las filas corregidas o creadas"""
+        corregidas = 0
+        ultimo_id = 0
+        while True:
+            async with SessionLocal() as db:
+                ids = (await db.execute(
+                    select(Usuario.id_usuario)
+                    .where(Usuario.id_usuario > ultimo_id)
+                    .order_by(Usuario.id_usuario)
+                    .limit(self.lote_conciliacion)
+                )).scalars().all()
+                if not ids:
+                    break
+
+                # Bloquear antes de contar (en orden de id para no interbloquear con otro worker)
+                existentes = (await db.execute(
+                    select(ContadorNoLeidos.id_usuario)
+                    .where(ContadorNoLeidos.id_usuario.between(ids[0], ids[-1]))
+                    .order_by(ContadorNoLeidos.id_usuario)
+                    .with_for_update()
+                )).scalars().all()
+                reales = (
+                    select(
+                        Usuario.id_usuario,
+                        _conteo_notificaciones(Usuario.id_usuario),
+                        _conteo_mensajes(Usuario.id_usuario)
+                    )
+                    .where(Usuario.id_usuario.between(ids[0], ids[-1]))
+                )
+                stmt = insert(ContadorNoLeidos).from_select(["id_usuario", "notificaciones", "mensajes"], reales)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ContadorNoLeidos.id_usuario],
+                    set_={
+                        "notificaciones": stmt.excluded.notificaciones,
+                        "mensajes": stmt.excluded.mensajes,
+                        "fecha_actualizacion": func.now()
+                    },
+                    # Solo filas bloqueadas arriba y con deriva: las creadas por un ajuste
+                    # concurrente se esperaron aquí y el conteo del lote no las incluye
+                    where=and_(
+                        ContadorNoLeidos.id_usuario.in_(existentes),
+                        or_(
+                            ContadorNoLeidos.notificaciones != stmt.excluded.notificaciones,
+                            ContadorNoLeidos.mensajes != stmt.excluded.mensajes
+                        )
+                    )
+                ).returning(ContadorNoLeidos.id_usuario)
+                cambiados = (await db.execute(stmt)).scalars().all()
+                await db.commit()
+
+            for id_usuario in cambiados:
+                self.invalidar(id_usuario)
+            corregidas += len(cambiados)
+            ultimo_id = ids[-1]
+
+        self.conciliaciones += 1
+        self.filas_corregidas += corregidas
+        return corregidas
+
+    async def _ciclo_conciliacion(self):
+        while True:
+            await asyncio.sleep(self.intervalo_conciliacion)
+            try:
+                corregidas = await self.conciliar()
+                if corregidas:
+                    logger.info(f"Contadores de no leídos conciliados: {corregidas} filas corregidas o creadas")
+            except Exception as e:
+                self.errores_conciliacion += 1
+                logger.error(f"Error al conciliar contadores de no leídos: {e}")
+
+    def iniciar(self) -> None:
+        """Arranca la conciliación periódica (llamar en el startup de la app)"""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._ciclo_conciliacion())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    def metricas(self) -> dict:
+        total = self.aciertos + self.fallos
+        return {
+            "entradas_cache": len(self._cache),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "respaldos_count": self.respaldos_count,
+            "ajustes": self.ajustes,
+            "filas_creadas": self.filas_creadas,
+            "conciliaciones": self.conciliaciones,
+            "filas_corregidas": self.filas_corregidas,
+            "errores_conciliacion": self.errores_conciliacion
+        }
+
+
+# Instancia global del proceso
+contadores_no_leidos = ContadoresNoLeidos()
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidar_tras_transaccion(session: Session) -> None:
+    # Una lectura entre el ajuste y el commit pudo cachear el valor anterior
+    for id_usuario in session.info.pop(_CLAVE_SESION, ()):
+        contadores_no_leidos.invalidar(id_usuario)
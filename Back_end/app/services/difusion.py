@@ -0,0 +1,458 @@
+"""
+Difusiones: envío masivo de un mensaje de WhatsApp a una audiencia.
+
+Mandar un mensaje por usuario en un bucle tardaría minutos y saturaría el
+microservicio. Una difusión:
+
+1. materializa la audiencia con un único INSERT ... SELECT en
+   difusion_destinatarios (estado "pendiente" por destinatario)
+2. reclama lotes de destinatarios con FOR UPDATE SKIP LOCKED, así varios
+   workers de uvicorn pueden repartirse la misma difusión sin duplicar envíos
+3. envía cada lote en paralelo, limitado por un semáforo (concurrencia) y un
+   token bucket (mensajes por segundo) compartidos por todas las difusiones
+   del proceso
+4. guarda el resultado del lote con un UPDATE executemany y suma los
+   contadores de la difusión
+
+Con el circuito de WhatsApp abierto se espera a que se pueda reintentar en
+vez de marcar a todos como fallidos, pero nunca más allá del plazo del lote
+(una fracción de DIFUSION_VISIBILIDAD): lo que no se alcanzó a enviar vuelve
+a "pendiente". Al cancelar o al apagar la app no se interrumpen los envíos
+en curso; se deja de enviar, se guarda lo hecho y el resto vuelve a
+"pendiente". Los resultados solo se guardan sobre filas que siguen
+reclamadas por este lote (mismo fecha_envio), así un lote que otro worker
+volvió a reclamar no se cuenta dos veces.
+
+Una difusión interrumpida (reinicio) se reanuda al arrancar: los
+destinatarios "enviando" de un worker caído vuelven a reclamarse tras
+DIFUSION_VISIBILIDAD segundos.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, update, insert, func, literal, or_, and_, cast, values, column, Integer, String, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import SessionLocal
+from models.difusion import Difusion, DifusionDestinatario
+from models.favorito import Favorito
+from models.usuario import Usuario
+from services.whatsapp import whatsapp_service
+from utils.circuito import CircuitoAbierto
+from utils.roles import ROL_ARRENDATARIO, ROL_ARRENDADOR, filtro_rol
+
+logger = logging.getLogger(__name__)
+
+DIFUSION_CONCURRENCIA = int(os.getenv("DIFUSION_CONCURRENCIA", "10"))
+DIFUSION_MENSAJES_POR_SEGUNDO = float(os.getenv("DIFUSION_MENSAJES_POR_SEGUNDO", "20"))
+DIFUSION_TAMANO_LOTE = int(os.getenv("DIFUSION_TAMANO_LOTE", "200"))
+DIFUSION_VISIBILIDAD = float(os.getenv("DIFUSION_VISIBILIDAD", "300"))
+# Fracción de la visibilidad que puede durar un lote; el resto es margen para guardar resultados
+DIFUSION_FRACCION_LOTE = 0.8
+# Segundos que el apagado espera a que los lotes en curso guarden lo enviado
+DIFUSION_ESPERA_DETENCION = float(os.getenv("DIFUSION_ESPERA_DETENCION", "30"))
+
+# Resultado de un destinatario al que no se llegó a enviar (vuelve a "pendiente")
+SIN_ENVIAR = object()
+
+
+class CuboTokens:
+    """Token bucket: ráfagas de hasta `capacidad` envíos y `tasa` envíos por segundo sostenidos"""
+
+    def __init__(self, tasa: float, capacidad: Optional[float] = None):
+        self.tasa = tasa
+        self.capacidad = capacidad or max(1.0, tasa)
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self) -> None:
+        # El lock mantiene el orden de llegada entre quienes esperan
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.tasa)
+
+
+def _consulta_audiencia(difusion: Difusion):
+    """SELECT de (id_difusion, id_usuario, telefono, estado) para el INSERT ... SELECT"""
+    consulta = (
+        select(
+            literal(difusion.id_difusion),
+            Usuario.id_usuario,
+            Usuario.num_celular,
+            literal("pendiente")
+        )
+        .where(Usuario.activo.isnot(False))
+    )
+    if difusion.audiencia == "favoritos_inmueble":
+        consulta = consulta.join(Favorito, Favorito.id_usuario == Usuario.id_usuario).where(
+            Favorito.id_inmueble == difusion.id_inmueble
+        )
+    elif difusion.audiencia == "arrendadores":
+        # Mismo predicado que el índice parcial ix_usuarios_arrendadores
+        consulta = consulta.where(filtro_rol(Usuario.roles_mask, ROL_ARRENDADOR))
+    elif difusion.audiencia == "arrendatarios":
+        consulta = consulta.where(filtro_rol(Usuario.roles_mask, ROL_ARRENDATARIO))
+    return consulta
+
+
+class Difusor:
+    """Ejecuta difusiones en segundo plano (una tarea por difusión en este proceso)"""
+
+    def __init__(
+        self,
+        concurrencia: int = DIFUSION_CONCURRENCIA,
+        mensajes_por_segundo: float = DIFUSION_MENSAJES_POR_SEGUNDO,
+        tamano_lote: int = DIFUSION_TAMANO_LOTE,
+    ):
+        self.concurrencia = concurrencia
+        self.tamano_lote = tamano_lote
+        self._semaforo = asyncio.Semaphore(concurrencia)
+        self._cubo = CuboTokens(mensajes_por_segundo)
+        self._tareas: Dict[int, asyncio.Task] = {}
+        # Difusiones canceladas en este proceso y apagado en curso: dejar de enviar
+        self._canceladas: Set[int] = set()
+        self._deteniendo = False
+
+        # Métricas
+        self.lotes = 0
+        self.mensajes_enviados = 0
+        self.mensajes_fallidos = 0
+        self.esperas_circuito = 0
+
+    # ---------- API del servicio ----------
+
+    async def crear(
+        self,
+        db: AsyncSession,
+        id_creador: int,
+        audiencia: str,
+        mensaje: str,
+        id_inmueble: Optional[int] = None,
+    ) -> Difusion:
+        """Registra la difusión y la lanza en segundo plano"""
+        difusion = Difusion(
+            id_creador=id_creador,
+            audiencia=audiencia,
+            id_inmueble=id_inmueble,
+            mensaje=mensaje,
+            estado="pendiente",
+            total_destinatarios=0,
+            enviados=0,
+            fallidos=0
+        )
+        db.add(difusion)
+        await db.commit()
+        await db.refresh(difusion)
+        self.iniciar(difusion.id_difusion)
+        return difusion
+
+    def iniciar(self, id_difusion: int) -> bool:
+        """Lanza (o reanuda) la difusión en este proceso. False si ya está corriendo aquí."""
+        self._canceladas.discard(id_difusion)
+        tarea = self._tareas.get(id_difusion)
+        if tarea is not None and not tarea.done():
+            return False
+        tarea = asyncio.create_task(self._ejecutar(id_difusion))
+        self._tareas[id_difusion] = tarea
+        tarea.add_done_callback(lambda _: self._tareas.pop(id_difusion, None))
+        return True
+
+    def _debe_parar(self, id_difusion: int) -> bool:
+        return self._deteniendo or id_difusion in self._canceladas
+
+    async def cancelar(self, db: AsyncSession, id_difusion: int) -> bool:
+        """Marca la difusión como cancelada.
+
+        Este proceso deja de enviar, guarda lo ya enviado y devuelve el resto a
+        "pendiente"; otros workers la abandonan al terminar su lote actual.
+        """
+        resultado = await db.execute(
+            update(Difusion)
+            .where(Difusion.id_difusion == id_difusion, Difusion.estado.in_(("pendiente", "en_curso")))
+            .values(estado="cancelada", fecha_fin=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if id_difusion in self._tareas:
+            # Sin cancelar la tarea: los envíos en vuelo terminan y se guardan
+            self._canceladas.add(id_difusion)
+        return (resultado.rowcount or 0) > 0
+
+    async def reintentar_fallidos(self, db: AsyncSession, id_difusion: int) -> Optional[int]:
+        """Devuelve a "pendiente" los destinatarios fallidos y relanza la difusión.
+
+        None si no existe o fue cancelada: sus destinatarios sin enviar siguen en
+        "pendiente" y relanzarla reanudaría toda la audiencia cancelada.
+        """
+        # Fila bloqueada: un cancelar concurrente espera a que termine el reintento
+        estado = (await db.execute(
+            select(Difusion.estado).where(Difusion.id_difusion == id_difusion).with_for_update()
+        )).scalar_one_or_none()
+        if estado is None or estado == "cancelada":
+            await db.rollback()
+            return None
+        resultado = await db.execute(
+            update(DifusionDestinatario)
+            .where(DifusionDestinatario.id_difusion == id_difusion, DifusionDestinatario.estado == "fallido")
+            .values(estado="pendiente", ultimo_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        reintentos = resultado.rowcount or 0
+        if reintentos:
+            await db.execute(
+                update(Difusion)
+                .where(Difusion.id_difusion == id_difusion)
+                .values(estado="en_curso", fallidos=Difusion.fallidos - reintentos, fecha_fin=None)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        if reintentos:
+            self.iniciar(id_difusion)
+        return reintentos
+
+    async def progreso(self, db: AsyncSession, id_difusion: int) -> Optional[dict]:
+        difusion = await db.get(Difusion, id_difusion)
+        if difusion is None:
+            return None
+        resultado = await db.execute(
+            select(DifusionDestinatario.estado, func.count())
+            .where(DifusionDestinatario.id_difusion == id_difusion)
+            .group_by(DifusionDestinatario.estado)
+        )
+        return {"difusion": difusion, "por_estado": {estado: cantidad for estado, cantidad in resultado.all()}}
+
+    async def reanudar_pendientes(self) -> int:
+        """Relanza las difusiones sin terminar (startup de la app)"""
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                select(Difusion.id_difusion).where(Difusion.estado.in_(("pendiente", "en_curso")))
+            )
+            ids = resultado.scalars().all()
+        for id_difusion in ids:
+            self.iniciar(id_difusion)
+        return len(ids)
+
+    async def detener(self) -> None:
+        """Detiene las tareas locales guardando lo enviado; la difusión sigue "en_curso" y se reanuda al arrancar"""
+        self._deteniendo = True
+        tareas = list(self._tareas.values())
+        if not tareas:
+            return
+        _, pendientes = await asyncio.wait(tareas, timeout=DIFUSION_ESPERA_DETENCION)
+        # Último recurso: sus filas "enviando" se reclaman tras DIFUSION_VISIBILIDAD
+        for tarea in pendientes:
+            tarea.cancel()
+        for tarea in pendientes:
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+
+    # ---------- ejecución ----------
+
+    async def _materializar(self, id_difusion: int) -> None:
+        """Solo un worker gana el paso pendiente -> en_curso e inserta los destinatarios"""
+        async with SessionLocal() as db:
+            difusion = (await db.execute(
+                select(Difusion).where(Difusion.id_difusion == id_difusion, Difusion.estado == "pendiente")
+                .with_for_update(skip_locked=True)
+            )).scalar_one_or_none()
+            if difusion is None:
+                return
+            resultado = await db.execute(
+                insert(DifusionDestinatario).from_select(
+                    ["id_difusion", "id_usuario", "telefono", "estado"],
+                    _consulta_audiencia(difusion)
+                )
+            )
+            difusion.total_destinatarios = resultado.rowcount or 0
+            difusion.estado = "en_curso"
+            difusion.fecha_inicio = datetime.now()
+            await db.commit()
+            logger.info(f"Difusión {id_difusion}: {difusion.total_destinatarios} destinatarios ({difusion.audiencia})")
+
+    async def _reclamar_lote(self, id_difusion: int) -> Tuple[datetime, List[dict]]:
+        """Devuelve la marca del reclamo (fecha_envio de las filas) y los destinatarios reclamados"""
+        ahora = datetime.now()
+        tabla = DifusionDestinatario
+        siguientes = (
+            select(tabla.id_usuario)
+            .where(
+                tabla.id_difusion == id_difusion,
+                or_(
+                    tabla.estado == "pendiente",
+                    and_(tabla.estado == "enviando", tabla.fecha_envio < ahora - timedelta(seconds=DIFUSION_VISIBILIDAD))
+                )
+            )
+            .order_by(tabla.id_usuario)
+            .limit(self.tamano_lote)
+            .with_for_update(skip_locked=True)
+        )
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                update(tabla)
+                .where(tabla.id_difusion == id_difusion, tabla.id_usuario.in_(siguientes))
+                # Mientras está "enviando", fecha_envio guarda cuándo se reclamó
+                .values(estado="enviando", fecha_envio=ahora)
+                .returning(tabla.id_usuario, tabla.telefono)
+                .execution_options(synchronize_session=False)
+            )
+            filas = [dict(fila) for fila in resultado.mappings().all()]
+            await db.commit()
+        return ahora, filas
+
+    async def _enviar(self, id_difusion: int, telefono: str, mensaje: str, limite: float):
+        """None si se envió, el error si falló o SIN_ENVIAR si hubo que parar o se agotó el plazo del lote
+
+        limite: instante (time.monotonic) a partir del cual ya no se envía.
+        """
+        async with self._semaforo:
+            while True:
+                if self._debe_parar(id_difusion) or time.monotonic() >= limite:
+                    return SIN_ENVIAR
+                await self._cubo.adquirir()
+                if self._debe_parar(id_difusion) or time.monotonic() >= limite:
+                    return SIN_ENVIAR
+                try:
+                    await whatsapp_service.send_message(telefono, mensaje)
+                    return None
+                except CircuitoAbierto as e:
+                    # Microservicio caído: esperar en vez de marcar fallidos a todos, sin pasar el plazo
+                    self.esperas_circuito += 1
+                    fin = min(time.monotonic() + max(1.0, e.retry_after), limite)
+                    # Por tramos para atender enseguida una cancelación o el apagado
+                    while not self._debe_parar(id_difusion) and time.monotonic() < fin:
+                        await asyncio.sleep(min(1.0, fin - time.monotonic()))
+                except Exception as e:
+                    return f"{e.__class__.__name__}: {e}"[:255]
+
+    async def _guardar_resultados(
+        self, id_difusion: int, reclamo: datetime, filas: List[dict], errores: List
+    ) -> None:
+        """Guarda el lote en un solo UPDATE ... FROM (VALUES ...) y suma a los contadores lo realmente actualizado"""
+        tabla = DifusionDestinatario.__table__
+        ahora = datetime.now()
+        resultados = values(
+            column("id_usuario", Integer),
+            column("estado", String),
+            column("ultimo_error", String),
+            column("fecha_envio", DateTime),
+            name="resultados"
+        ).data([
+            (fila["id_usuario"], "pendiente", None, None) if error is SIN_ENVIAR
+            else (fila["id_usuario"], "fallido", error, None) if error
+            else (fila["id_usuario"], "enviado", None, ahora)
+            for fila, error in zip(filas, errores)
+        ])
+        async with SessionLocal() as db:
+            # Solo filas aún reclamadas por este lote: si otro worker las reclamó, cuenta él
+            resultado = await db.execute(
+                update(tabla)
+                .where(
+                    tabla.c.id_difusion == id_difusion,
+                    tabla.c.id_usuario == resultados.c.id_usuario,
+                    tabla.c.estado == "enviando",
+                    tabla.c.fecha_envio == reclamo
+                )
+                .values(
+                    estado=resultados.c.estado,
+                    ultimo_error=resultados.c.ultimo_error,
+                    # Si todo el lote falló la columna es solo NULL y Postgres la toma como text
+                    fecha_envio=cast(resultados.c.fecha_envio, DateTime)
+                )
+                .returning(tabla.c.estado)
+            )
+            estados = resultado.scalars().all()
+            enviados = estados.count("enviado")
+            fallidos = estados.count("fallido")
+            if enviados or fallidos:
+                await db.execute(
+                    update(Difusion)
+                    .where(Difusion.id_difusion == id_difusion)
+                    .values(enviados=Difusion.enviados + enviados, fallidos=Difusion.fallidos + fallidos)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        self.mensajes_enviados += enviados
+        self.mensajes_fallidos += fallidos
+
+    async def _finalizar_si_completa(self, id_difusion: int) -> None:
+        async with SessionLocal() as db:
+            restantes = (await db.execute(
+                select(func.count()).select_from(DifusionDestinatario).where(
+                    DifusionDestinatario.id_difusion == id_difusion,
+                    DifusionDestinatario.estado.in_(("pendiente", "enviando"))
+                )
+            )).scalar_one()
+            # Si quedan "enviando" de otro worker, él cierra la difusión
+            if restantes == 0:
+                await db.execute(
+                    update(Difusion)
+                    .where(Difusion.id_difusion == id_difusion, Difusion.estado == "en_curso")
+                    .values(estado="completada", fecha_fin=datetime.now())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+
+    async def _ejecutar(self, id_difusion: int) -> None:
+        try:
+            await self._materializar(id_difusion)
+            while True:
+                async with SessionLocal() as db:
+                    difusion = await db.get(Difusion, id_difusion)
+                if difusion is None or difusion.estado != "en_curso":
+                    return
+
+                if self._debe_parar(id_difusion):
+                    return
+                reclamo, filas = await self._reclamar_lote(id_difusion)
+                if not filas:
+                    await self._finalizar_si_completa(id_difusion)
+                    return
+
+                # El lote debe guardarse antes de que otro worker pueda volver a reclamarlo
+                limite = time.monotonic() + DIFUSION_VISIBILIDAD * DIFUSION_FRACCION_LOTE
+                errores = await asyncio.gather(*(
+                    self._enviar(id_difusion, fila["telefono"], difusion.mensaje, limite) for fila in filas
+                ))
+                await self._guardar_resultados(id_difusion, reclamo, filas, errores)
+                self.lotes += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error en la difusión {id_difusion}: {e}")
+            async with SessionLocal() as db:
+                await db.execute(
+                    update(Difusion)
+                    .where(Difusion.id_difusion == id_difusion)
+                    .values(estado="error", ultimo_error=str(e)[:255], fecha_fin=datetime.now())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+
+    def metricas(self) -> dict:
+        return {
+            "difusiones_activas": len([tarea for tarea in self._tareas.values() if not tarea.done()]),
+            "concurrencia": self.concurrencia,
+            "mensajes_por_segundo": self._cubo.tasa,
+            "lotes": self.lotes,
+            "mensajes_enviados": self.mensajes_enviados,
+            "mensajes_fallidos": self.mensajes_fallidos,
+            "esperas_circuito": self.esperas_circuito
+        }
+
+
+# Instancia compartida por toda la aplicación
+difusor = Difusor()
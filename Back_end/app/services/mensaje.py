@@ -0,0 +1,212 @@
+"""
+Consultas de mensajería entre usuarios.
+
+La bandeja devuelve una fila por conversación (el otro usuario) con el último
+mensaje y los no leídos, en vez de todos los mensajes del usuario:
+
+1. una función de ventana numera los mensajes de cada conversación del más
+   reciente al más antiguo y se queda con el primero
+2. la página se corta por id_mensaje del último mensaje (keyset): id_mensaje es
+   creciente, así que ordenar por id equivale a ordenar por fecha_envio y el
+   cursor no se desplaza si llegan mensajes nuevos mientras se pagina
+3. los no leídos se cuentan solo para las conversaciones de la página, con el
+   índice parcial ix_mensajes_no_leidos
+
+El historial de una conversación se pagina hacia atrás con el mismo cursor
+(antes=id_mensaje) sobre ix_mensajes_conversacion, que indexa el par de
+usuarios sin orden (LEAST, GREATEST): abrir un chat lee solo la última
+página, sin importar lo largo que sea el historial.
+
+Los mensajes nuevos se publican en el bus de eventos (services/pubsub.py)
+para entregarlos por WebSocket sin que el cliente consulte el hilo.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, func, case, or_, and_, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.mensaje import Mensaje, ESTADO_LEIDO
+from models.usuario import Usuario
+from schemas.mensaje import MensajeOut
+from services.contadores_no_leidos import contadores_no_leidos
+from services.pubsub import bus_eventos, canal_usuario
+
+# Literal (no parámetro) para que el planner pueda usar el índice parcial
+NO_LEIDO = Mensaje.estado_mensaje != literal_column(f"'{ESTADO_LEIDO}'")
+
+
+def filtro_conversacion(id_usuario: int, otro_usuario: int):
+    """Mensajes entre dos usuarios, en la forma que usa ix_mensajes_conversacion"""
+    return and_(
+        func.least(Mensaje.id_remitente, Mensaje.id_destinatario) == min(id_usuario, otro_usuario),
+        func.greatest(Mensaje.id_remitente, Mensaje.id_destinatario) == max(id_usuario, otro_usuario)
+    )
+
+
+async def historial(
+    db: AsyncSession, id_usuario: int, otro_usuario: int, antes: Optional[int] = None, limite: int = 50
+) -> Tuple[List[Mensaje], bool]:
+    """Página de mensajes entre dos usuarios en orden cronológico y si hay más antiguos.
+
+    Sin cursor devuelve los más recientes; antes: id_mensaje del mensaje más
+    antiguo ya cargado.
+    """
+    stmt = (
+        select(Mensaje)
+        .where(filtro_conversacion(id_usuario, otro_usuario))
+        .order_by(Mensaje.id_mensaje.desc())
+        .limit(limite + 1)
+    )
+    if antes is not None:
+        stmt = stmt.where(Mensaje.id_mensaje < antes)
+    mensajes = list((await db.execute(stmt)).scalars().all())
+    hay_mas = len(mensajes) > limite
+    mensajes = mensajes[:limite]
+    mensajes.reverse()
+    return mensajes, hay_mas
+
+
+async def bandeja(db: AsyncSession, id_usuario: int, antes: Optional[int] = None, limite: int = 20) -> List[Dict]:
+    """Conversaciones del usuario, de la más reciente a la más antigua.
+
+    antes: id_mensaje del último mensaje de la conversación anterior (cursor).
+    """
+    otro = case(
+        (Mensaje.id_remitente == id_usuario, Mensaje.id_destinatario),
+        else_=Mensaje.id_remitente
+    )
+    numerados = (
+        select(
+            Mensaje.id_mensaje,
+            otro.label("id_otro_usuario"),
+            func.row_number().over(partition_by=otro, order_by=Mensaje.id_mensaje.desc()).label("fila")
+        )
+        .where(or_(Mensaje.id_remitente == id_usuario, Mensaje.id_destinatario == id_usuario))
+        .subquery()
+    )
+
+    stmt = (
+        select(Mensaje, numerados.c.id_otro_usuario, Usuario.nombres, Usuario.apellido_paterno)
+        .join(numerados, Mensaje.id_mensaje == numerados.c.id_mensaje)
+        .join(Usuario, Usuario.id_usuario == numerados.c.id_otro_usuario)
+        .where(numerados.c.fila == 1)
+        .order_by(Mensaje.id_mensaje.desc())
+        .limit(limite)
+    )
+    if antes is not None:
+        stmt = stmt.where(Mensaje.id_mensaje < antes)
+    filas = (await db.execute(stmt)).all()
+    if not filas:
+        return []
+
+    otros = [fila.id_otro_usuario for fila in filas]
+    no_leidos = dict((await db.execute(
+        select(Mensaje.id_remitente, func.count())
+        .where(
+            Mensaje.id_destinatario == id_usuario,
+            Mensaje.id_remitente.in_(otros),
+            NO_LEIDO
+        )
+        .group_by(Mensaje.id_remitente)
+    )).all())
+
+    return [
+        {
+            "id_otro_usuario": fila.id_otro_usuario,
+            "nombres": fila.nombres,
+            "apellido_paterno": fila.apellido_paterno,
+            "ultimo_mensaje": fila.Mensaje,
+            "no_leidos": no_leidos.get(fila.id_otro_usuario, 0)
+        }
+        for fila in filas
+    ]
+
+
+async def contar_no_leidos(db: AsyncSession, id_usuario: int, otro_usuario: Optional[int] = None) -> int:
+    """Mensajes recibidos sin leer: en total desde el contador (O(1)) o de una conversación con COUNT"""
+    if otro_usuario is None:
+        return (await contadores_no_leidos.obtener(db, id_usuario))["mensajes"]
+    stmt = select(func.count()).select_from(Mensaje).where(
+        Mensaje.id_destinatario == id_usuario, Mensaje.id_remitente == otro_usuario, NO_LEIDO
+    )
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def marcar_leidos(db: AsyncSession, id_usuario: int, otro_usuario: int, hasta: Optional[int] = None) -> Dict:
+    """Marca como leídos, en un solo UPDATE, los mensajes de otro_usuario recibidos hasta el cursor.
+
+    hasta: id_mensaje del último mensaje visto (incluido); sin cursor, todos.
+    Hace commit y avisa por el bus a ambos usuarios.
+    """
+    stmt = (
+        update(Mensaje)
+        .where(Mensaje.id_destinatario == id_usuario, Mensaje.id_remitente == otro_usuario, NO_LEIDO)
+        .values(estado_mensaje=ESTADO_LEIDO)
+        .execution_options(synchronize_session=False)
+    )
+    if hasta is not None:
+        stmt = stmt.where(Mensaje.id_mensaje <= hasta)
+    marcados = (await db.execute(stmt)).rowcount
+    await contadores_no_leidos.ajustar(db, id_usuario, mensajes=-marcados)
+    await db.commit()
+
+    resultado = {
+        "marcados": marcados,
+        "no_leidos_conversacion": await contar_no_leidos(db, id_usuario, otro_usuario),
+        "no_leidos_total": await contar_no_leidos(db, id_usuario)
+    }
+    if marcados:
+        # El lector actualiza sus contadores en otros dispositivos; el remitente ve la confirmación de lectura
+        evento = {"tipo": "leidos", "id_lector": id_usuario, "id_remitente": otro_usuario, "hasta": hasta, **resultado}
+        await bus_eventos.publicar(canal_usuario(id_usuario), evento)
+        await bus_eventos.publicar(canal_usuario(otro_usuario), {
+            "tipo": "leidos", "id_lector": id_usuario, "id_remitente": otro_usuario, "hasta": hasta
+        })
+    return resultado
+
+
+async def guardar_mensaje(db: AsyncSession, mensaje: Mensaje) -> Mensaje:
+    """Inserta el mensaje y suma el no leído del destinatario en la misma transacción"""
+    db.add(mensaje)
+    if (mensaje.estado_mensaje or "enviado") != ESTADO_LEIDO:
+        await contadores_no_leidos.ajustar(db, mensaje.id_destinatario, mensajes=1)
+    await db.commit()
+    await db.refresh(mensaje)
+    return mensaje
+
+
+async def cambiar_estado(db: AsyncSession, id_mensaje: int, estado: str) -> None:
+    """Cambia el estado de un mensaje y ajusta el contador si pasa entre leído y no leído.
+
+    El estado anterior se lee con la fila bloqueada en el mismo UPDATE (no del
+    objeto en memoria): dos cambios concurrentes no pueden aplicar el mismo delta.
+    """
+    anterior = (
+        select(Mensaje.id_mensaje, Mensaje.id_destinatario, Mensaje.estado_mensaje)
+        .where(Mensaje.id_mensaje == id_mensaje)
+        .with_for_update()
+        .subquery()
+    )
+    fila = (await db.execute(
+        update(Mensaje)
+        .where(Mensaje.id_mensaje == anterior.c.id_mensaje, Mensaje.estado_mensaje.is_distinct_from(estado))
+        .values(estado_mensaje=estado)
+        .returning(anterior.c.id_destinatario, anterior.c.estado_mensaje)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if fila is not None:
+        delta = (estado != ESTADO_LEIDO) - ((fila.estado_mensaje or "enviado") != ESTADO_LEIDO)
+        await contadores_no_leidos.ajustar(db, fila.id_destinatario, mensajes=delta)
+    await db.commit()
+
+
+def evento_mensaje(mensaje: Mensaje) -> dict:
+    return {"tipo": "mensaje", "mensaje": MensajeOut.model_validate(mensaje).model_dump(mode="json")}
+
+async def publicar_mensaje(mensaje: Mensaje) -> None:
+    """Empuja el mensaje a las conexiones abiertas del destinatario y del remitente (otros dispositivos)"""
+    evento = evento_mensaje(mensaje)
+    await bus_eventos.publicar(canal_usuario(mensaje.id_destinatario), evento)
+    if mensaje.id_remitente != mensaje.id_destinatario:
+        await bus_eventos.publicar(canal_usuario(mensaje.id_remitente), evento)
@@ -0,0 +1,255 @@
+"""
+Migración por lotes de contraseñas en texto plano a bcrypt.
+
+Reemplaza el antiguo /auth/corregir-passwords, que cargaba todos los
+usuarios en memoria y hacía un UPDATE por usuario dentro de una sola
+petición. El trabajo:
+
+- recorre usuarios por lotes con paginación keyset (id_usuario > último id)
+  filtrando solo contraseñas sin hashear
+- hashea cada lote en un pool de procesos que usa todos los núcleos, sin
+  bloquear el event loop ni competir por el GIL con la API. Los procesos se
+  crean con "spawn": un fork del worker de la API copiaría su event loop,
+  conexiones abiertas e hilos (p. ej. el pool de bcrypt) en estado inconsistente
+- escribe cada lote con un UPDATE executemany (solo si la contraseña no
+  cambió mientras tanto)
+- guarda un checkpoint (último id procesado) tras cada lote para poder
+  reanudar; como solo se seleccionan contraseñas sin hashear, repetir un
+  lote es inofensivo
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, update, func, bindparam, or_, not_
+
+from db.database import SessionLocal
+from models.usuario import Usuario
+from utils.security.seguridad import hashear_password
+from utils.security.cache_usuarios import invalidar_usuario
+
+logger = logging.getLogger(__name__)
+
+MIGRACION_TAMANO_LOTE = int(os.getenv("MIGRACION_PASSWORDS_LOTE", "1000"))
+MIGRACION_PROCESOS = int(os.getenv("MIGRACION_PASSWORDS_PROCESOS", str(os.cpu_count() or 1)))
+MIGRACION_CHECKPOINT = os.getenv("MIGRACION_PASSWORDS_CHECKPOINT", "migracion_passwords.checkpoint.json")
+
+# Prefijos de hash bcrypt (ver es_password_hasheada)
+_PREFIJOS_BCRYPT = ("$2a$", "$2b$", "$2x$", "$2y$")
+
+
+def _hashear_lote(passwords: List[str]) -> List[str]:
+    """Se ejecuta en un proceso hijo: hashea una porción del lote"""
+    return [hashear_password(password) for password in passwords]
+
+
+def _filtro_sin_hashear():
+    es_bcrypt = or_(*(Usuario.password.startswith(prefijo) for prefijo in _PREFIJOS_BCRYPT))
+    return or_(not_(es_bcrypt), func.length(Usuario.password) != 60)
+
+
+class MigracionPasswords:
+    """Trabajo en segundo plano con progreso consultable (una ejecución a la vez por proceso)"""
+
+    def __init__(
+        self,
+        tamano_lote: int = MIGRACION_TAMANO_LOTE,
+        procesos: int = MIGRACION_PROCESOS,
+        ruta_checkpoint: str = MIGRACION_CHECKPOINT,
+    ):
+        self.tamano_lote = tamano_lote
+        self.procesos = max(1, procesos)
+        self.ruta_checkpoint = ruta_checkpoint
+        self._tarea: Optional[asyncio.Task] = None
+        self._reiniciar_estado()
+
+    def _reiniciar_estado(self) -> None:
+        self.estado = "inactiva"
+        self.ultimo_id = 0
+        self.pendientes_inicio = 0
+        self.procesados = 0
+        self.migrados = 0
+        self.omitidos = 0
+        self.lotes = 0
+        self.inicio: Optional[float] = None
+        self.fecha_inicio: Optional[datetime] = None
+        self.fecha_fin: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    # ---------- checkpoint ----------
+
+    def _leer_checkpoint(self) -> int:
+        try:
+            with open(self.ruta_checkpoint, "r", encoding="utf-8") as archivo:
+                return int(json.load(archivo).get("ultimo_id", 0))
+        except (FileNotFoundError, ValueError, json.JSONDecodeError):
+            return 0
+
+    def _guardar_checkpoint(self) -> None:
+        temporal = f"{self.ruta_checkpoint}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"ultimo_id": self.ultimo_id, "fecha": datetime.now().isoformat()}, archivo)
+        os.replace(temporal, self.ruta_checkpoint)
+
+    def _borrar_checkpoint(self) -> None:
+        try:
+            os.remove(self.ruta_checkpoint)
+        except FileNotFoundError:
+            pass
+
+    # ---------- ejecución ----------
+
+    @property
+    def en_curso(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    def iniciar(self, reanudar: bool = True) -> bool:
+        """Lanza la migración en segundo plano. False si ya hay una en curso."""
+        if self.en_curso:
+            return False
+        self._tarea = asyncio.create_task(self.ejecutar(reanudar=reanudar))
+        return True
+
+    async def detener(self) -> None:
+        """Cancela la migración; el checkpoint permite reanudarla después"""
+        if self.en_curso:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+
+    async def _contar_pendientes(self) -> int:
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                select(func.count()).select_from(Usuario)
+                .where(Usuario.id_usuario > self.ultimo_id, _filtro_sin_hashear())
+            )
+            return resultado.scalar_one()
+
+    async def _leer_lote(self) -> List[Tuple[int, str]]:
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                select(Usuario.id_usuario, Usuario.password)
+                .where(Usuario.id_usuario > self.ultimo_id, _filtro_sin_hashear())
+                .order_by(Usuario.id_usuario)
+                .limit(self.tamano_lote)
+            )
+            return [tuple(fila) for fila in resultado.all()]
+
+    async def _hashear(self, pool: ProcessPoolExecutor, passwords: List[str]) -> List[str]:
+        # Una porción por proceso: menos serialización que enviar contraseña por contraseña
+        loop = asyncio.get_running_loop()
+        tamano = -(-len(passwords) // self.procesos)
+        porciones = [passwords[i:i + tamano] for i in range(0, len(passwords), tamano)]
+        resultados = await asyncio.gather(*(loop.run_in_executor(pool, _hashear_lote, porcion) for porcion in porciones))
+        return [hash_ for porcion in resultados for hash_ in porcion]
+
+    async def _escribir_lote(self, filas: List[Tuple[int, str]], hashes: List[str]) -> int:
+        tabla = Usuario.__table__
+        sentencia = (
+            update(tabla)
+            .where(tabla.c.id_usuario == bindparam("b_id"), tabla.c.password == bindparam("b_anterior"))
+            .values(password=bindparam("b_nuevo"))
+        )
+        parametros = [
+            {"b_id": id_usuario, "b_anterior": anterior, "b_nuevo": nuevo}
+            for (id_usuario, anterior), nuevo in zip(filas, hashes)
+        ]
+        async with SessionLocal() as db:
+            resultado = await db.execute(sentencia, parametros)
+            await db.commit()
+        # rowcount de executemany no es fiable en todos los drivers
+        return resultado.rowcount if resultado.rowcount is not None and resultado.rowcount >= 0 else len(filas)
+
+    async def ejecutar(self, reanudar: bool = True) -> dict:
+        """Ejecuta la migración completa (en primer plano). Devuelve el progreso final."""
+        self._reiniciar_estado()
+        self.estado = "en_curso"
+        self.inicio = time.perf_counter()
+        self.fecha_inicio = datetime.now()
+        self.ultimo_id = self._leer_checkpoint() if reanudar else 0
+        if self.ultimo_id:
+            logger.info(f"Migración de contraseñas: reanudando desde id_usuario > {self.ultimo_id}")
+
+        try:
+            self.pendientes_inicio = await self._contar_pendientes()
+            pool = ProcessPoolExecutor(max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                while True:
+                    filas = await self._leer_lote()
+                    if not filas:
+                        break
+
+                    hashes = await self._hashear(pool, [password for _, password in filas])
+                    actualizados = await self._escribir_lote(filas, hashes)
+
+                    for id_usuario, _ in filas:
+                        invalidar_usuario(id_usuario)
+                    self.ultimo_id = filas[-1][0]
+                    self.procesados += len(filas)
+                    self.migrados += actualizados
+                    self.omitidos += len(filas) - actualizados
+                    self.lotes += 1
+                    self._guardar_checkpoint()
+
+                    progreso = self.progreso()
+                    logger.info(
+                        f"Migración de contraseñas: {progreso['procesados']}/{progreso['pendientes_inicio']} "
+                        f"({progreso['porcentaje']}%), {progreso['usuarios_por_segundo']} usuarios/s"
+                    )
+            finally:
+                # Sin bloquear el event loop (un `with` esperaría a los procesos);
+                # al cancelar se descartan las porciones aún no iniciadas
+                await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: pool.shutdown(wait=False, cancel_futures=True)
+                )
+
+            self.estado = "completada"
+            self._borrar_checkpoint()
+        except asyncio.CancelledError:
+            self.estado = "cancelada"
+            raise
+        except Exception as e:
+            self.estado = "error"
+            self.error = str(e)
+            logger.error(f"Error en la migración de contraseñas (reanudable desde {self.ultimo_id}): {e}")
+        finally:
+            self.fecha_fin = datetime.now()
+
+        return self.progreso()
+
+    def progreso(self) -> dict:
+        transcurrido = (time.perf_counter() - self.inicio) if self.inicio else 0.0
+        if self.fecha_fin and self.fecha_inicio:
+            transcurrido = (self.fecha_fin - self.fecha_inicio).total_seconds()
+        velocidad = self.procesados / transcurrido if transcurrido > 0 else 0.0
+        restantes = max(0, self.pendientes_inicio - self.procesados)
+        return {
+            "estado": self.estado,
+            "pendientes_inicio": self.pendientes_inicio,
+            "procesados": self.procesados,
+            "migrados": self.migrados,
+            "omitidos": self.omitidos,
+            "lotes": self.lotes,
+            "ultimo_id": self.ultimo_id,
+            "porcentaje": round(self.procesados * 100 / self.pendientes_inicio, 2) if self.pendientes_inicio else 100.0,
+            "usuarios_por_segundo": round(velocidad, 1),
+            "eta_segundos": round(restantes / velocidad, 1) if velocidad and self.estado == "en_curso" else None,
+            "procesos": self.procesos,
+            "tamano_lote": self.tamano_lote,
+            "fecha_inicio": self.fecha_inicio,
+            "fecha_fin": self.fecha_fin,
+            "error": self.error
+        }
+
+
+# Instancia compartida por toda la aplicación
+migracion_passwords = MigracionPasswords()
@@ -0,0 +1,156 @@
+"""
+Notificaciones en tiempo real con Server-Sent Events.
+
+En vez de consultar GET /notificaciones/ y el conteo de no leídas cada pocos
+segundos, el cliente abre GET /notificaciones/stream (EventSource) y recibe:
+
+- event: notificacion  (id = id_notificacion) por cada notificación nueva
+- event: no_leidas     con el conteo actualizado cuando cambia
+
+Los eventos llegan por el bus en proceso (services/pubsub.py), así que una
+conexión abierta no consulta la BD salvo al conectarse. Al reconectar,
+EventSource envía Last-Event-ID y se reenvían las notificaciones posteriores
+a ese id. Un comentario periódico (heartbeat) mantiene viva la conexión a
+través de proxies y detecta clientes caídos.
+
+Toda notificación debe crearse con crear_notificacion() y cambiar de estado
+con marcar_notificacion(): ajustan el contador de no leídas en la misma
+transacción y avisan a las conexiones abiertas. Hoy el único productor es
+POST /notificaciones/ (administradores); una fila insertada por otra vía no
+se empuja por SSE y deja el contador desfasado hasta la siguiente
+conciliación (services/contadores_no_leidos.py).
+"""
+
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import SessionLocal
+from models.notificacion import Notificacion
+from schemas.notificacion import NotificacionOut
+from services.contadores_no_leidos import contadores_no_leidos, NOTIFICACION_NO_LEIDA as NO_LEIDA
+from services.pubsub import bus_eventos, canal_notificaciones
+
+NOTIFICACIONES_HEARTBEAT_SEGUNDOS = float(os.getenv("NOTIFICACIONES_HEARTBEAT", "15"))
+# Notificaciones perdidas que se reenvían como máximo al reconectar
+NOTIFICACIONES_MAX_REENVIO = int(os.getenv("NOTIFICACIONES_MAX_REENVIO", "100"))
+# Espera sugerida al cliente antes de reconectar (milisegundos)
+NOTIFICACIONES_RETRY_MS = int(os.getenv("NOTIFICACIONES_RETRY_MS", "3000"))
+
+
+async def contar_no_leidas(db: AsyncSession, id_usuario: int) -> int:
+    """Lectura O(1) del contador (services/contadores_no_leidos.py)"""
+    return (await contadores_no_leidos.obtener(db, id_usuario))["notificaciones"]
+
+def _evento_notificacion(notificacion: Notificacion) -> dict:
+    return {
+        "tipo": "notificacion",
+        "id": notificacion.id_notificacion,
+        "notificacion": NotificacionOut.model_validate(notificacion).model_dump(mode="json")
+    }
+
+async def publicar_no_leidas(db: AsyncSession, id_usuario: int) -> None:
+    """Avisa a las conexiones abiertas del usuario el nuevo conteo de no leídas"""
+    no_leidas = await contar_no_leidas(db, id_usuario)
+    await bus_eventos.publicar(canal_notificaciones(id_usuario), {"tipo": "no_leidas", "count": no_leidas})
+
+async def crear_notificacion(db: AsyncSession, id_usuario: int, mensaje: str) -> Notificacion:
+    """Guarda la notificación (con commit) y la empuja a las conexiones abiertas del usuario"""
+    notificacion = Notificacion(id_usuario=id_usuario, mensaje=mensaje)
+    db.add(notificacion)
+    await contadores_no_leidos.ajustar(db, id_usuario, notificaciones=1)
+    await db.commit()
+    await db.refresh(notificacion)
+
+    await bus_eventos.publicar(canal_notificaciones(id_usuario), _evento_notificacion(notificacion))
+    await publicar_no_leidas(db, id_usuario)
+    return notificacion
+
+async def marcar_notificacion(db: AsyncSession, id_notificacion: int, id_usuario: int, estado: str) -> Optional[Notificacion]:
+    """Cambia el estado de una notificación del usuario (con commit); None si no existe o es de otro usuario.
+
+    Como cambiar_estado de mensajes, el estado anterior se lee con la fila
+    bloqueada en el mismo UPDATE para que el delta del contador sea exacto.
+    """
+    anterior = (
+        select(Notificacion.id_notificacion, Notificacion.estado_notificacion)
+        .where(Notificacion.id_notificacion == id_notificacion, Notificacion.id_usuario == id_usuario)
+        .with_for_update()
+        .subquery()
+    )
+    fila = (await db.execute(
+        update(Notificacion)
+        .where(
+            Notificacion.id_notificacion == anterior.c.id_notificacion,
+            Notificacion.estado_notificacion.is_distinct_from(estado)
+        )
+        .values(estado_notificacion=estado)
+        .returning(anterior.c.estado_notificacion)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if fila is not None:
+        delta = (estado == NO_LEIDA) - (fila.estado_notificacion == NO_LEIDA)
+        await contadores_no_leidos.ajustar(db, id_usuario, notificaciones=delta)
+    await db.commit()
+
+    notificacion = (await db.execute(
+        select(Notificacion)
+        .where(Notificacion.id_notificacion == id_notificacion, Notificacion.id_usuario == id_usuario)
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+    if notificacion is not None and fila is not None:
+        await publicar_no_leidas(db, id_usuario)
+    return notificacion
+
+
+def _formato_sse(evento: dict) -> str:
+    id_linea = f"id: {evento['id']}\n" if evento.get("id") is not None else ""
+    return f"{id_linea}event: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+
+async def flujo_notificaciones(id_usuario: int, ultimo_id: Optional[int] = None) -> AsyncIterator[str]:
+    """Generador SSE de un usuario; termina cuando el cliente se desconecta"""
+    # Suscribirse antes de leer lo pendiente para no perder nada entre ambos pasos
+    suscripcion = bus_eventos.suscribir(canal_notificaciones(id_usuario))
+    try:
+        yield f"retry: {NOTIFICACIONES_RETRY_MS}\n\n"
+
+        # Sesión corta: la conexión SSE no retiene una conexión del pool
+        async with SessionLocal() as db:
+            pendientes = []
+            if ultimo_id is not None:
+                result = await db.execute(
+                    select(Notificacion)
+                    .where(Notificacion.id_usuario == id_usuario, Notificacion.id_notificacion > ultimo_id)
+                    .order_by(Notificacion.id_notificacion)
+                    .limit(NOTIFICACIONES_MAX_REENVIO)
+                )
+                pendientes = result.scalars().all()
+            no_leidas = await contar_no_leidas(db, id_usuario)
+
+        enviado_hasta = ultimo_id or 0
+        for notificacion in pendientes:
+            yield _formato_sse(_evento_notificacion(notificacion))
+            enviado_hasta = notificacion.id_notificacion
+        yield _formato_sse({"tipo": "no_leidas", "count": no_leidas})
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(suscripcion.recibir(), NOTIFICACIONES_HEARTBEAT_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if evento is None:
+                # Cierre del servidor o cliente que no consume: reconectará con Last-Event-ID
+                break
+            if evento["tipo"] == "notificacion":
+                # Ya reenviada al reconectar
+                if evento["id"] <= enviado_hasta:
+                    continue
+                enviado_hasta = evento["id"]
+            yield _formato_sse(evento)
+    finally:
+        bus_eventos.cancelar(suscripcion)
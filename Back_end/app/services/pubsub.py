@@ -0,0 +1,201 @@
+"""
+Pub/sub en proceso para empujar eventos a clientes conectados (WebSocket, SSE).
+
+Cada conexión se suscribe a un canal (p. ej. "usuario:42") y recibe los
+eventos en su propia cola acotada; publicar es un reparto en memoria a los
+suscriptores del canal, sin tocar la BD. Una conexión lenta que llena su
+cola se desconecta (el cliente reconecta y se resincroniza con los
+endpoints paginados) en vez de hacer crecer la memoria o frenar al resto.
+
+Con varios workers de uvicorn, un usuario puede estar conectado a un worker
+distinto del que atendió el POST. PUBSUB_POSTGRES=true activa un puente con
+LISTEN/NOTIFY: cada worker reparte localmente y además hace NOTIFY; los
+demás reciben la notificación y la reparten a sus suscriptores (el origen
+ignora la suya). El puente reconecta solo si se cae la conexión.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_POSTGRES = os.getenv("PUBSUB_POSTGRES", "false").lower() == "true"
+PUBSUB_CANAL_POSTGRES = os.getenv("PUBSUB_CANAL_POSTGRES", "ubikha_eventos")
+PUBSUB_MAX_COLA = int(os.getenv("PUBSUB_MAX_COLA", "100"))
+PUBSUB_INTERVALO_RECONEXION = float(os.getenv("PUBSUB_INTERVALO_RECONEXION", "5"))
+
+# NOTIFY admite payloads de hasta 8000 bytes
+_MAX_PAYLOAD_NOTIFY = 7900
+
+
+def canal_usuario(id_usuario: int) -> str:
+    return f"usuario:{id_usuario}"
+
+def canal_notificaciones(id_usuario: int) -> str:
+    return f"notificaciones:{id_usuario}"
+
+
+class Suscripcion:
+    """Cola de eventos de una conexión; None en la cola indica cierre"""
+
+    def __init__(self, canal: str, max_cola: int):
+        self.canal = canal
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=max_cola)
+        self.desbordada = False
+
+    async def recibir(self) -> Optional[dict]:
+        return await self.cola.get()
+
+    def cerrar(self) -> None:
+        """Hace que recibir() devuelva None (fin de la conexión)"""
+        if self.cola.full():
+            self.cola.get_nowait()
+        self.cola.put_nowait(None)
+
+    def _entregar(self, evento: dict) -> bool:
+        try:
+            self.cola.put_nowait(evento)
+            return True
+        except asyncio.QueueFull:
+            # Se descarta lo pendiente y se avisa el cierre al consumidor
+            self.desbordada = True
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cerrar()
+            return False
+
+
+class BusEventos:
+    def __init__(self, max_cola: int = PUBSUB_MAX_COLA, usar_postgres: bool = PUBSUB_POSTGRES):
+        self.max_cola = max_cola
+        self.usar_postgres = usar_postgres
+        self._suscriptores: Dict[str, Set[Suscripcion]] = defaultdict(set)
+        self._origen = uuid.uuid4().hex[:12]
+        self._conexion: Optional[asyncpg.Connection] = None
+        self._lock_notify = asyncio.Lock()
+        self._tarea_puente: Optional[asyncio.Task] = None
+
+        self.publicados = 0
+        self.entregados = 0
+        self.desbordados = 0
+        self.recibidos_puente = 0
+        self.errores_puente = 0
+
+    # ---- suscripciones ----
+    def suscribir(self, canal: str) -> Suscripcion:
+        suscripcion = Suscripcion(canal, self.max_cola)
+        self._suscriptores[canal].add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion) -> None:
+        suscriptores = self._suscriptores.get(suscripcion.canal)
+        if suscriptores is None:
+            return
+        suscriptores.discard(suscripcion)
+        if not suscriptores:
+            del self._suscriptores[suscripcion.canal]
+
+    def conectados(self, canal: str) -> int:
+        return len(self._suscriptores.get(canal, ()))
+
+    # ---- publicación ----
+    def _repartir(self, canal: str, evento: dict) -> None:
+        for suscripcion in list(self._suscriptores.get(canal, ())):
+            if suscripcion._entregar(evento):
+                self.entregados += 1
+            else:
+                self.desbordados += 1
+                self.cancelar(suscripcion)
+
+    async def publicar(self, canal: str, evento: dict) -> None:
+        """Entrega el evento a los suscriptores del canal en todos los workers"""
+        self.publicados += 1
+        self._repartir(canal, evento)
+        if self._conexion is not None:
+            await self._notificar(canal, evento)
+
+    async def _notificar(self, canal: str, evento: dict) -> None:
+        payload = json.dumps({"o": self._origen, "c": canal, "e": evento}, default=str)
+        if len(payload.encode()) > _MAX_PAYLOAD_NOTIFY:
+            logger.warning("Evento de %s demasiado grande para NOTIFY; solo se entregó localmente", canal)
+            return
+        try:
+            # Una conexión asyncpg no admite consultas concurrentes
+            async with self._lock_notify:
+                await self._conexion.execute("SELECT pg_notify($1, $2)", PUBSUB_CANAL_POSTGRES, payload)
+        except Exception as e:
+            self.errores_puente += 1
+            logger.error("No se pudo publicar en el puente LISTEN/NOTIFY: %s", e)
+
+    def _al_notificar(self, conexion, pid, canal_pg, payload: str) -> None:
+        try:
+            datos = json.loads(payload)
+        except ValueError:
+            return
+        if datos.get("o") == self._origen:
+            return
+        self.recibidos_puente += 1
+        self._repartir(datos["c"], datos["e"])
+
+    # ---- puente LISTEN/NOTIFY ----
+    async def _conectar(self) -> None:
+        url = os.getenv("DATABASE_URL", "").replace("postgresql+asyncpg://", "postgresql://")
+        conexion = await asyncpg.connect(url)
+        await conexion.add_listener(PUBSUB_CANAL_POSTGRES, self._al_notificar)
+        self._conexion = conexion
+        logger.info("Puente LISTEN/NOTIFY conectado (canal %s)", PUBSUB_CANAL_POSTGRES)
+
+    async def _vigilar_puente(self) -> None:
+        while True:
+            if self._conexion is None or self._conexion.is_closed():
+                self._conexion = None
+                try:
+                    await self._conectar()
+                except Exception as e:
+                    self.errores_puente += 1
+                    logger.error("No se pudo conectar el puente LISTEN/NOTIFY: %s", e)
+            await asyncio.sleep(PUBSUB_INTERVALO_RECONEXION)
+
+    def iniciar(self) -> None:
+        """Arranca el puente entre workers si PUBSUB_POSTGRES=true"""
+        if self.usar_postgres and self._tarea_puente is None:
+            self._tarea_puente = asyncio.create_task(self._vigilar_puente())
+
+    async def detener(self) -> None:
+        if self._tarea_puente is not None:
+            self._tarea_puente.cancel()
+            try:
+                await self._tarea_puente
+            except asyncio.CancelledError:
+                pass
+            self._tarea_puente = None
+        if self._conexion is not None:
+            await self._conexion.close()
+            self._conexion = None
+        # Despertar a las conexiones abiertas para que cierren
+        for suscriptores in list(self._suscriptores.values()):
+            for suscripcion in list(suscriptores):
+                suscripcion.cerrar()
+
+    def metricas(self) -> dict:
+        return {
+            "canales": len(self._suscriptores),
+            "suscripciones": sum(len(s) for s in self._suscriptores.values()),
+            "publicados": self.publicados,
+            "entregados": self.entregados,
+            "desbordados": self.desbordados,
+            "puente_postgres": self._conexion is not None,
+            "recibidos_puente": self.recibidos_puente,
+            "errores_puente": self.errores_puente
+        }
+
+
+# Instancia global del proceso
+bus_eventos = BusEventos()
@@ -2,6 +2,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models.usuario import Usuario
 from models.inmueble import Inmueble
+from utils.security.cache_usuarios import invalidar_usuario
+from utils.roles import es_arrendador, obtener_roles
 
 class RolService:
     """Servicio para manejar los roles de usuarios"""
@@ -11,7 +13,7 @@ class RolService:
         """
         Actualiza el rol del usuario a arrendador cuando publica su primer inmueble
         """
-        if usuario.tipo_usuario == "arrendatario":
+        if not es_arrendador(usuario):
             # Verificar si ya tiene inmuebles
             result = await db.execute(
                 select(Inmueble).where(Inmueble.id_propietario == usuario.id_usuario)
@@ -22,6 +24,7 @@ class RolService:
             if not inmuebles_existentes:
                 usuario.tipo_usuario = "arrendador"
                 await db.commit()
+                invalidar_usuario(usuario.id_usuario)
                 return "arrendador"
         
         return usuario.tipo_usuario
@@ -33,10 +36,9 @@ class RolService:
         - Si solo es arrendatario: ["arrendatario"]
         - Si tiene inmuebles: ["arrendatario", "arrendador"]
         """
-        roles = ["arrendatario"]  # Todos empiezan como arrendatarios
-        
-        if usuario.tipo_usuario == "arrendador":
-            roles.append("arrendador")
+        roles = obtener_roles(usuario)
+        if "arrendatario" not in roles:
+            roles.insert(0, "arrendatario")  # Todos empiezan como arrendatarios
         
         return roles
     
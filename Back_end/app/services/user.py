@@ -1,9 +1,49 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import update, insert
+from sqlalchemy.exc import IntegrityError
+from db.database import SessionLocal
 from models.usuario import Usuario
+from utils.roles import ROL_ARRENDADOR, filtro_rol
+from utils.security.seguridad import hashear_password_async, metricas_bcrypt, BcryptSaturado
+from utils.security.cache_usuarios import invalidar_usuario
 from schemas.user import UsuarioActualizar
 from datetime import datetime
 from typing import Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Referencias a las tareas de rehash en curso (evita que el GC las cancele)
+_tareas_rehash = set()
+
+# Restricciones únicas de usuarios -> campo duplicado (nombres de create_all y del esquema original)
+RESTRICCIONES_UNICAS_USUARIO = {
+    "usuarios_email_key": "email",
+    "ix_usuarios_email": "email",
+    "usuarios_num_celular_key": "num_celular",
+    "ix_usuarios_num_celular": "num_celular",
+}
+
+class UsuarioDuplicado(Exception):
+    """El email o el número de celular ya está registrado"""
+
+    def __init__(self, campo: str):
+        super().__init__(f"{campo} ya registrado")
+        self.campo = campo
+
+def _campo_duplicado(error: IntegrityError) -> Optional[str]:
+    # asyncpg expone constraint_name en la excepción original; si no, se busca en el mensaje
+    causa = getattr(error.orig, "__cause__", None)
+    nombre = getattr(causa, "constraint_name", None)
+    if nombre in RESTRICCIONES_UNICAS_USUARIO:
+        return RESTRICCIONES_UNICAS_USUARIO[nombre]
+    mensaje = str(error)
+    for restriccion, campo in RESTRICCIONES_UNICAS_USUARIO.items():
+        if restriccion in mensaje:
+            return campo
+    return None
 
 async def buscar_usuario_por_email(db: AsyncSession, email: str):
     resultado = await db.execute(select(Usuario).where(Usuario.email == email))
@@ -18,6 +58,39 @@ async def buscar_usuario_por_telefono(db: AsyncSession, num_celular: str):
     """Alias para buscar_usuario_por_celular - compatibilidad con WhatsApp auth"""
     return await buscar_usuario_por_celular(db, num_celular)
 
+async def listar_arrendadores(db: AsyncSession, limite: int = 50, offset: int = 0):
+    """
+    Lista los usuarios con rol de arrendador.
+    El filtro coincide con el predicado del índice parcial ix_usuarios_arrendadores.
+    """
+    resultado = await db.execute(
+        select(Usuario)
+        .where(filtro_rol(Usuario.roles_mask, ROL_ARRENDADOR))
+        .order_by(Usuario.id_usuario)
+        .limit(limite)
+        .offset(offset)
+    )
+    return resultado.scalars().all()
+
+async def registrar_usuario(db: AsyncSession, datos: dict) -> Usuario:
+    """
+    Inserta el usuario con INSERT ... RETURNING en un solo viaje a la BD.
+    La unicidad la garantizan las restricciones (sin consultas previas ni carreras).
+    No hace commit: el llamador confirma junto con lo que necesite (p. ej. refresh token).
+
+    Raises:
+        UsuarioDuplicado: si el email o el celular ya existen
+    """
+    try:
+        resultado = await db.execute(insert(Usuario).values(**datos).returning(Usuario))
+        return resultado.scalar_one()
+    except IntegrityError as e:
+        await db.rollback()
+        campo = _campo_duplicado(e)
+        if campo is None:
+            raise
+        raise UsuarioDuplicado(campo) from e
+
 async def crear_usuario(db: AsyncSession, datos: dict):
     nuevo = Usuario(**datos)
     db.add(nuevo)
@@ -81,4 +154,38 @@ async def actualizar_usuario(db: AsyncSession, id_usuario: int, datos_usuario: d
         raise e
     except Exception as e:
         await db.rollback()
-        raise Exception(f"Error al actualizar usuario: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error al actualizar usuario: {str(e)}")
+
+async def _rehashear_password(id_usuario: int, password_anterior: str, password_plana: str) -> None:
+    try:
+        nuevo_hash = await hashear_password_async(password_plana)
+    except BcryptSaturado:
+        # Se reintentará en el próximo login; el pool está atendiendo peticiones
+        metricas_bcrypt.rehashes_omitidos += 1
+        return
+    try:
+        async with SessionLocal() as db:
+            # Solo si la contraseña no cambió mientras se calculaba el hash
+            resultado = await db.execute(
+                update(Usuario)
+                .where(Usuario.id_usuario == id_usuario, Usuario.password == password_anterior)
+                .values(password=nuevo_hash)
+            )
+            await db.commit()
+        if resultado.rowcount:
+            invalidar_usuario(id_usuario)
+            metricas_bcrypt.rehashes_completados += 1
+        else:
+            metricas_bcrypt.rehashes_omitidos += 1
+    except Exception as e:
+        metricas_bcrypt.rehashes_omitidos += 1
+        logger.error(f"Error al rehashear la contraseña del usuario {id_usuario}: {e}")
+
+def programar_rehash_password(usuario: Usuario, password_plana: str) -> None:
+    """
+    Tras un login correcto, vuelve a hashear en segundo plano la contraseña si
+    está en texto plano o con un costo distinto a BCRYPT_ROUNDS. No retrasa la respuesta.
+    """
+    tarea = asyncio.create_task(_rehashear_password(usuario.id_usuario, usuario.password, password_plana))
+    _tareas_rehash.add(tarea)
+    tarea.add_done_callback(_tareas_rehash.discard)
@@ -1,11 +1,17 @@
-import random
-from typing import Dict, Optional
+import asyncio
+import secrets
+from datetime import datetime
+from typing import Optional
 import requests
 import httpx
 from dotenv import load_dotenv
 import os
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import deque
+from utils.security.codigos_verificacion import AlmacenCodigos, almacen_codigos, VERIFICADO, INCORRECTO
+from utils.circuito import Circuito, CircuitoAbierto, ABIERTO
 
 load_dotenv()
 
@@ -13,10 +19,120 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Cliente HTTP compartido con el microservicio WhatsApp (keep-alive)
+WHATSAPP_TIMEOUT_CONEXION = float(os.getenv("WHATSAPP_TIMEOUT_CONEXION", "3"))
+WHATSAPP_TIMEOUT_LECTURA = float(os.getenv("WHATSAPP_TIMEOUT_LECTURA", "15"))
+WHATSAPP_MAX_CONEXIONES = int(os.getenv("WHATSAPP_MAX_CONEXIONES", "20"))
+WHATSAPP_MAX_KEEPALIVE = int(os.getenv("WHATSAPP_MAX_KEEPALIVE", "10"))
+WHATSAPP_KEEPALIVE_SEGUNDOS = float(os.getenv("WHATSAPP_KEEPALIVE_SEGUNDOS", "30"))
+
+# Circuit breaker y sondeo de estado en segundo plano
+WHATSAPP_CIRCUITO_UMBRAL = int(os.getenv("WHATSAPP_CIRCUITO_UMBRAL", "5"))
+WHATSAPP_CIRCUITO_ABIERTO_SEGUNDOS = float(os.getenv("WHATSAPP_CIRCUITO_ABIERTO_SEGUNDOS", "30"))
+WHATSAPP_SONDEO_SEGUNDOS = float(os.getenv("WHATSAPP_SONDEO_SEGUNDOS", "15"))
+WHATSAPP_TIMEOUT_SONDEO = float(os.getenv("WHATSAPP_TIMEOUT_SONDEO", "5"))
+
+
+class MetricasHttpWhatsApp:
+    """Peticiones, conexiones nuevas (handshakes) y latencias hacia el microservicio"""
+
+    def __init__(self, ventana: int = 1000):
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.conexiones_nuevas = 0
+        self.errores = 0
+        self.timeouts = 0
+        self._latencias = deque(maxlen=ventana)
+
+    async def trace(self, evento: str, info: dict) -> None:
+        # Extensión "trace" de httpx: solo se abre conexión TCP cuando no hay una reutilizable
+        if evento == "connection.connect_tcp.complete":
+            with self._lock:
+                self.conexiones_nuevas += 1
+
+    def registrar(self, duracion: float, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.peticiones += 1
+            self._latencias.append(duracion)
+            if isinstance(error, httpx.TimeoutException):
+                self.timeouts += 1
+            elif error is not None:
+                self.errores += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            datos = {
+                "cliente_activo": _cliente_http is not None and not _cliente_http.is_closed,
+                "peticiones": self.peticiones,
+                "conexiones_nuevas": self.conexiones_nuevas,
+                "tasa_reuso": round(1 - self.conexiones_nuevas / self.peticiones, 4) if self.peticiones else 0.0,
+                "errores": self.errores,
+                "timeouts": self.timeouts
+            }
+        datos["latencia_ms"] = {
+            nombre: round(latencias[min(len(latencias) - 1, int(round(p * (len(latencias) - 1))))] * 1000, 2) if latencias else 0.0
+            for nombre, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        }
+        return datos
+
+
+metricas_http_whatsapp = MetricasHttpWhatsApp()
+
+_cliente_http: Optional[httpx.AsyncClient] = None
+
+
+def _crear_cliente_http() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(WHATSAPP_TIMEOUT_LECTURA, connect=WHATSAPP_TIMEOUT_CONEXION),
+        limits=httpx.Limits(
+            max_connections=WHATSAPP_MAX_CONEXIONES,
+            max_keepalive_connections=WHATSAPP_MAX_KEEPALIVE,
+            keepalive_expiry=WHATSAPP_KEEPALIVE_SEGUNDOS
+        )
+    )
+
+async def iniciar_cliente_whatsapp() -> None:
+    """Crea el cliente compartido (startup de la app)"""
+    global _cliente_http
+    if _cliente_http is None or _cliente_http.is_closed:
+        _cliente_http = _crear_cliente_http()
+
+async def cerrar_cliente_whatsapp() -> None:
+    """Cierra las conexiones abiertas (shutdown de la app)"""
+    global _cliente_http
+    if _cliente_http is not None:
+        await _cliente_http.aclose()
+        _cliente_http = None
+
+def obtener_cliente_whatsapp() -> httpx.AsyncClient:
+    """Cliente compartido; se crea al vuelo si se usa fuera del ciclo de vida de la app (scripts)"""
+    global _cliente_http
+    if _cliente_http is None or _cliente_http.is_closed:
+        _cliente_http = _crear_cliente_http()
+    return _cliente_http
+
+class ErrorEnvioWhatsApp(Exception):
+    """El microservicio respondió, pero no envió el mensaje"""
+
+
+class MensajeRechazado(ErrorEnvioWhatsApp):
+    """Error 4xx: el problema es el mensaje (p. ej. número inválido), no el servicio"""
+
+
+# Un solo circuito por proceso para todas las llamadas al microservicio
+circuito_whatsapp = Circuito(
+    "whatsapp",
+    umbral_fallos=WHATSAPP_CIRCUITO_UMBRAL,
+    segundos_abierto=WHATSAPP_CIRCUITO_ABIERTO_SEGUNDOS,
+    errores_ignorados=(MensajeRechazado,)
+)
+
+
 class WhatsAppService:
-    def __init__(self):
-        # Almacenar códigos con timestamp para expiración (5 minutos)
-        self.verification_codes: Dict[str, Dict[str, any]] = {}
+    def __init__(self, almacen: Optional[AlmacenCodigos] = None):
+        # Códigos en el almacén compartido entre routers y workers (expiran a los 5 minutos)
+        self.almacen = almacen or almacen_codigos
         
         # Configuración de la API de WhatsApp (Node.js)
         self.WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "http://localhost:3000")
@@ -28,17 +144,85 @@ class WhatsAppService:
             "x-system-token": self.WHATSAPP_API_TOKEN
         }
 
-    def generate_code(self, phone_number: str) -> str:
-        """Genera un código de 6 dígitos y lo almacena con timestamp"""
-        code = ''.join([str(random.randint(0, 9)) for _ in range(6)])
-        self.verification_codes[phone_number] = {
-            "code": code,
-            "created_at": datetime.now(),
-            "expires_at": datetime.now() + timedelta(minutes=5)
-        }
-        logger.info(f"Código generado para {phone_number}: {code}")
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Petición al microservicio con el cliente compartido, registrando métricas"""
+        inicio = time.perf_counter()
+        try:
+            response = await obtener_cliente_whatsapp().request(
+                method,
+                f"{self.WHATSAPP_API_URL}{path}",
+                extensions={"trace": metricas_http_whatsapp.trace},
+                **kwargs
+            )
+        except Exception as e:
+            metricas_http_whatsapp.registrar(time.perf_counter() - inicio, e)
+            raise
+        metricas_http_whatsapp.registrar(time.perf_counter() - inicio)
+        return response
+
+    async def generate_code(self, phone_number: str) -> str:
+        """Genera un código de 6 dígitos y lo guarda en el almacén compartido"""
+        code = ''.join(str(secrets.randbelow(10)) for _ in range(6))
+        await self.almacen.guardar(phone_number, code)
+        logger.info(f"Código generado para {phone_number}")
         return code
 
+    def build_verification_message(self, code: str) -> str:
+        """Texto del mensaje con el código de verificación"""
+        return f"""🔐 UBIKHA - Código de Verificación
+
+Tu código de verificación es: *{code}*
+
+⚠️ Por seguridad:
+• No compartas este código con nadie
+• Válido por 5 minutos únicamente
+
+¡Gracias por usar UBIKHA! 🚀"""
+
+    def build_welcome_message(self, nombre: str) -> str:
+        """Texto del mensaje de bienvenida tras el registro"""
+        return f"""🎉 ¡Bienvenido/a a UBIKHA, {nombre}!
+
+Tu cuenta ha sido creada exitosamente.
+
+Con UBIKHA puedes:
+✅ Buscar y alquilar inmuebles
+✅ Gestionar tus reservas
+✅ Contactar propietarios fácilmente
+✅ Dejar reseñas y valoraciones
+
+¡Gracias por confiar en nosotros! 🏠✨"""
+
+    async def send_message(self, phone_number: str, message: str) -> None:
+        """
+        Envía un mensaje a través del microservicio WhatsApp (Node.js)
+
+        Args:
+            phone_number: Número de teléfono (9 dígitos o formato internacional)
+            message: Texto a enviar
+
+        Raises:
+            CircuitoAbierto: Si el microservicio se considera caído (sin intentar la petición)
+            ErrorEnvioWhatsApp: Si el microservicio rechaza el mensaje
+            httpx.HTTPError: Si falla la conexión o se agota el tiempo
+        """
+        formatted_phone = self._format_phone_number(phone_number)
+        payload = {
+            "phone": formatted_phone,
+            "message": message
+        }
+
+        async with circuito_whatsapp.llamada():
+            response = await self._request("POST", "/api/whatsapp/send-message", json=payload)
+
+            if 400 <= response.status_code < 500:
+                raise MensajeRechazado(f"HTTP {response.status_code}: {response.text[:200]}")
+            if response.status_code != 200:
+                raise ErrorEnvioWhatsApp(f"HTTP {response.status_code}: {response.text[:200]}")
+            result = response.json()
+            if not result.get("success", False):
+                raise ErrorEnvioWhatsApp(f"Respuesta sin éxito: {result}")
+
     async def send_verification_code(self, phone_number: str) -> bool:
         """
         Envía código de verificación a través del microservicio WhatsApp (Node.js)
@@ -51,46 +235,10 @@ class WhatsAppService:
         """
         try:
             # Generar código
-            code = self.generate_code(phone_number)
-            
-            # Formatear número de teléfono (asegurar formato correcto)
-            formatted_phone = self._format_phone_number(phone_number)
-            
-            # Mensaje del código de verificación
-            mensaje = f"""🔐 UBIKHA - Código de Verificación
-
-Tu código de verificación es: *{code}*
-
-⚠️ Por seguridad:
-• No compartas este código con nadie
-• Válido por 5 minutos únicamente
-
-¡Gracias por usar UBIKHA! 🚀"""
-            
-            # Payload para el microservicio WhatsApp
-            payload = {
-                "phone": formatted_phone,
-                "message": mensaje
-            }
-            
-            # Realizar petición HTTP al microservicio WhatsApp
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.WHATSAPP_API_URL}/api/whatsapp/send-message",
-                    json=payload
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("success", False):
-                        logger.info(f"Código enviado exitosamente a {formatted_phone}")
-                        return True
-                    else:
-                        logger.error(f"Error en respuesta: {result}")
-                        return False
-                else:
-                    logger.error(f"Error al enviar código: {response.status_code} - {response.text}")
-                    return False
+            code = await self.generate_code(phone_number)
+            await self.send_message(phone_number, self.build_verification_message(code))
+            logger.info(f"Código enviado exitosamente a {self._format_phone_number(phone_number)}")
+            return True
                     
         except httpx.TimeoutException:
             logger.error(f"Timeout al enviar código a {phone_number}")
@@ -104,7 +252,8 @@ Tu código de verificación es: *{code}*
 
     async def verify_code(self, phone_number: str, code: str) -> bool:
         """
-        Verifica si el código proporcionado es válido y no ha expirado
+        Verifica si el código proporcionado es válido y no ha expirado.
+        La comprobación consume el código: solo una verificación puede aceptarlo.
         
         Args:
             phone_number: Número de teléfono
@@ -113,63 +262,54 @@ Tu código de verificación es: *{code}*
         Returns:
             bool: True si el código es válido, False en caso contrario
         """
-        try:
-            stored_data = self.verification_codes.get(phone_number)
-            
-            if not stored_data:
-                logger.warning(f"No se encontró código para {phone_number}")
-                return False
-            
-            # Verificar si el código ha expirado
-            if datetime.now() > stored_data["expires_at"]:
-                logger.warning(f"Código expirado para {phone_number}")
-                del self.verification_codes[phone_number]
-                return False
-            
-            # Verificar si el código es correcto
-            if stored_data["code"] == code:
-                logger.info(f"Código verificado exitosamente para {phone_number}")
-                # Marcar como verificado en lugar de eliminar
-                self.verification_codes[phone_number]["verified"] = True
-                self.verification_codes[phone_number]["verified_at"] = datetime.now()
-                return True
-            else:
-                logger.warning(f"Código incorrecto para {phone_number}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error al verificar código: {e}")
-            return False
+        resultado = await self.almacen.verificar(phone_number, code)
+        if resultado == VERIFICADO:
+            logger.info(f"Código verificado exitosamente para {phone_number}")
+            return True
+        if resultado == INCORRECTO:
+            logger.warning(f"Código incorrecto para {phone_number}")
+        else:
+            logger.warning(f"No hay código vigente para {phone_number}")
+        return False
 
     async def check_whatsapp_service_status(self) -> bool:
         """
-        Verifica el estado del microservicio WhatsApp
+        Estado del microservicio WhatsApp según el último sondeo (sin petición HTTP
+        mientras el monitor en segundo plano esté activo)
         
         Returns:
             bool: True si el servicio está disponible y WhatsApp conectado, False en caso contrario
         """
-        try:
-            # Verificar el estado de WhatsApp Web directamente
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                status_response = await client.get(f"{self.WHATSAPP_API_URL}/api/whatsapp/status")
-                
-                if status_response.status_code == 200:
-                    data = status_response.json()
-                    is_connected = data.get("connected", False)
-                    is_authenticated = data.get("authenticated", False)
-                    
-                    logger.info(f"WhatsApp status - Connected: {is_connected}, Authenticated: {is_authenticated}")
-                    return is_connected and is_authenticated
-                else:
-                    logger.error(f"Error al verificar estado de WhatsApp: {status_response.status_code}")
-                    return False
-                    
-        except httpx.TimeoutException:
-            logger.error("Timeout al verificar estado de WhatsApp")
-            return False
-        except Exception as e:
-            logger.error(f"Error al verificar estado del servicio WhatsApp: {e}")
-            return False
+        if not monitor_whatsapp.vigente:
+            # Sin monitor (scripts) o sondeo desactualizado: consultar ahora
+            await monitor_whatsapp.sondear()
+        return monitor_whatsapp.disponible()
+
+    async def probe_service_status(self) -> bool:
+        """
+        Consulta real de /api/whatsapp/status a través del circuit breaker
+        
+        Returns:
+            bool: True si WhatsApp está conectado y autenticado
+
+        Raises:
+            CircuitoAbierto: Si aún no toca reintentar
+            ErrorEnvioWhatsApp: Si el servicio responde pero WhatsApp no está listo
+        """
+        async with circuito_whatsapp.llamada():
+            status_response = await self._request("GET", "/api/whatsapp/status", timeout=WHATSAPP_TIMEOUT_SONDEO)
+            
+            if status_response.status_code != 200:
+                raise ErrorEnvioWhatsApp(f"Error al verificar estado de WhatsApp: {status_response.status_code}")
+            data = status_response.json()
+            is_connected = data.get("connected", False)
+            is_authenticated = data.get("authenticated", False)
+            
+            logger.info(f"WhatsApp status - Connected: {is_connected}, Authenticated: {is_authenticated}")
+            if not (is_connected and is_authenticated):
+                # Sin sesión de WhatsApp Web ningún envío funcionará: cuenta como fallo
+                raise ErrorEnvioWhatsApp("WhatsApp no está conectado/autenticado")
+        return True
 
     def _format_phone_number(self, phone_number: str) -> str:
         """
@@ -202,33 +342,25 @@ Tu código de verificación es: *{code}*
         logger.warning(f"Formato de número no estándar: {phone_number}")
         return clean_number
 
-    def get_pending_verifications_count(self) -> int:
+    async def get_pending_verifications_count(self) -> Optional[int]:
         """
         Obtiene el número de verificaciones pendientes
         
         Returns:
-            int: Número de verificaciones pendientes
+            Optional[int]: Códigos vigentes (None si el backend no los cuenta)
         """
-        return len(self.verification_codes)
+        return await self.almacen.contar_vigentes()
 
-    def clean_expired_codes(self) -> int:
+    async def clean_expired_codes(self) -> int:
         """
         Limpia códigos expirados del almacén
         
         Returns:
             int: Número de códigos eliminados
         """
-        current_time = datetime.now()
-        expired_phones = [
-            phone for phone, data in self.verification_codes.items()
-            if current_time > data["expires_at"]
-        ]
-        
-        for phone in expired_phones:
-            del self.verification_codes[phone]
-            
-        logger.info(f"Códigos expirados eliminados: {len(expired_phones)}")
-        return len(expired_phones)
+        eliminados = await self.almacen.purgar_expirados()
+        logger.info(f"Códigos expirados eliminados: {eliminados}")
+        return eliminados
 
     async def send_welcome_message(self, phone_number: str, nombre: str) -> bool:
         """
@@ -242,48 +374,15 @@ Tu código de verificación es: *{code}*
             bool: True si se envió exitosamente, False en caso contrario
         """
         try:
-            formatted_phone = self._format_phone_number(phone_number)
-            
-            mensaje_bienvenida = f"""🎉 ¡Bienvenido/a a UBIKHA, {nombre}!
-
-Tu cuenta ha sido creada exitosamente.
-
-Con UBIKHA puedes:
-✅ Buscar y alquilar inmuebles
-✅ Gestionar tus reservas
-✅ Contactar propietarios fácilmente
-✅ Dejar reseñas y valoraciones
-
-¡Gracias por confiar en nosotros! 🏠✨"""
-            
-            payload = {
-                "phone": formatted_phone,
-                "message": mensaje_bienvenida
-            }
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.WHATSAPP_API_URL}/api/whatsapp/send-message",
-                    json=payload
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("success", False):
-                        logger.info(f"Mensaje de bienvenida enviado a {formatted_phone}")
-                        return True
-                    else:
-                        logger.error(f"Error en respuesta de bienvenida: {result}")
-                        return False
-                else:
-                    logger.error(f"Error al enviar mensaje de bienvenida: {response.status_code}")
-                    return False
+            await self.send_message(phone_number, self.build_welcome_message(nombre))
+            logger.info(f"Mensaje de bienvenida enviado a {self._format_phone_number(phone_number)}")
+            return True
                     
         except Exception as e:
             logger.error(f"Error al enviar mensaje de bienvenida: {e}")
             return False
 
-    def is_phone_verified(self, phone_number: str) -> bool:
+    async def is_phone_verified(self, phone_number: str) -> bool:
         """
         Verifica si un número de teléfono ha sido verificado recientemente
         
@@ -291,22 +390,13 @@ Con UBIKHA puedes:
             phone_number: Número de teléfono a verificar
             
         Returns:
-            bool: True si el teléfono fue verificado recientemente
+            bool: True si el teléfono fue verificado en los últimos 10 minutos
         """
-        # Verificar si existe en los códigos verificados
-        if phone_number in self.verification_codes:
-            verification_data = self.verification_codes[phone_number]
-            # Verificar si el código fue verificado y no ha expirado
-            if verification_data.get("verified", False):
-                # Considerar verificado si fue validado en los últimos 10 minutos
-                verified_at = verification_data.get("verified_at")
-                if verified_at and datetime.now() - verified_at < timedelta(minutes=10):
-                    return True
-        return False
+        return await self.almacen.esta_verificado(phone_number)
 
-    def remove_verified_phone(self, phone_number: str) -> bool:
+    async def remove_verified_phone(self, phone_number: str) -> bool:
         """
-        Remueve un teléfono verificado del cache después del registro exitoso
+        Remueve un teléfono verificado del almacén después del registro exitoso
         
         Args:
             phone_number: Número de teléfono a remover
@@ -314,12 +404,82 @@ Con UBIKHA puedes:
         Returns:
             bool: True si se removió exitosamente
         """
+        removed = await self.almacen.eliminar(phone_number)
+        if removed:
+            logger.info(f"Teléfono {phone_number} removido del almacén de verificación")
+        return removed
+
+
+class MonitorWhatsApp:
+    """Sondea el estado del microservicio en segundo plano; las peticiones leen el valor cacheado"""
+
+    def __init__(self, servicio: WhatsAppService, intervalo: float = WHATSAPP_SONDEO_SEGUNDOS):
+        self.servicio = servicio
+        self.intervalo = intervalo
+        self.conectado: Optional[bool] = None  # None = aún sin sondear
+        self._ultimo_sondeo: Optional[float] = None
+        self.fecha_ultimo_sondeo: Optional[datetime] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.sondeos = 0
+        self.sondeos_fallidos = 0
+
+    @property
+    def vigente(self) -> bool:
+        return self._ultimo_sondeo is not None and time.monotonic() - self._ultimo_sondeo < self.intervalo * 2
+
+    async def sondear(self) -> bool:
         try:
-            if phone_number in self.verification_codes:
-                del self.verification_codes[phone_number]
-                logger.info(f"Teléfono {phone_number} removido del cache de verificación")
-                return True
-            return False
+            self.conectado = await self.servicio.probe_service_status()
+        except CircuitoAbierto:
+            # Aún no toca la llamada de prueba: sigue caído
+            self.conectado = False
         except Exception as e:
-            logger.error(f"Error al remover teléfono verificado: {e}")
+            self.conectado = False
+            self.sondeos_fallidos += 1
+            logger.warning(f"Sondeo de WhatsApp fallido: {e.__class__.__name__}: {e}")
+        self.sondeos += 1
+        self._ultimo_sondeo = time.monotonic()
+        self.fecha_ultimo_sondeo = datetime.now()
+        return self.conectado
+
+    def disponible(self) -> bool:
+        """False si el circuito está abierto o el último sondeo falló (sin sondeo aún: True)"""
+        if circuito_whatsapp.estado == ABIERTO and circuito_whatsapp.segundos_para_reintento() > 0:
             return False
+        return self.conectado is not False
+
+    async def _ciclo_sondeo(self):
+        while True:
+            await self.sondear()
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self) -> None:
+        """Arranca el sondeo periódico (llamar en el startup de la app)"""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._ciclo_sondeo())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    def metricas(self) -> dict:
+        return {
+            "disponible": self.disponible(),
+            "conectado": self.conectado,
+            "fecha_ultimo_sondeo": self.fecha_ultimo_sondeo,
+            "sondeos": self.sondeos,
+            "sondeos_fallidos": self.sondeos_fallidos,
+            "circuito": circuito_whatsapp.metricas()
+        }
+
+
+# Instancia compartida por los routers: los códigos viven en almacen_codigos
+whatsapp_service = WhatsAppService()
+monitor_whatsapp = MonitorWhatsApp(whatsapp_service)
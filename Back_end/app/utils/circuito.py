@@ -0,0 +1,138 @@
+"""
+Circuit breaker para dependencias externas (p. ej. el microservicio WhatsApp).
+
+Estados:
+- cerrado: las llamadas pasan; tras `umbral_fallos` fallos consecutivos se abre
+- abierto: las llamadas fallan al instante con CircuitoAbierto (sin esperar
+  timeouts) durante `segundos_abierto`
+- semiabierto: pasado ese tiempo se deja pasar una sola llamada de prueba;
+  si sale bien se cierra, si falla se vuelve a abrir
+
+Solo el resultado de la llamada de prueba decide fuera del estado cerrado:
+una llamada admitida antes de abrirse que termina tarde no cierra ni
+reabre el circuito.
+
+Pensado para un único event loop por proceso (sin locks): cada worker de
+uvicorn tiene su propio circuito.
+"""
+
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple, Type
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class CircuitoAbierto(Exception):
+    """La dependencia se considera caída; reintentar después de retry_after segundos"""
+
+    def __init__(self, nombre: str, retry_after: float):
+        super().__init__(f"Circuito '{nombre}' abierto")
+        self.nombre = nombre
+        self.retry_after = retry_after
+
+
+class Circuito:
+    def __init__(
+        self,
+        nombre: str,
+        umbral_fallos: int = 5,
+        segundos_abierto: float = 30.0,
+        errores_ignorados: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.segundos_abierto = segundos_abierto
+        # Errores del llamador (p. ej. datos inválidos) que no indican una dependencia caída
+        self.errores_ignorados = errores_ignorados
+        self.estado = CERRADO
+        self.fallos_consecutivos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+
+        # Métricas
+        self.aperturas = 0
+        self.rechazadas = 0
+        self.exitos = 0
+        self.fallos = 0
+        self.ultimo_error: Optional[str] = None
+
+    def segundos_para_reintento(self) -> float:
+        if self.estado != ABIERTO:
+            return 0.0
+        return max(0.0, self._abierto_desde + self.segundos_abierto - time.monotonic())
+
+    def permitir(self) -> bool:
+        """Lanza CircuitoAbierto si la llamada no debe intentarse; True si es la llamada de prueba"""
+        if self.estado == ABIERTO:
+            espera = self.segundos_para_reintento()
+            if espera > 0:
+                self.rechazadas += 1
+                raise CircuitoAbierto(self.nombre, espera)
+            self.estado = SEMIABIERTO
+        if self.estado == SEMIABIERTO:
+            if self._prueba_en_curso:
+                self.rechazadas += 1
+                raise CircuitoAbierto(self.nombre, 1.0)
+            self._prueba_en_curso = True
+            return True
+        return False
+
+    def registrar_exito(self, prueba: bool = False) -> None:
+        self.exitos += 1
+        if prueba or self.estado == CERRADO:
+            self.fallos_consecutivos = 0
+            self.estado = CERRADO
+
+    def registrar_fallo(self, error: Optional[BaseException] = None, prueba: bool = False) -> None:
+        self.fallos += 1
+        if error is not None:
+            self.ultimo_error = f"{error.__class__.__name__}: {error}"[:200]
+        if not prueba and self.estado != CERRADO:
+            return
+        self.fallos_consecutivos += 1
+        if prueba or self.fallos_consecutivos >= self.umbral_fallos:
+            self.aperturas += 1
+            self.estado = ABIERTO
+            self._abierto_desde = time.monotonic()
+
+    @asynccontextmanager
+    async def llamada(self):
+        """
+        Envuelve una llamada a la dependencia:
+
+            async with circuito.llamada():
+                respuesta = await cliente.get(...)
+
+        Cualquier excepción del bloque (salvo errores_ignorados) cuenta como fallo.
+        """
+        prueba = self.permitir()
+        try:
+            yield
+        except self.errores_ignorados:
+            self.registrar_exito(prueba)
+            raise
+        except Exception as e:
+            self.registrar_fallo(e, prueba)
+            raise
+        else:
+            self.registrar_exito(prueba)
+        finally:
+            # Solo la llamada de prueba libra el paso a la siguiente
+            if prueba:
+                self._prueba_en_curso = False
+
+    def metricas(self) -> dict:
+        return {
+            "estado": self.estado,
+            "fallos_consecutivos": self.fallos_consecutivos,
+            "umbral_fallos": self.umbral_fallos,
+            "segundos_para_reintento": round(self.segundos_para_reintento(), 1),
+            "aperturas": self.aperturas,
+            "rechazadas": self.rechazadas,
+            "exitos": self.exitos,
+            "fallos": self.fallos,
+            "ultimo_error": self.ultimo_error
+        }
@@ -72,3 +72,38 @@ async def database_exception_handler(request: Request, exc: Exception) -> JSONRe
             "technical_details": str(exc) if logger.level <= logging.DEBUG else None
         }
     )
+
+async def servicio_saturado_handler(request: Request, exc: Exception) -> JSONResponse:
+    """
+    Manejador para recursos internos saturados (p. ej. el pool de bcrypt)
+    """
+    logger.error(f"Servicio saturado en {request.url}: {str(exc)}")
+    
+    return JSONResponse(
+        status_code=503,
+        content={
+            "detail": "El servidor está ocupado. Por favor, inténtalo de nuevo en unos segundos.",
+            "error_type": "service_busy",
+            "status_code": 503,
+            "path": str(request.url.path)
+        },
+        headers={"Retry-After": "1"}
+    )
+
+async def login_bloqueado_handler(request: Request, exc: Exception) -> JSONResponse:
+    """
+    Manejador para intentos de login rechazados por el limitador de fuerza bruta
+    """
+    logger.error(f"Login bloqueado en {request.url}: {str(exc)}")
+    
+    return JSONResponse(
+        status_code=429,
+        content={
+            "detail": "Demasiados intentos de inicio de sesión. Por favor, inténtalo más tarde.",
+            "error_type": "too_many_attempts",
+            "retry_after": exc.retry_after,
+            "status_code": 429,
+            "path": str(request.url.path)
+        },
+        headers={"Retry-After": str(exc.retry_after)}
+    )
@@ -1,47 +1,106 @@
 """
 Utilidades para manejo de roles múltiples en UBIKHA
+
+Los roles se guardan como máscara de bits en Usuario.roles_mask, de modo que
+comprobar un rol es una operación AND en lugar de partir el texto de
+tipo_usuario en cada llamada. tipo_usuario se mantiene sincronizado como
+representación legible (roles separados por coma) para las respuestas.
 """
 
+from sqlalchemy import literal_column
+
+# Bits de rol (Usuario.roles_mask)
+ROL_ARRENDATARIO = 1
+ROL_ARRENDADOR = 2
+ROL_ADMIN = 4
+
+BITS_ROLES = {
+    "arrendatario": ROL_ARRENDATARIO,
+    "arrendador": ROL_ARRENDADOR,
+    "admin": ROL_ADMIN,
+    "administrador": ROL_ADMIN,  # Alias histórico usado en algunos endpoints
+}
+
+# Nombre canónico de cada bit, en el orden en que se muestran
+NOMBRES_ROLES = (
+    (ROL_ARRENDATARIO, "arrendatario"),
+    (ROL_ARRENDADOR, "arrendador"),
+    (ROL_ADMIN, "admin"),
+)
+
+def filtro_rol(columna, bit: int):
+    """
+    Predicado SQL "(columna & bit) <> 0" sobre la columna roles_mask recibida.
+    El bit va como literal (no parámetro) para que el planner pueda usar los
+    índices parciales definidos con este mismo predicado (ix_usuarios_arrendadores).
+    """
+    return columna.op("&")(literal_column(str(int(bit)))) != literal_column("0")
+
+def mascara_desde_tipo(tipo_usuario: str) -> int:
+    """
+    Convierte el texto de roles (ej: "arrendatario,arrendador") en máscara de bits.
+    Roles desconocidos se ignoran; sin roles válidos se asume arrendatario.
+    """
+    mascara = 0
+    for rol in (tipo_usuario or "").split(','):
+        mascara |= BITS_ROLES.get(rol.strip().lower(), 0)
+    return mascara or ROL_ARRENDATARIO
+
+def tipo_desde_mascara(mascara: int) -> str:
+    """Convierte la máscara de bits en el texto de roles separados por coma"""
+    return ','.join(nombre for bit, nombre in NOMBRES_ROLES if mascara & bit) or "arrendatario"
+
+def mascara_roles(usuario) -> int:
+    """
+    Máscara de roles del usuario.
+    Usa roles_mask si está disponible (modelo, caché o token) y si no parsea tipo_usuario.
+    """
+    if not usuario:
+        return 0
+    mascara = getattr(usuario, "roles_mask", None)
+    if mascara:
+        return mascara
+    tipo_usuario = getattr(usuario, "tipo_usuario", None)
+    return mascara_desde_tipo(tipo_usuario) if tipo_usuario else 0
+
 def tiene_rol(usuario, rol_buscado: str) -> bool:
     """
     Verifica si un usuario tiene un rol específico.
-    Maneja tanto roles simples como múltiples (separados por coma).
     
     Args:
-        usuario: Objeto usuario con campo tipo_usuario
+        usuario: Objeto usuario con campo roles_mask o tipo_usuario
         rol_buscado: Rol a verificar (ej: "arrendatario", "arrendador")
         
     Returns:
         bool: True si el usuario tiene el rol, False en caso contrario
     """
-    if not usuario or not usuario.tipo_usuario:
-        return False
-    
-    roles = [rol.strip() for rol in usuario.tipo_usuario.split(',')]
-    return rol_buscado in roles
+    bit = BITS_ROLES.get(rol_buscado)
+    return bool(bit and mascara_roles(usuario) & bit)
 
 def obtener_roles(usuario) -> list[str]:
     """
     Obtiene todos los roles de un usuario como una lista.
     
     Args:
-        usuario: Objeto usuario con campo tipo_usuario
+        usuario: Objeto usuario con campo roles_mask o tipo_usuario
         
     Returns:
         list[str]: Lista de roles del usuario
     """
-    if not usuario or not usuario.tipo_usuario:
-        return []
-    
-    return [rol.strip() for rol in usuario.tipo_usuario.split(',') if rol.strip()]
+    mascara = mascara_roles(usuario)
+    return [nombre for bit, nombre in NOMBRES_ROLES if mascara & bit]
 
 def es_arrendatario(usuario) -> bool:
     """Verifica si el usuario tiene rol de arrendatario"""
-    return tiene_rol(usuario, "arrendatario")
+    return bool(mascara_roles(usuario) & ROL_ARRENDATARIO)
 
 def es_arrendador(usuario) -> bool:
     """Verifica si el usuario tiene rol de arrendador"""
-    return tiene_rol(usuario, "arrendador")
+    return bool(mascara_roles(usuario) & ROL_ARRENDADOR)
+
+def es_admin(usuario) -> bool:
+    """Verifica si el usuario tiene rol de administrador"""
+    return bool(mascara_roles(usuario) & ROL_ADMIN)
 
 def agregar_rol(tipo_usuario_actual: str, nuevo_rol: str) -> str:
     """
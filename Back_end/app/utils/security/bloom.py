@@ -0,0 +1,50 @@
+"""
+Filtro de Bloom en memoria.
+
+Responde "seguro que no está" o "puede estar" usando un arreglo de bits
+fijo, sin guardar los elementos. Se usa como prefiltro antes de consultas
+exactas a la base de datos.
+"""
+
+import hashlib
+import math
+
+
+class FiltroBloom:
+    def __init__(self, capacidad: int = 100_000, tasa_falsos_positivos: float = 0.001):
+        self.capacidad = capacidad
+        self.tasa_falsos_positivos = tasa_falsos_positivos
+        # Tamaño óptimo del arreglo (m) y número de funciones hash (k)
+        self.num_bits = max(8, int(-capacidad * math.log(tasa_falsos_positivos) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacidad * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, elemento: str):
+        # Doble hashing: h1 + i * h2 genera las k posiciones con un solo digest
+        digest = hashlib.blake2b(elemento.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def agregar(self, elemento: str) -> None:
+        for posicion in self._posiciones(elemento):
+            self._bits[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += 1
+
+    def __contains__(self, elemento: str) -> bool:
+        return all(self._bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(elemento))
+
+    def limpiar(self) -> None:
+        self._bits = bytearray(len(self._bits))
+        self.elementos = 0
+
+    def metricas(self) -> dict:
+        return {
+            "elementos": self.elementos,
+            "capacidad": self.capacidad,
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "memoria_bytes": len(self._bits)
+        }
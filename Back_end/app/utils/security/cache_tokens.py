@@ -0,0 +1,91 @@
+"""
+Caché LRU de tokens JWT ya verificados.
+
+Los clientes móviles envían el mismo token cientos de veces; verificar la
+firma HMAC y parsear el JSON en cada petición es trabajo repetido. Se guarda
+el payload verificado, indexado por el SHA-256 del token (nunca el token en
+claro), hasta su "exp". Un token que no está en caché, o que ya expiró, se
+verifica completo con jwt.decode.
+
+La revocación no depende de esta caché: la versión del token ("ver") se
+sigue comprobando en cada petición contra versiones_token.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+JWT_CACHE_MAX_ENTRADAS = int(os.getenv("JWT_CACHE_MAX", "10000"))
+
+
+class CacheTokens:
+    """Payloads verificados por digest del token, con expiración en "exp" y desalojo LRU"""
+
+    def __init__(self, max_entradas: int = JWT_CACHE_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+        # Métricas
+        self.aciertos = 0
+        self.fallos = 0
+        self.expirados = 0
+        self.desalojos = 0
+
+    @staticmethod
+    def _clave(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def obtener(self, token: str) -> Optional[dict]:
+        """Copia del payload si el token está en caché y no expiró"""
+        clave = self._clave(token)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            expira, payload = entrada
+            if time.time() >= expira:
+                del self._entradas[clave]
+                self.expirados += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return dict(payload)
+
+    def guardar(self, token: str, payload: dict) -> None:
+        expira = payload.get("exp")
+        if not isinstance(expira, (int, float)):
+            # Sin "exp" no hay forma segura de acotar la vida de la entrada
+            return
+        clave = self._clave(token)
+        with self._lock:
+            self._entradas[clave] = (expira, dict(payload))
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+
+    def metricas(self) -> dict:
+        total = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "expirados": self.expirados,
+            "desalojos": self.desalojos
+        }
+
+
+# Instancia compartida por toda la aplicación
+cache_tokens = CacheTokens()
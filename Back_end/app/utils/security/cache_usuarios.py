@@ -0,0 +1,130 @@
+"""
+Caché TTL + LRU del usuario autenticado.
+
+obtener_usuario_actual se ejecuta en casi todas las peticiones; esta caché
+evita el SELECT a usuarios cuando el mismo token se usa repetidamente.
+Se guardan copias de las columnas (no instancias ORM) y cada petición
+recibe una instancia nueva adjuntada a su propia sesión, de modo que los
+endpoints pueden seguir modificando usuario_actual y hacer commit.
+
+La caché es local a cada worker: la invalidación explícita solo afecta al
+proceso que hizo el cambio y el TTL acota la obsolescencia en los demás.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from models.usuario import Usuario
+
+USUARIO_CACHE_TTL_SEGUNDOS = float(os.getenv("USUARIO_CACHE_TTL", "30"))
+USUARIO_CACHE_MAX_ENTRADAS = int(os.getenv("USUARIO_CACHE_MAX", "10000"))
+
+_COLUMNAS_USUARIO = [atributo.key for atributo in inspect(Usuario).column_attrs]
+
+
+class CacheUsuarios:
+    """Caché de usuarios por (id_usuario, sub) con expiración y desalojo LRU"""
+
+    def __init__(self, max_entradas: int = USUARIO_CACHE_MAX_ENTRADAS, ttl: float = USUARIO_CACHE_TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[Tuple, Tuple[float, dict]]" = OrderedDict()
+        self._claves_por_usuario: Dict[int, set] = {}
+        # Se incrementa en cada invalidación para descartar lecturas concurrentes obsoletas
+        self._generaciones: Dict[int, int] = {}
+
+        # Métricas
+        self.aciertos = 0
+        self.fallos = 0
+        self.expirados = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+
+    def generacion(self, id_usuario: int) -> int:
+        return self._generaciones.get(id_usuario, 0)
+
+    def obtener(self, clave: Tuple) -> Optional[Usuario]:
+        """Devuelve una instancia detached lista para db.add(), o None si no está"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            expira, columnas = entrada
+            if time.monotonic() >= expira:
+                self._quitar(clave)
+                self.expirados += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+
+        usuario = Usuario(**columnas)
+        make_transient_to_detached(usuario)
+        return usuario
+
+    def guardar(self, clave: Tuple, usuario: Usuario, generacion: int) -> None:
+        """Guarda una copia de las columnas si no hubo invalidaciones desde la lectura"""
+        columnas = {nombre: getattr(usuario, nombre) for nombre in _COLUMNAS_USUARIO}
+        id_usuario = clave[0]
+        with self._lock:
+            if self.generacion(id_usuario) != generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, columnas)
+            self._entradas.move_to_end(clave)
+            self._claves_por_usuario.setdefault(id_usuario, set()).add(clave)
+            while len(self._entradas) > self.max_entradas:
+                clave_antigua = next(iter(self._entradas))
+                self._quitar(clave_antigua)
+                self.desalojos += 1
+
+    def invalidar(self, id_usuario: int) -> None:
+        """Descarta todas las entradas del usuario (llamar tras modificarlo)"""
+        with self._lock:
+            self._generaciones[id_usuario] = self.generacion(id_usuario) + 1
+            for clave in list(self._claves_por_usuario.get(id_usuario, ())):
+                self._quitar(clave)
+            self.invalidaciones += 1
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._claves_por_usuario.clear()
+
+    def _quitar(self, clave: Tuple) -> None:
+        self._entradas.pop(clave, None)
+        claves = self._claves_por_usuario.get(clave[0])
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._claves_por_usuario[clave[0]]
+
+    def metricas(self) -> dict:
+        total = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "expirados": self.expirados,
+            "desalojos": self.desalojos,
+            "invalidaciones": self.invalidaciones
+        }
+
+
+# Instancia compartida por toda la aplicación
+cache_usuarios = CacheUsuarios()
+
+
+def invalidar_usuario(id_usuario: int) -> None:
+    """Atajo para invalidar la caché tras cambios de perfil, rol, estado o credenciales"""
+    cache_usuarios.invalidar(id_usuario)
@@ -0,0 +1,462 @@
+"""
+Almacén compartido de códigos de verificación (OTP por WhatsApp).
+
+Antes cada WhatsAppService guardaba los códigos en su propio dict: un código
+enviado por /auth/enviar-codigo no se podía verificar en /whatsapp-auth, y
+con varios workers de uvicorn la verificación fallaba según a qué proceso
+llegara la petición. Ahora todos usan este almacén.
+
+Ciclo de un código:
+1. guardar: "pendiente", expira a los CODIGO_TTL_SEGUNDOS
+2. verificar: comprueba y consume el código en una sola operación atómica
+   (dos verificaciones simultáneas no pueden aceptar el mismo código). Si es
+   correcto pasa a "verificado" con VERIFICADO_TTL_SEGUNDOS para completar el
+   registro; si no, suma un intento y tras CODIGO_MAX_INTENTOS queda inválido
+3. eliminar: tras el registro exitoso
+
+Backends (VERIFICACION_BACKEND):
+- "postgres" (por defecto): tabla UNLOGGED codigos_verificacion (sin WAL: los
+  códigos son efímeros), UPDATE ... RETURNING atómico y purga periódica
+- "redis": hash por teléfono con EXPIRE nativo y verificación en un script
+  Lua (REDIS_URL). Requiere el paquete opcional `redis`
+- "memoria": dict local al proceso con índice de expiración (min-heap) y
+  límite de tamaño; solo válido con un único worker
+
+Si el backend configurado no arranca se reintenta CODIGOS_REINTENTOS_INICIO
+veces. Agotados los reintentos, con un solo worker (WEB_CONCURRENCY=1, el
+valor por defecto de uvicorn) se sigue con memoria; con varios el arranque
+falla, porque cada worker tendría sus propios códigos y la verificación
+fallaría según el proceso que atienda la petición.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from db.database import motor
+
+logger = logging.getLogger(__name__)
+
+VERIFICACION_BACKEND = os.getenv("VERIFICACION_BACKEND", "postgres").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+CODIGO_TTL_SEGUNDOS = int(os.getenv("CODIGO_TTL_SEGUNDOS", "300"))
+VERIFICADO_TTL_SEGUNDOS = int(os.getenv("VERIFICADO_TTL_SEGUNDOS", "600"))
+CODIGO_MAX_INTENTOS = int(os.getenv("CODIGO_MAX_INTENTOS", "5"))
+INTERVALO_PURGA_SEGUNDOS = float(os.getenv("CODIGOS_INTERVALO_PURGA", "60"))
+CODIGOS_INTERVALO_PURGA_MEMORIA = float(os.getenv("CODIGOS_INTERVALO_PURGA_MEMORIA", "1"))
+CODIGOS_MAX_MEMORIA = int(os.getenv("CODIGOS_MAX_MEMORIA", "100000"))
+CODIGOS_REINTENTOS_INICIO = int(os.getenv("CODIGOS_REINTENTOS_INICIO", "5"))
+CODIGOS_ESPERA_REINTENTO = float(os.getenv("CODIGOS_ESPERA_REINTENTO", "2"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Resultados de verificar()
+VERIFICADO = "verificado"
+INCORRECTO = "incorrecto"
+INVALIDO = "invalido"  # inexistente, expirado, ya verificado o sin intentos
+
+
+class BackendMemoria:
+    """
+    Códigos en un dict local al proceso. Las expiraciones se indexan en un
+    min-heap (expira_en, telefono): la purga, cada segundo, solo saca los que
+    ya vencieron (O(k log n)) en vez de recorrer todo el dict. Con el límite
+    de memoria lleno se desaloja el código más próximo a expirar.
+    """
+
+    nombre = "memoria"
+    intervalo_purga = CODIGOS_INTERVALO_PURGA_MEMORIA
+
+    def __init__(self, max_codigos: int = CODIGOS_MAX_MEMORIA):
+        self.max_codigos = max_codigos
+        self._lock = threading.Lock()
+        # telefono -> [codigo, estado, intentos, expira_en (epoch)]
+        self._codigos: Dict[str, List] = {}
+        # Entradas obsoletas (código reemplazado o eliminado) se descartan al salir del heap
+        self._expiraciones: List[Tuple[float, str]] = []
+
+        # Métricas
+        self.expirados = 0
+        self.desalojados = 0
+
+    async def iniciar(self) -> None:
+        pass
+
+    def _es_actual(self, expira_en: float, telefono: str) -> bool:
+        entrada = self._codigos.get(telefono)
+        return entrada is not None and entrada[3] == expira_en
+
+    def _programar(self, telefono: str, expira_en: float) -> None:
+        heapq.heappush(self._expiraciones, (expira_en, telefono))
+        # Demasiadas entradas obsoletas (reenvíos, verificaciones): reconstruir
+        if len(self._expiraciones) > 2 * len(self._codigos) + 1024:
+            self._expiraciones = [(entrada[3], telefono) for telefono, entrada in self._codigos.items()]
+            heapq.heapify(self._expiraciones)
+
+    def _desalojar(self) -> None:
+        while self._expiraciones:
+            expira_en, telefono = heapq.heappop(self._expiraciones)
+            if self._es_actual(expira_en, telefono):
+                del self._codigos[telefono]
+                self.desalojados += 1
+                return
+
+    def _vigente(self, telefono: str, ahora: float) -> Optional[List]:
+        entrada = self._codigos.get(telefono)
+        if entrada is not None and entrada[3] <= ahora:
+            # Vencido pero aún no purgado; su entrada del heap queda obsoleta
+            del self._codigos[telefono]
+            self.expirados += 1
+            return None
+        return entrada
+
+    async def guardar(self, telefono: str, codigo: str, ttl: int) -> None:
+        with self._lock:
+            if telefono not in self._codigos and len(self._codigos) >= self.max_codigos:
+                self._desalojar()
+            expira_en = time.time() + ttl
+            self._codigos[telefono] = [codigo, "pendiente", 0, expira_en]
+            self._programar(telefono, expira_en)
+
+    async def verificar(self, telefono: str, codigo: str, max_intentos: int, ttl_verificado: int) -> str:
+        with self._lock:
+            ahora = time.time()
+            entrada = self._vigente(telefono, ahora)
+            if entrada is None or entrada[1] != "pendiente" or entrada[2] >= max_intentos:
+                return INVALIDO
+            if entrada[0] != codigo:
+                entrada[2] += 1
+                return INCORRECTO
+            entrada[1] = "verificado"
+            entrada[3] = ahora + ttl_verificado
+            self._programar(telefono, entrada[3])
+            return VERIFICADO
+
+    async def esta_verificado(self, telefono: str) -> bool:
+        with self._lock:
+            entrada = self._vigente(telefono, time.time())
+            return entrada is not None and entrada[1] == "verificado"
+
+    async def eliminar(self, telefono: str) -> bool:
+        with self._lock:
+            return self._codigos.pop(telefono, None) is not None
+
+    async def contar_vigentes(self) -> Optional[int]:
+        # Los vencidos se purgan cada segundo: el tamaño del dict es una buena aproximación
+        return len(self._codigos)
+
+    async def purgar_expirados(self) -> int:
+        with self._lock:
+            ahora = time.time()
+            purgados = 0
+            while self._expiraciones and self._expiraciones[0][0] <= ahora:
+                expira_en, telefono = heapq.heappop(self._expiraciones)
+                if self._es_actual(expira_en, telefono):
+                    del self._codigos[telefono]
+                    purgados += 1
+            self.expirados += purgados
+            return purgados
+
+    def metricas(self) -> dict:
+        return {
+            "codigos_en_memoria": len(self._codigos),
+            "entradas_heap": len(self._expiraciones),
+            "max_codigos": self.max_codigos,
+            "expirados": self.expirados,
+            "desalojados": self.desalojados
+        }
+
+
+class BackendPostgres:
+    """Tabla UNLOGGED compartida por todos los workers; expira por columna expira_en"""
+
+    nombre = "postgres"
+
+    async def iniciar(self) -> None:
+        # La tabla la crea el backend: no pasa por create_all para poder ser UNLOGGED
+        unlogged = "UNLOGGED " if motor.dialect.name == "postgresql" else ""
+        async with motor.begin() as conn:
+            await conn.execute(text(
+                f"CREATE {unlogged}TABLE IF NOT EXISTS codigos_verificacion ("
+                "telefono VARCHAR(20) PRIMARY KEY, "
+                "codigo VARCHAR(10) NOT NULL, "
+                "estado VARCHAR(15) NOT NULL, "
+                "intentos INTEGER NOT NULL DEFAULT 0, "
+                "expira_en TIMESTAMP NOT NULL, "
+                "fecha_creacion TIMESTAMP NOT NULL)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_codigos_verificacion_expira_en "
+                "ON codigos_verificacion (expira_en)"
+            ))
+
+    async def guardar(self, telefono: str, codigo: str, ttl: int) -> None:
+        ahora = datetime.now()
+        async with motor.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO codigos_verificacion (telefono, codigo, estado, intentos, expira_en, fecha_creacion) "
+                "VALUES (:telefono, :codigo, 'pendiente', 0, :expira_en, :ahora) "
+                "ON CONFLICT (telefono) DO UPDATE SET codigo = excluded.codigo, estado = 'pendiente', "
+                "intentos = 0, expira_en = excluded.expira_en, fecha_creacion = excluded.fecha_creacion"
+            ), {"telefono": telefono, "codigo": codigo, "expira_en": ahora + timedelta(seconds=ttl), "ahora": ahora})
+
+    async def verificar(self, telefono: str, codigo: str, max_intentos: int, ttl_verificado: int) -> str:
+        # Un solo UPDATE: el bloqueo de fila serializa verificaciones concurrentes del mismo teléfono
+        ahora = datetime.now()
+        async with motor.begin() as conn:
+            resultado = await conn.execute(text(
+                "UPDATE codigos_verificacion SET "
+                "intentos = intentos + CASE WHEN codigo = :codigo THEN 0 ELSE 1 END, "
+                "estado = CASE WHEN codigo = :codigo THEN 'verificado' ELSE estado END, "
+                "expira_en = CASE WHEN codigo = :codigo THEN :expira_verificado ELSE expira_en END "
+                "WHERE telefono = :telefono AND estado = 'pendiente' "
+                "AND expira_en > :ahora AND intentos < :max_intentos "
+                "RETURNING estado"
+            ), {
+                "telefono": telefono,
+                "codigo": codigo,
+                "expira_verificado": ahora + timedelta(seconds=ttl_verificado),
+                "ahora": ahora,
+                "max_intentos": max_intentos
+            })
+            estado = resultado.scalar_one_or_none()
+        if estado is None:
+            return INVALIDO
+        return VERIFICADO if estado == "verificado" else INCORRECTO
+
+    async def esta_verificado(self, telefono: str) -> bool:
+        async with motor.connect() as conn:
+            resultado = await conn.execute(text(
+                "SELECT 1 FROM codigos_verificacion "
+                "WHERE telefono = :telefono AND estado = 'verificado' AND expira_en > :ahora"
+            ), {"telefono": telefono, "ahora": datetime.now()})
+            return resultado.first() is not None
+
+    async def eliminar(self, telefono: str) -> bool:
+        async with motor.begin() as conn:
+            resultado = await conn.execute(
+                text("DELETE FROM codigos_verificacion WHERE telefono = :telefono"),
+                {"telefono": telefono}
+            )
+            return (resultado.rowcount or 0) > 0
+
+    async def contar_vigentes(self) -> Optional[int]:
+        async with motor.connect() as conn:
+            resultado = await conn.execute(
+                text("SELECT count(*) FROM codigos_verificacion WHERE expira_en > :ahora"),
+                {"ahora": datetime.now()}
+            )
+            return resultado.scalar_one()
+
+    async def purgar_expirados(self) -> int:
+        async with motor.begin() as conn:
+            resultado = await conn.execute(
+                text("DELETE FROM codigos_verificacion WHERE expira_en <= :ahora"),
+                {"ahora": datetime.now()}
+            )
+            return resultado.rowcount or 0
+
+
+# KEYS[1] = clave del teléfono; ARGV = codigo, max_intentos, ttl_verificado
+_LUA_VERIFICAR = """
+local datos = redis.call('HMGET', KEYS[1], 'codigo', 'estado', 'intentos')
+if not datos[1] or datos[2] ~= 'pendiente' or tonumber(datos[3]) >= tonumber(ARGV[2]) then
+    return 0
+end
+if datos[1] == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'estado', 'verificado')
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+redis.call('HINCRBY', KEYS[1], 'intentos', 1)
+return -1
+"""
+
+
+class BackendRedis:
+    """Hash por teléfono con TTL nativo; la verificación es un script Lua atómico"""
+
+    nombre = "redis"
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis.asyncio as redis_asyncio  # dependencia opcional
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+        self._verificar = self._redis.register_script(_LUA_VERIFICAR)
+
+    async def iniciar(self) -> None:
+        await self._redis.ping()
+
+    async def guardar(self, telefono: str, codigo: str, ttl: int) -> None:
+        clave = f"verificacion:{telefono}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(clave)
+            pipe.hset(clave, mapping={"codigo": codigo, "estado": "pendiente", "intentos": 0})
+            pipe.expire(clave, ttl)
+            await pipe.execute()
+
+    async def verificar(self, telefono: str, codigo: str, max_intentos: int, ttl_verificado: int) -> str:
+        resultado = await self._verificar(keys=[f"verificacion:{telefono}"], args=[codigo, max_intentos, ttl_verificado])
+        return {1: VERIFICADO, -1: INCORRECTO}.get(int(resultado), INVALIDO)
+
+    async def esta_verificado(self, telefono: str) -> bool:
+        return await self._redis.hget(f"verificacion:{telefono}", "estado") == "verificado"
+
+    async def eliminar(self, telefono: str) -> bool:
+        return bool(await self._redis.delete(f"verificacion:{telefono}"))
+
+    async def contar_vigentes(self) -> Optional[int]:
+        return None
+
+    async def purgar_expirados(self) -> int:
+        # Redis expira las claves por sí mismo
+        return 0
+
+
+def _crear_backend():
+    if VERIFICACION_BACKEND == "redis":
+        try:
+            return BackendRedis()
+        except ImportError:
+            logger.warning("VERIFICACION_BACKEND=redis pero el paquete 'redis' no está instalado; se usa postgres")
+    if VERIFICACION_BACKEND == "memoria":
+        return BackendMemoria()
+    return BackendPostgres()
+
+
+class AlmacenCodigos:
+    """Fachada sobre el backend configurado, con purga periódica y métricas"""
+
+    def __init__(
+        self,
+        backend=None,
+        ttl: int = CODIGO_TTL_SEGUNDOS,
+        ttl_verificado: int = VERIFICADO_TTL_SEGUNDOS,
+        max_intentos: int = CODIGO_MAX_INTENTOS,
+    ):
+        self.backend = backend or _crear_backend()
+        self.ttl = ttl
+        self.ttl_verificado = ttl_verificado
+        self.max_intentos = max_intentos
+        self._tarea: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.guardados = 0
+        self.verificados = 0
+        self.incorrectos = 0
+        self.invalidos = 0
+        self.purgados = 0
+        self.errores_backend = 0
+
+    async def guardar(self, telefono: str, codigo: str) -> None:
+        """Guarda (o reemplaza) el código pendiente del teléfono"""
+        await self.backend.guardar(telefono, codigo, self.ttl)
+        self.guardados += 1
+
+    async def verificar(self, telefono: str, codigo: str) -> str:
+        """VERIFICADO, INCORRECTO o INVALIDO; un código aceptado ya no se puede reutilizar"""
+        try:
+            resultado = await self.backend.verificar(telefono, codigo, self.max_intentos, self.ttl_verificado)
+        except Exception as e:
+            self.errores_backend += 1
+            logger.error(f"Error en el almacén de códigos ({self.backend.nombre}): {e}")
+            return INVALIDO
+        if resultado == VERIFICADO:
+            self.verificados += 1
+        elif resultado == INCORRECTO:
+            self.incorrectos += 1
+        else:
+            self.invalidos += 1
+        return resultado
+
+    async def esta_verificado(self, telefono: str) -> bool:
+        try:
+            return await self.backend.esta_verificado(telefono)
+        except Exception as e:
+            self.errores_backend += 1
+            logger.error(f"Error en el almacén de códigos ({self.backend.nombre}): {e}")
+            return False
+
+    async def eliminar(self, telefono: str) -> bool:
+        try:
+            return await self.backend.eliminar(telefono)
+        except Exception as e:
+            self.errores_backend += 1
+            logger.error(f"Error en el almacén de códigos ({self.backend.nombre}): {e}")
+            return False
+
+    async def contar_vigentes(self) -> Optional[int]:
+        """Códigos no expirados (None si el backend no puede contarlos barato)"""
+        return await self.backend.contar_vigentes()
+
+    async def purgar_expirados(self) -> int:
+        purgados = await self.backend.purgar_expirados()
+        self.purgados += purgados
+        return purgados
+
+    async def _ciclo_purga(self):
+        while True:
+            await asyncio.sleep(getattr(self.backend, "intervalo_purga", INTERVALO_PURGA_SEGUNDOS))
+            try:
+                await self.purgar_expirados()
+            except Exception as e:
+                self.errores_backend += 1
+                logger.error(f"Error al purgar códigos expirados: {e}")
+
+    async def iniciar(self) -> None:
+        """Prepara el backend y arranca la purga periódica (startup de la app)"""
+        for intento in range(1, CODIGOS_REINTENTOS_INICIO + 1):
+            try:
+                await self.backend.iniciar()
+                break
+            except Exception as e:
+                logger.error(
+                    f"No se pudo iniciar el almacén de códigos '{self.backend.nombre}' "
+                    f"(intento {intento}/{CODIGOS_REINTENTOS_INICIO}): {e}"
+                )
+                if intento < CODIGOS_REINTENTOS_INICIO:
+                    await asyncio.sleep(CODIGOS_ESPERA_REINTENTO * intento)
+                    continue
+                if WEB_CONCURRENCY > 1:
+                    # Códigos por proceso con varios workers: mejor no arrancar
+                    raise RuntimeError(
+                        f"Almacén de códigos '{self.backend.nombre}' no disponible con WEB_CONCURRENCY={WEB_CONCURRENCY}"
+                    ) from e
+                logger.warning("Almacén de códigos en memoria: válido solo porque hay un único worker")
+                self.backend = BackendMemoria()
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._ciclo_purga())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    def metricas(self) -> dict:
+        metricas_backend = self.backend.metricas() if hasattr(self.backend, "metricas") else {}
+        return {
+            **metricas_backend,
+            "backend": self.backend.nombre,
+            "ttl_segundos": self.ttl,
+            "max_intentos": self.max_intentos,
+            "guardados": self.guardados,
+            "verificados": self.verificados,
+            "incorrectos": self.incorrectos,
+            "invalidos": self.invalidos,
+            "purgados": self.purgados,
+            "errores_backend": self.errores_backend
+        }
+
+
+# Instancia compartida por toda la aplicación
+almacen_codigos = AlmacenCodigos()
@@ -27,5 +27,7 @@ def aplicar_cors(app: FastAPI) -> None:
         allow_origins=origins,
         allow_credentials=True,
         allow_methods=["*"],
-        allow_headers=["*"]
+        allow_headers=["*"],
+        # Cursor de paginación de GET /mensajes/{otro_usuario}
+        expose_headers=["X-Cursor-Antes"]
     )
@@ -7,6 +7,8 @@ class AuthErrorMessages:
     TOKEN_INVALID = "Token inválido o corrupto"
     TOKEN_MISSING_INFO = "Token inválido: falta información del usuario"
     USER_NOT_FOUND = "Usuario no encontrado. El token puede estar vinculado a un usuario eliminado"
+    TOKEN_REVOKED = "Token revocado. Por favor, inicia sesión nuevamente"
+    REFRESH_TOKEN_INVALID = "Refresh token inválido, expirado o revocado. Por favor, inicia sesión nuevamente"
     
     # Errores de registro
     EMAIL_ALREADY_EXISTS = "El email ya está registrado"
@@ -15,6 +17,9 @@ class AuthErrorMessages:
     # Errores de contraseña
     CURRENT_PASSWORD_INCORRECT = "La contraseña actual es incorrecta"
     
+    # Errores de autorización
+    INSUFFICIENT_PERMISSIONS = "No tienes permisos para realizar esta acción"
+    
     # Errores generales
     USER_NOT_FOUND_GENERAL = "Usuario no encontrado"
     INTERNAL_SERVER_ERROR = "Error interno del servidor"
@@ -22,6 +27,7 @@ class AuthErrorMessages:
     # Errores de verificación
     INVALID_VERIFICATION_CODE = "Código inválido o expirado"
     CODE_SEND_ERROR = "Error al enviar el código"
+    WHATSAPP_UNAVAILABLE = "El servicio de WhatsApp no está disponible en este momento"
     
     @staticmethod
     def get_token_error_response(error_type: str) -> dict:
@@ -32,10 +38,11 @@ class AuthErrorMessages:
             "token_expired": AuthErrorMessages.TOKEN_EXPIRED,
             "token_invalid": AuthErrorMessages.TOKEN_INVALID,
             "user_not_found": AuthErrorMessages.USER_NOT_FOUND,
-            "missing_info": AuthErrorMessages.TOKEN_MISSING_INFO
+            "missing_info": AuthErrorMessages.TOKEN_MISSING_INFO,
+            "token_revoked": AuthErrorMessages.TOKEN_REVOKED
         }
         return {
             "detail": messages.get(error_type, AuthErrorMessages.TOKEN_INVALID),
             "error_type": error_type,
-            "requires_login": error_type in ["token_expired", "token_invalid"]
+            "requires_login": error_type in ["token_expired", "token_invalid", "token_revoked"]
         }
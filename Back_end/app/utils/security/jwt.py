@@ -1,5 +1,6 @@
 from jose import JWTError, jwt, ExpiredSignatureError
 from datetime import datetime, timedelta
+from dataclasses import dataclass
 import os
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
@@ -7,6 +8,11 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.database import obtener_sesion
 from services.user import buscar_usuario_por_email, buscar_usuario_por_celular  # asegúrate de tener esto
+from utils.security.cache_usuarios import cache_usuarios
+from utils.security.cache_tokens import cache_tokens
+from utils.security.versiones_token import versiones_token
+from utils.security.error_messages import AuthErrorMessages
+from utils.roles import BITS_ROLES, ROL_ARRENDATARIO, mascara_desde_tipo, mascara_roles
 
 load_dotenv()
 
@@ -15,10 +21,33 @@ if SECRET_KEY is None:
     raise ValueError("SECRET_KEY no está configurada en .env")
 
 ALGORITHM = "HS256"
-EXPIRACION_MINUTOS = 60
+# Tokens de acceso de vida corta; se renuevan con /auth/refresh
+EXPIRACION_MINUTOS = int(os.getenv("ACCESS_TOKEN_MINUTOS", "15"))
+# Endpoints de solo lectura autorizados únicamente con los claims del token
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() == "true"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+@dataclass(frozen=True)
+class UsuarioToken:
+    """Usuario reconstruido solo a partir de los claims del JWT (sin consultar la BD)"""
+    id_usuario: int
+    num_celular: str
+    tipo_usuario: str
+    activo: bool
+    roles_mask: int = ROL_ARRENDATARIO
+
+def claims_usuario(usuario) -> dict:
+    """Claims estándar de un token de acceso para el usuario"""
+    return {
+        "sub": usuario.num_celular,
+        "id": usuario.id_usuario,
+        "rol": usuario.tipo_usuario,
+        "roles": mascara_roles(usuario),
+        "activo": usuario.activo if usuario.activo is not None else True,
+        "ver": usuario.token_version or 0
+    }
+
 def crear_token(data: dict):
     datos_a_codificar = data.copy()
     expiracion = datetime.utcnow() + timedelta(minutes=EXPIRACION_MINUTOS)
@@ -26,9 +55,20 @@ def crear_token(data: dict):
     token_jwt = jwt.encode(datos_a_codificar, SECRET_KEY, algorithm=ALGORITHM)
     return token_jwt
 
+def decodificar_token(token: str) -> dict:
+    """
+    jwt.decode con caché de payloads verificados.
+    Lanza ExpiredSignatureError / JWTError igual que jwt.decode.
+    """
+    payload = cache_tokens.obtener(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        cache_tokens.guardar(token, payload)
+    return payload
+
 def verificar_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decodificar_token(token)
         return payload
     except ExpiredSignatureError:
         return {"error": "token_expired"}
@@ -40,7 +80,7 @@ async def obtener_usuario_actual(
     db: AsyncSession = Depends(obtener_sesion)
 ):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decodificar_token(token)
         num_celular: str = payload.get("sub")
         if num_celular is None:
             raise HTTPException(
@@ -61,6 +101,18 @@ async def obtener_usuario_actual(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Caché por (id, sub): evita el SELECT a usuarios en peticiones repetidas
+    id_usuario = payload.get("id")
+    clave_cache = (id_usuario, num_celular)
+    if id_usuario is not None:
+        usuario = cache_usuarios.obtener(clave_cache)
+        if usuario is not None:
+            _verificar_version_token(payload, usuario.token_version or 0)
+            # Adjuntar a la sesión de esta petición sin consultar la BD
+            db.add(usuario)
+            return usuario
+        generacion = cache_usuarios.generacion(id_usuario)
+
     usuario = await buscar_usuario_por_celular(db, num_celular)
     if usuario is None:
         raise HTTPException(
@@ -69,5 +121,99 @@ async def obtener_usuario_actual(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if id_usuario is not None and usuario.id_usuario == id_usuario:
+        cache_usuarios.guardar(clave_cache, usuario, generacion)
+
+    _verificar_version_token(payload, usuario.token_version or 0)
     return usuario
 
+def _verificar_version_token(payload: dict, version_usuario: int) -> None:
+    """Rechaza tokens emitidos antes de la última revocación del usuario"""
+    id_usuario = payload.get("id")
+    if id_usuario is not None:
+        version_usuario = max(version_usuario, versiones_token.version_actual(id_usuario))
+    if payload.get("ver", 0) < version_usuario:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.TOKEN_REVOKED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+async def obtener_usuario_token(token: str = Depends(oauth2_scheme)) -> UsuarioToken:
+    """
+    Autenticación sin estado: valida firma, expiración y versión del token
+    contra el mapa de versiones en memoria, sin tocar la tabla usuarios.
+    Usar solo en endpoints de lectura que necesitan el id del usuario.
+    """
+    try:
+        payload = decodificar_token(token)
+    except ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.TOKEN_EXPIRED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.TOKEN_INVALID,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    id_usuario = payload.get("id")
+    num_celular = payload.get("sub")
+    if id_usuario is None or num_celular is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.TOKEN_MISSING_INFO,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not versiones_token.es_vigente(id_usuario, payload.get("ver", 0)) or not payload.get("activo", True):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthErrorMessages.TOKEN_REVOKED,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    tipo_usuario = payload.get("rol") or "arrendatario"
+    return UsuarioToken(
+        id_usuario=id_usuario,
+        num_celular=num_celular,
+        tipo_usuario=tipo_usuario,
+        activo=payload.get("activo", True),
+        # Tokens emitidos antes de existir el claim "roles" se resuelven desde "rol"
+        roles_mask=payload.get("roles") or mascara_desde_tipo(tipo_usuario)
+    )
+
+# Dependencia para endpoints de solo lectura: sin estado si AUTH_STATELESS=true
+obtener_usuario_lectura = obtener_usuario_token if AUTH_STATELESS else obtener_usuario_actual
+
+def require_roles(*roles: str, lectura: bool = False):
+    """
+    Dependencia que exige al menos uno de los roles indicados.
+    
+    Los roles se leen de roles_mask del usuario autenticado (en caché) o, con
+    lectura=True y AUTH_STATELESS, de los claims del token. Devuelve el usuario.
+    
+    Uso:
+        usuario_actual: Usuario = Depends(require_roles("admin"))
+    """
+    mascara_requerida = 0
+    for rol in roles:
+        if rol not in BITS_ROLES:
+            raise ValueError(f"Rol desconocido: {rol}")
+        mascara_requerida |= BITS_ROLES[rol]
+
+    dependencia_usuario = obtener_usuario_lectura if lectura else obtener_usuario_actual
+
+    async def verificar_roles(usuario_actual=Depends(dependencia_usuario)):
+        if not mascara_roles(usuario_actual) & mascara_requerida:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=AuthErrorMessages.INSUFFICIENT_PERMISSIONS
+            )
+        return usuario_actual
+
+    return verificar_roles
+
@@ -0,0 +1,213 @@
+"""
+Refresh tokens rotativos.
+
+El refresh token es un JWT firmado (typ="refresh") con un jti aleatorio; en
+la tabla refresh_tokens solo se guarda el SHA-256 del jti. Cada uso en
+/auth/refresh lo revoca y emite uno nuevo (rotación), sin ningún trabajo de
+bcrypt.
+
+Los jti revocados se cargan en un filtro de Bloom en memoria. Si un token
+no está en el filtro se pasa directo a la rotación atómica; si "puede
+estar" se confirma con una consulta exacta. Si la rotación atómica no
+consume el token se vuelve a consultar su fila, porque el filtro es local a
+cada worker. Presentar un token ya revocado se considera reutilización y
+revoca toda la sesión del usuario.
+"""
+
+import hashlib
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Tuple
+
+from jose import JWTError, jwt
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import SessionLocal
+from models.refresh_token import RefreshToken
+from models.usuario import Usuario
+from utils.security.bloom import FiltroBloom
+from utils.security.jwt import SECRET_KEY, ALGORITHM
+
+logger = logging.getLogger(__name__)
+
+REFRESH_EXPIRACION_DIAS = int(os.getenv("REFRESH_TOKEN_DIAS", "30"))
+BLOOM_CAPACIDAD = int(os.getenv("REFRESH_BLOOM_CAPACIDAD", "100000"))
+
+
+class RefreshTokenInvalido(Exception):
+    """El refresh token no es válido, expiró o fue revocado"""
+
+
+revocados = FiltroBloom(capacidad=BLOOM_CAPACIDAD)
+
+metricas_refresh = {
+    "emitidos": 0,
+    "rotados": 0,
+    "rechazados": 0,
+    "bloom_posibles_revocados": 0,
+    "bloom_falsos_positivos": 0,
+    "reutilizaciones_detectadas": 0
+}
+
+
+def _hash_jti(jti: str) -> str:
+    return hashlib.sha256(jti.encode("utf-8")).hexdigest()
+
+
+def emitir_refresh_token(db: AsyncSession, usuario: Usuario) -> Tuple[str, str]:
+    """
+    Agrega el registro del nuevo refresh token a la sesión (el llamador hace commit).
+
+    Returns:
+        (token, id_token): el JWT para el cliente y el hash guardado en BD
+    """
+    jti = secrets.token_urlsafe(32)
+    expiracion = datetime.utcnow() + timedelta(days=REFRESH_EXPIRACION_DIAS)
+    id_token = _hash_jti(jti)
+
+    db.add(RefreshToken(
+        id_token=id_token,
+        id_usuario=usuario.id_usuario,
+        fecha_expiracion=expiracion
+    ))
+    token = jwt.encode({
+        "typ": "refresh",
+        "jti": jti,
+        "id": usuario.id_usuario,
+        "ver": usuario.token_version or 0,
+        "exp": expiracion
+    }, SECRET_KEY, algorithm=ALGORITHM)
+
+    metricas_refresh["emitidos"] += 1
+    return token, id_token
+
+
+def _decodificar(token: str) -> dict:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise RefreshTokenInvalido()
+    if payload.get("typ") != "refresh" or not payload.get("jti") or payload.get("id") is None:
+        raise RefreshTokenInvalido()
+    return payload
+
+
+async def _revocar_todos(db: AsyncSession, id_usuario: int) -> None:
+    resultado = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id_usuario == id_usuario, RefreshToken.revocado.is_(False))
+        .values(revocado=True)
+        .returning(RefreshToken.id_token)
+    )
+    for id_token in resultado.scalars().all():
+        revocados.agregar(id_token)
+    await db.commit()
+
+
+async def rotar_refresh_token(db: AsyncSession, token: str) -> Tuple[Usuario, str]:
+    """
+    Revoca el refresh token presentado y emite uno nuevo.
+
+    Returns:
+        (usuario, nuevo_refresh_token)
+    """
+    try:
+        payload = _decodificar(token)
+        id_token = _hash_jti(payload["jti"])
+
+        # Prefiltro: solo los posibles revocados pagan la consulta exacta
+        if id_token in revocados:
+            metricas_refresh["bloom_posibles_revocados"] += 1
+            resultado = await db.execute(
+                select(RefreshToken.revocado).where(RefreshToken.id_token == id_token)
+            )
+            if resultado.scalar_one_or_none():
+                metricas_refresh["reutilizaciones_detectadas"] += 1
+                logger.warning(f"Reutilización de refresh token del usuario {payload['id']}: se revoca la sesión")
+                await _revocar_todos(db, payload["id"])
+                raise RefreshTokenInvalido()
+            metricas_refresh["bloom_falsos_positivos"] += 1
+
+        # Rotación atómica: solo una petición concurrente puede consumir el token
+        resultado = await db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.id_token == id_token,
+                RefreshToken.revocado.is_(False),
+                RefreshToken.fecha_expiracion > datetime.utcnow()
+            )
+            .values(revocado=True)
+            .returning(RefreshToken.id_usuario)
+        )
+        id_usuario = resultado.scalar_one_or_none()
+        if id_usuario is None:
+            # El filtro es por worker: un token rotado en otro worker no está en él
+            resultado = await db.execute(
+                select(RefreshToken.revocado).where(RefreshToken.id_token == id_token)
+            )
+            if resultado.scalar_one_or_none():
+                metricas_refresh["reutilizaciones_detectadas"] += 1
+                logger.warning(f"Reutilización de refresh token del usuario {payload['id']}: se revoca la sesión")
+                revocados.agregar(id_token)
+                await _revocar_todos(db, payload["id"])
+            raise RefreshTokenInvalido()
+
+        usuario = await db.get(Usuario, id_usuario)
+        if usuario is None or usuario.activo is False or payload.get("ver", 0) < (usuario.token_version or 0):
+            await db.rollback()
+            raise RefreshTokenInvalido()
+
+        nuevo_token, nuevo_id = emitir_refresh_token(db, usuario)
+        await db.execute(
+            update(RefreshToken).where(RefreshToken.id_token == id_token).values(reemplazado_por=nuevo_id)
+        )
+        await db.commit()
+
+        revocados.agregar(id_token)
+        metricas_refresh["rotados"] += 1
+        return usuario, nuevo_token
+
+    except RefreshTokenInvalido:
+        metricas_refresh["rechazados"] += 1
+        raise
+
+
+async def revocar_refresh_token(db: AsyncSession, token: str) -> bool:
+    """Revoca un refresh token (logout). Devuelve False si no era válido."""
+    try:
+        payload = _decodificar(token)
+    except RefreshTokenInvalido:
+        return False
+    id_token = _hash_jti(payload["jti"])
+    resultado = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id_token == id_token, RefreshToken.revocado.is_(False))
+        .values(revocado=True)
+    )
+    await db.commit()
+    revocados.agregar(id_token)
+    return resultado.rowcount > 0
+
+
+async def cargar_revocados() -> None:
+    """Purga tokens expirados y llena el filtro de Bloom con los revocados vigentes (startup)"""
+    try:
+        async with SessionLocal() as db:
+            await db.execute(delete(RefreshToken).where(RefreshToken.fecha_expiracion <= datetime.utcnow()))
+            await db.commit()
+            resultado = await db.stream_scalars(
+                select(RefreshToken.id_token).where(RefreshToken.revocado.is_(True))
+            )
+            revocados.limpiar()
+            async for id_token in resultado:
+                revocados.agregar(id_token)
+        logger.info(f"Refresh tokens revocados cargados en el filtro: {revocados.elementos}")
+    except Exception as e:
+        logger.error(f"Error al cargar refresh tokens revocados: {e}")
+
+
+def metricas() -> dict:
+    return {**metricas_refresh, "filtro_bloom": revocados.metricas()}
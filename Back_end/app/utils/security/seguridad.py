@@ -1,5 +1,103 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import bcrypt
 
+# Pool dedicado para bcrypt: cada hash tarda ~100-300 ms y no debe bloquear el event loop
+BCRYPT_MAX_HILOS = int(os.getenv("BCRYPT_MAX_HILOS", str(min(4, os.cpu_count() or 1))))
+# Máximo de operaciones esperando un hilo libre antes de rechazar con 503
+BCRYPT_MAX_COLA = int(os.getenv("BCRYPT_MAX_COLA", "64"))
+
+# Factor de costo de bcrypt; calibrar por máquina con Back_end/calibrar_bcrypt.py
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+_executor_bcrypt = ThreadPoolExecutor(max_workers=BCRYPT_MAX_HILOS, thread_name_prefix="bcrypt")
+
+
+class BcryptSaturado(Exception):
+    """La cola del pool de bcrypt está llena"""
+
+
+class MetricasBcrypt:
+    """Profundidad de cola y latencias del pool de bcrypt"""
+
+    def __init__(self, ventana: int = 1000):
+        self._lock = threading.Lock()
+        self.en_cola = 0
+        self.en_ejecucion = 0
+        self.completadas = 0
+        self.rechazadas = 0
+        self.max_cola_observada = 0
+        self.rehashes_completados = 0
+        self.rehashes_omitidos = 0
+        self._esperas = deque(maxlen=ventana)
+        self._duraciones = deque(maxlen=ventana)
+
+    def encolar(self) -> bool:
+        with self._lock:
+            if self.en_cola >= BCRYPT_MAX_COLA:
+                self.rechazadas += 1
+                return False
+            self.en_cola += 1
+            self.max_cola_observada = max(self.max_cola_observada, self.en_cola)
+            return True
+
+    def descartar(self) -> None:
+        """Operación encolada que nunca llegó a ejecutarse (cancelada antes de empezar)"""
+        with self._lock:
+            self.en_cola -= 1
+
+    def iniciar(self, espera: float) -> None:
+        with self._lock:
+            self.en_cola -= 1
+            self.en_ejecucion += 1
+            self._esperas.append(espera)
+
+    def terminar(self, duracion: float) -> None:
+        with self._lock:
+            self.en_ejecucion -= 1
+            self.completadas += 1
+            self._duraciones.append(duracion)
+
+    @staticmethod
+    def _percentil(valores, p: float) -> float:
+        if not valores:
+            return 0.0
+        ordenados = sorted(valores)
+        indice = min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))
+        return round(ordenados[indice] * 1000, 2)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            esperas = list(self._esperas)
+            duraciones = list(self._duraciones)
+            datos = {
+                "hilos": BCRYPT_MAX_HILOS,
+                "rounds": BCRYPT_ROUNDS,
+                "max_cola": BCRYPT_MAX_COLA,
+                "en_cola": self.en_cola,
+                "en_ejecucion": self.en_ejecucion,
+                "max_cola_observada": self.max_cola_observada,
+                "completadas": self.completadas,
+                "rechazadas": self.rechazadas,
+                "rehashes_completados": self.rehashes_completados,
+                "rehashes_omitidos": self.rehashes_omitidos
+            }
+        datos.update({
+            "espera_ms": {p: self._percentil(esperas, q) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            "ejecucion_ms": {p: self._percentil(duraciones, q) for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+        })
+        return datos
+
+
+metricas_bcrypt = MetricasBcrypt()
+
+
 def verificar_password(password_plana: str, password_hashed: str) -> bool:
     try:
         # Intentar verificar con bcrypt
@@ -12,7 +110,7 @@ def verificar_password(password_plana: str, password_hashed: str) -> bool:
         raise e  # Re-lanzar otros tipos de ValueError
 
 def hashear_password(password_plano: str) -> str:
-    return bcrypt.hashpw(password_plano.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password_plano.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def es_password_hasheada(password: str) -> bool:
     """Verifica si una contraseña ya está hasheada con bcrypt"""
@@ -21,3 +119,53 @@ def es_password_hasheada(password: str) -> bool:
         return password.startswith(('$2a$', '$2b$', '$2x$', '$2y$')) and len(password) == 60
     except Exception:
         return False
+
+def costo_hash(password_hashed: str) -> Optional[int]:
+    """Factor de costo de un hash bcrypt ($2b$12$... -> 12), o None si no es un hash"""
+    if not es_password_hasheada(password_hashed):
+        return None
+    try:
+        return int(password_hashed[4:6])
+    except ValueError:
+        return None
+
+def necesita_rehash(password_hashed: str) -> bool:
+    """True si la contraseña está en texto plano o hasheada con un costo distinto al configurado"""
+    return costo_hash(password_hashed) != BCRYPT_ROUNDS
+
+
+def _ejecutar_medido(funcion, args, encolado: float):
+    inicio = time.perf_counter()
+    metricas_bcrypt.iniciar(inicio - encolado)
+    try:
+        return funcion(*args)
+    finally:
+        metricas_bcrypt.terminar(time.perf_counter() - inicio)
+
+async def _ejecutar_en_pool(funcion, *args):
+    if not metricas_bcrypt.encolar():
+        raise BcryptSaturado("Demasiadas operaciones de contraseña en curso")
+    try:
+        futuro = _executor_bcrypt.submit(_ejecutar_medido, funcion, args, time.perf_counter())
+    except RuntimeError:
+        # Executor cerrado (apagado de la app)
+        metricas_bcrypt.descartar()
+        raise
+    # Si la petición se cancela (cliente desconectado) antes de que el trabajo
+    # empiece, el futuro se cancela sin pasar por _ejecutar_medido: devolver la plaza
+    futuro.add_done_callback(lambda f: metricas_bcrypt.descartar() if f.cancelled() else None)
+    return await asyncio.wrap_future(futuro)
+
+async def verificar_password_async(password_plana: str, password_hashed: str) -> bool:
+    """verificar_password sin bloquear el event loop"""
+    if not es_password_hasheada(password_hashed):
+        # Contraseña legada en texto plano: no hay trabajo de bcrypt que delegar
+        return verificar_password(password_plana, password_hashed)
+    return await _ejecutar_en_pool(verificar_password, password_plana, password_hashed)
+
+async def hashear_password_async(password_plano: str) -> str:
+    """hashear_password sin bloquear el event loop"""
+    return await _ejecutar_en_pool(hashear_password, password_plano)
+
+def cerrar_executor_bcrypt() -> None:
+    _executor_bcrypt.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,293 @@
+"""
+Limitación de intentos de login (anti fuerza bruta).
+
+Cada intento de login puede costar un hash bcrypt; sin límite, unos cientos
+de peticiones por segundo bastan para saturar la CPU. Antes de buscar al
+usuario o verificar la contraseña se consultan dos contadores de ventana
+deslizante:
+
+- por IP: cuenta todos los intentos
+- por celular: cuenta solo los intentos fallidos (un login correcto lo reinicia)
+
+Si alguno supera su límite se responde 429 con Retry-After sin hacer
+ningún trabajo de bcrypt.
+
+El intento se reserva antes de bcrypt: verificar() incrementa el contador y
+recién entonces compara con el límite, así N peticiones concurrentes con el
+mismo celular no pasan todas la comprobación antes de que se registre el
+primer fallo. Si el intento queda bloqueado la reserva se devuelve; si el
+login es correcto el contador del celular se reinicia, y si falla la reserva
+queda como el fallo registrado.
+
+La ventana deslizante se aproxima con dos ventanas fijas consecutivas
+(actual + anterior ponderada por el tiempo que falta), lo que usa memoria
+O(1) por clave y funciona igual en memoria y en Redis.
+
+Backends (THROTTLE_BACKEND):
+- "memoria" (por defecto): contadores locales a cada worker. Con varios
+  workers o instancias cada uno lleva su propia cuenta y el límite efectivo
+  se multiplica por su número; es adecuado solo para un worker.
+- "redis": contadores compartidos entre workers/instancias (REDIS_URL), con
+  el paquete `redis` de requirements.txt. Si no está instalado se avisa en el
+  log y se usa memoria.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "memoria").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+LOGIN_VENTANA_SEGUNDOS = int(os.getenv("LOGIN_VENTANA_SEGUNDOS", "300"))
+LOGIN_MAX_FALLOS_CELULAR = int(os.getenv("LOGIN_MAX_FALLOS_CELULAR", "5"))
+LOGIN_MAX_INTENTOS_IP = int(os.getenv("LOGIN_MAX_INTENTOS_IP", "50"))
+THROTTLE_MAX_CLAVES = int(os.getenv("THROTTLE_MAX_CLAVES", "100000"))
+
+
+class LoginBloqueado(Exception):
+    """Demasiados intentos de login; reintentar después de retry_after segundos"""
+
+    def __init__(self, retry_after: int, motivo: str):
+        super().__init__(f"Demasiados intentos de login ({motivo})")
+        self.retry_after = retry_after
+        self.motivo = motivo
+
+
+def estimar_ventana(actual: int, anterior: int, transcurrido: float, ventana: int) -> float:
+    """Conteo aproximado en la ventana deslizante que termina ahora"""
+    return actual + anterior * (1 - transcurrido / ventana)
+
+
+def segundos_para_desbloqueo(actual: int, anterior: int, transcurrido: float, ventana: int, limite: int) -> int:
+    """Tiempo hasta que el conteo estimado vuelva a quedar por debajo del límite"""
+    if actual >= limite:
+        # Hay que esperar a la siguiente ventana, donde "actual" pasa a ser "anterior"
+        espera = (ventana - transcurrido) + ventana * max(0.0, 1 - (limite - 1) / actual)
+    elif anterior:
+        fraccion = 1 - (limite - 1 - actual) / anterior
+        espera = max(0.0, ventana * fraccion - transcurrido)
+    else:
+        espera = 0.0
+    return max(1, math.ceil(espera))
+
+
+class BackendMemoria:
+    """
+    Contadores por ventana fija guardados en un dict local al proceso.
+
+    El dict se mantiene ordenado por último intento (move_to_end), así que las
+    claves sin actividad reciente quedan al principio: purgar las obsoletas y,
+    si la tabla sigue llena, descartar la menos reciente cuesta O(1) por clave
+    en vez de recorrer toda la tabla en cada clave nueva.
+    """
+
+    nombre = "memoria"
+
+    def __init__(self, max_claves: int = THROTTLE_MAX_CLAVES):
+        self.max_claves = max_claves
+        self._lock = threading.Lock()
+        # clave -> [indice_ventana, conteo_actual, conteo_anterior], de la menos a la más reciente
+        self._contadores: "OrderedDict[str, List[int]]" = OrderedDict()
+        # Ventana de la última purga: una clave solo queda obsoleta al avanzar la ventana
+        self._ventana_purga: Optional[int] = None
+
+    def _rotar(self, entrada: List[int], indice: int) -> None:
+        if entrada[0] == indice:
+            return
+        entrada[2] = entrada[1] if entrada[0] == indice - 1 else 0
+        entrada[1] = 0
+        entrada[0] = indice
+
+    async def leer(self, clave: str, indice: int) -> Tuple[int, int]:
+        with self._lock:
+            entrada = self._contadores.get(clave)
+            if entrada is None:
+                return 0, 0
+            self._rotar(entrada, indice)
+            return entrada[1], entrada[2]
+
+    async def incrementar(self, clave: str, indice: int, ventana: int) -> Tuple[int, int]:
+        """Suma un intento y devuelve los conteos (actual, anterior) ya incrementados"""
+        with self._lock:
+            entrada = self._contadores.get(clave)
+            if entrada is None:
+                if len(self._contadores) >= self.max_claves:
+                    self._purgar(indice)
+                entrada = self._contadores[clave] = [indice, 0, 0]
+            else:
+                self._contadores.move_to_end(clave)
+            self._rotar(entrada, indice)
+            entrada[1] += 1
+            return entrada[1], entrada[2]
+
+    async def decrementar(self, clave: str, indice: int) -> None:
+        with self._lock:
+            entrada = self._contadores.get(clave)
+            if entrada is not None and entrada[0] == indice and entrada[1] > 0:
+                entrada[1] -= 1
+
+    async def reiniciar(self, clave: str, indice: int) -> None:
+        with self._lock:
+            self._contadores.pop(clave, None)
+
+    def _purgar(self, indice: int) -> None:
+        # Claves sin intentos en las dos últimas ventanas, desde la menos reciente (una vez por ventana)
+        if self._ventana_purga != indice:
+            self._ventana_purga = indice
+            while self._contadores:
+                entrada = next(iter(self._contadores.values()))
+                self._rotar(entrada, indice)
+                if entrada[1] or entrada[2]:
+                    break
+                self._contadores.popitem(last=False)
+        # Si aún está lleno se descarta la de intento menos reciente
+        while len(self._contadores) >= self.max_claves:
+            self._contadores.popitem(last=False)
+
+    def claves_activas(self) -> int:
+        return len(self._contadores)
+
+
+class BackendRedis:
+    """Contadores por ventana fija en Redis (INCR + EXPIRE), compartidos entre workers"""
+
+    nombre = "redis"
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis.asyncio as redis_asyncio  # dependencia opcional
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def leer(self, clave: str, indice: int) -> Tuple[int, int]:
+        actual, anterior = await self._redis.mget(f"throttle:{clave}:{indice}", f"throttle:{clave}:{indice - 1}")
+        return int(actual or 0), int(anterior or 0)
+
+    async def incrementar(self, clave: str, indice: int, ventana: int) -> Tuple[int, int]:
+        llave = f"throttle:{clave}:{indice}"
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.incr(llave)
+            pipe.expire(llave, ventana * 2)
+            pipe.get(f"throttle:{clave}:{indice - 1}")
+            actual, _, anterior = await pipe.execute()
+        return int(actual), int(anterior or 0)
+
+    async def decrementar(self, clave: str, indice: int) -> None:
+        await self._redis.decr(f"throttle:{clave}:{indice}")
+
+    async def reiniciar(self, clave: str, indice: int) -> None:
+        await self._redis.delete(f"throttle:{clave}:{indice}", f"throttle:{clave}:{indice - 1}")
+
+    def claves_activas(self) -> Optional[int]:
+        return None
+
+
+def _crear_backend():
+    if THROTTLE_BACKEND == "redis":
+        try:
+            return BackendRedis()
+        except ImportError:
+            logger.warning("THROTTLE_BACKEND=redis pero el paquete 'redis' no está instalado; se usa memoria")
+    return BackendMemoria()
+
+
+class LimitadorLogin:
+    """Contadores de ventana deslizante por IP y por celular para /auth/login"""
+
+    def __init__(
+        self,
+        backend=None,
+        ventana: int = LOGIN_VENTANA_SEGUNDOS,
+        max_fallos_celular: int = LOGIN_MAX_FALLOS_CELULAR,
+        max_intentos_ip: int = LOGIN_MAX_INTENTOS_IP,
+    ):
+        self.backend = backend or _crear_backend()
+        self.ventana = ventana
+        self.max_fallos_celular = max_fallos_celular
+        self.max_intentos_ip = max_intentos_ip
+
+        # Métricas
+        self.verificaciones = 0
+        self.bloqueos_celular = 0
+        self.bloqueos_ip = 0
+        self.fallos_registrados = 0
+        self.errores_backend = 0
+
+    def _ventana_actual(self) -> Tuple[int, float]:
+        ahora = time.time()
+        indice = int(ahora // self.ventana)
+        return indice, ahora - indice * self.ventana
+
+    async def _reservar(self, clave: str, limite: int, indice: int, transcurrido: float) -> Optional[int]:
+        """Cuenta el intento y, si con él se pasa del límite, lo devuelve y retorna la espera"""
+        actual, anterior = await self.backend.incrementar(clave, indice, self.ventana)
+        # Conteo previo a este intento: se bloquea en las mismas condiciones que sin reserva
+        actual -= 1
+        if estimar_ventana(actual, anterior, transcurrido, self.ventana) >= limite:
+            await self.backend.decrementar(clave, indice)
+            return segundos_para_desbloqueo(actual, anterior, transcurrido, self.ventana, limite)
+        return None
+
+    async def verificar(self, celular: str, ip: Optional[str]) -> None:
+        """
+        Llamar antes de buscar al usuario o verificar la contraseña.
+        Reserva el intento para la IP y para el celular (como fallo hasta que
+        registrar_exito lo reinicie) y lanza LoginBloqueado si hay que rechazarlo.
+        """
+        self.verificaciones += 1
+        indice, transcurrido = self._ventana_actual()
+        clave_celular = f"login:celular:{celular}"
+        try:
+            espera = await self._reservar(clave_celular, self.max_fallos_celular, indice, transcurrido)
+            if espera is not None:
+                self.bloqueos_celular += 1
+                raise LoginBloqueado(espera, "celular")
+
+            if ip:
+                espera = await self._reservar(f"login:ip:{ip}", self.max_intentos_ip, indice, transcurrido)
+                if espera is not None:
+                    self.bloqueos_ip += 1
+                    # El intento no llega a bcrypt: no cuenta como fallo del celular
+                    await self.backend.decrementar(clave_celular, indice)
+                    raise LoginBloqueado(espera, "ip")
+        except LoginBloqueado:
+            raise
+        except Exception as e:
+            # Si el backend compartido falla no se bloquea el login de nadie
+            self.errores_backend += 1
+            logger.error(f"Error en el backend de throttling: {e}")
+
+    async def registrar_fallo(self, celular: str) -> None:
+        # El fallo ya quedó contado con la reserva de verificar()
+        self.fallos_registrados += 1
+
+    async def registrar_exito(self, celular: str) -> None:
+        indice, _ = self._ventana_actual()
+        try:
+            await self.backend.reiniciar(f"login:celular:{celular}", indice)
+        except Exception as e:
+            self.errores_backend += 1
+            logger.error(f"Error en el backend de throttling: {e}")
+
+    def metricas(self) -> dict:
+        return {
+            "backend": self.backend.nombre,
+            "ventana_segundos": self.ventana,
+            "max_fallos_celular": self.max_fallos_celular,
+            "max_intentos_ip": self.max_intentos_ip,
+            "verificaciones": self.verificaciones,
+            "bloqueos_celular": self.bloqueos_celular,
+            "bloqueos_ip": self.bloqueos_ip,
+            "fallos_registrados": self.fallos_registrados,
+            "errores_backend": self.errores_backend,
+            "claves_activas": self.backend.claves_activas()
+        }
+
+
+# Instancia compartida por toda la aplicación
+limitador_login = LimitadorLogin()
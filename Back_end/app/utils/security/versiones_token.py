@@ -0,0 +1,107 @@
+"""
+Versiones de token por usuario para revocar JWT sin estado.
+
+Cada token lleva el claim "ver" con la token_version del usuario al emitirse.
+Cambiar la contraseña, el celular o desactivar la cuenta incrementa esa
+versión y todos los tokens anteriores dejan de ser válidos.
+
+Para no consultar usuarios en cada petición se mantiene en memoria un mapa
+compacto {id_usuario: version} con solo los usuarios cuya versión es mayor
+que 0, refrescado desde la BD en segundo plano. En el worker que hace el
+cambio la revocación es inmediata; en los demás tarda como máximo un
+intervalo de refresco.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from db.database import SessionLocal
+from models.usuario import Usuario
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_REFRESCO_SEGUNDOS = float(os.getenv("TOKEN_VERSIONES_INTERVALO", "30"))
+
+
+class VersionesToken:
+    def __init__(self, intervalo: float = INTERVALO_REFRESCO_SEGUNDOS):
+        self.intervalo = intervalo
+        self._versiones: Dict[int, int] = {}
+        self._tarea: Optional[asyncio.Task] = None
+        self.refrescos = 0
+        self.errores_refresco = 0
+        self.tokens_rechazados = 0
+
+    def version_actual(self, id_usuario: int) -> int:
+        return self._versiones.get(id_usuario, 0)
+
+    def es_vigente(self, id_usuario: int, version_token: int) -> bool:
+        """True si el token no fue emitido antes de la última revocación"""
+        if version_token < self.version_actual(id_usuario):
+            self.tokens_rechazados += 1
+            return False
+        return True
+
+    def registrar(self, id_usuario: int, version: int) -> None:
+        """Actualiza el mapa local tras confirmar (commit) un cambio de versión"""
+        if version > self.version_actual(id_usuario):
+            self._versiones[id_usuario] = version
+
+    async def refrescar(self) -> None:
+        try:
+            async with SessionLocal() as db:
+                resultado = await db.execute(
+                    select(Usuario.id_usuario, Usuario.token_version).where(Usuario.token_version > 0)
+                )
+                # Fusionar, no reemplazar: un registrar() hecho mientras se leía
+                # la BD puede ser más nuevo que la fila leída
+                for id_usuario, version in resultado.all():
+                    if version > self._versiones.get(id_usuario, 0):
+                        self._versiones[id_usuario] = version
+            self.refrescos += 1
+        except Exception as e:
+            self.errores_refresco += 1
+            logger.error(f"Error al refrescar versiones de token: {e}")
+
+    async def _ciclo_refresco(self):
+        while True:
+            await self.refrescar()
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self) -> None:
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._ciclo_refresco())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    def metricas(self) -> dict:
+        return {
+            "usuarios_con_revocaciones": len(self._versiones),
+            "refrescos": self.refrescos,
+            "errores_refresco": self.errores_refresco,
+            "tokens_rechazados": self.tokens_rechazados
+        }
+
+
+# Instancia compartida por toda la aplicación
+versiones_token = VersionesToken()
+
+
+def revocar_tokens_usuario(usuario: Usuario) -> int:
+    """
+    Incrementa token_version en la sesión del llamador (no hace commit).
+    Tras el commit, llamar a versiones_token.registrar(id, version).
+    """
+    usuario.token_version = (usuario.token_version or 0) + 1
+    return usuario.token_version
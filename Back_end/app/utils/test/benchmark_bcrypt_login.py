@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latencia de endpoints ajenos durante una ráfaga de logins
+
+Compara bcrypt ejecutado directamente en el handler (bloquea el event loop)
+contra el pool dedicado de utils.security.seguridad. Mientras N clientes
+hacen login sin parar, otro cliente mide la latencia de un endpoint trivial
+(/ping) a ritmo fijo y se reporta su p50/p95/p99.
+
+No necesita base de datos ni servidor: usa una app FastAPI mínima servida
+en memoria con httpx.ASGITransport (mismo event loop que un worker real).
+
+Uso:
+    python utils/test/benchmark_bcrypt_login.py --concurrencia 16 --duracion 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Agregar el directorio app/ al path para importar los módulos
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, APP_DIR)
+
+import httpx
+from fastapi import FastAPI
+
+from utils.security.seguridad import (
+    verificar_password, verificar_password_async, hashear_password, metricas_bcrypt
+)
+
+PASSWORD = "ClaveDePrueba123"
+INTERVALO_PING = 0.01
+HASH = hashear_password(PASSWORD)
+
+app = FastAPI()
+
+@app.post("/login-directo")
+async def login_directo():
+    return {"ok": verificar_password(PASSWORD, HASH)}
+
+@app.post("/login-pool")
+async def login_pool():
+    return {"ok": await verificar_password_async(PASSWORD, HASH)}
+
+@app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+async def ejecutar_modo(ruta_login: str, concurrencia: int, duracion: float) -> dict:
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        fin = time.perf_counter() + duracion
+        logins = 0
+
+        async def atacante():
+            nonlocal logins
+            while time.perf_counter() < fin:
+                await cliente.post(ruta_login)
+                logins += 1
+
+        async def sonda(latencias):
+            # Pings a ritmo fijo; la latencia se mide desde el instante programado
+            # para no ocultar el tiempo que el event loop estuvo bloqueado
+            programado = time.perf_counter()
+            while programado < fin:
+                await asyncio.sleep(max(0.0, programado - time.perf_counter()))
+                await cliente.get("/ping")
+                latencias.append((time.perf_counter() - programado) * 1000)
+                programado += INTERVALO_PING
+
+        latencias = []
+        await asyncio.gather(sonda(latencias), *(atacante() for _ in range(concurrencia)))
+
+    return {
+        "logins_por_segundo": round(logins / duracion, 1),
+        "pings": len(latencias),
+        "ping_p50_ms": round(statistics.median(latencias), 2),
+        "ping_p95_ms": round(percentil(latencias, 0.95), 2),
+        "ping_p99_ms": round(percentil(latencias, 0.99), 2)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=16, help="Clientes haciendo login en paralelo")
+    parser.add_argument("--duracion", type=float, default=5.0, help="Segundos por modo")
+    args = parser.parse_args()
+
+    print("🚀 BENCHMARK BCRYPT - RÁFAGA DE LOGINS")
+    print("=" * 60)
+    print(f"Concurrencia: {args.concurrencia} | Duración por modo: {args.duracion}s")
+
+    for nombre, ruta in (("bcrypt en el event loop", "/login-directo"), ("bcrypt en pool dedicado", "/login-pool")):
+        resultado = await ejecutar_modo(ruta, args.concurrencia, args.duracion)
+        print(f"\n📊 {nombre}")
+        for clave, valor in resultado.items():
+            print(f"   {clave:<20}: {valor}")
+
+    print("\n📈 Métricas del pool:")
+    for clave, valor in metricas_bcrypt.snapshot().items():
+        print(f"   {clave:<20}: {valor}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
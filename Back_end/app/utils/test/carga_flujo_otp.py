@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: flujo completo de registro por WhatsApp
+
+Cada usuario virtual recorre:
+1. POST /whatsapp-auth/enviar-codigo-registro
+2. espera a que el código llegue al stub de WhatsApp (la cola lo envía en
+   segundo plano) y lo lee de GET /stub/mensajes
+3. POST /whatsapp-auth/verificar-codigo-registro
+4. POST /whatsapp-auth/completar-registro
+
+Los usuarios llegan a una tasa fija (RPS objetivo, carga de lazo abierto: no
+se espera a que termine un flujo para lanzar el siguiente). Al final se
+reporta por paso: completados, errores, throughput y latencias p50/p95/p99.
+
+Requiere la API en marcha (con PostgreSQL) apuntando al stub:
+    python utils/test/stub_whatsapp.py --puerto 3000 --latencia-ms 150 --jitter-ms 100
+    WHATSAPP_API_URL=http://localhost:3000 uvicorn main:app --workers 4
+
+Los usuarios creados quedan en la BD (usar una base de pruebas).
+
+Uso:
+    python utils/test/carga_flujo_otp.py --api http://localhost:8000 --stub http://localhost:3000 --rps 20 --duracion 30
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+PASOS = ["enviar_codigo", "entrega_whatsapp", "verificar_codigo", "completar_registro", "flujo_completo"]
+
+
+class Resultados:
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(Counter)
+
+    def exito(self, paso: str, segundos: float) -> None:
+        self.latencias[paso].append(segundos)
+
+    def error(self, paso: str, motivo: str) -> None:
+        self.errores[paso][motivo] += 1
+
+
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+def celular_aleatorio() -> str:
+    return "9" + "".join(random.choices("0123456789", k=8))
+
+async def esperar_codigo(stub: httpx.AsyncClient, telefono: str, timeout: float) -> str:
+    limite = time.perf_counter() + timeout
+    while time.perf_counter() < limite:
+        respuesta = await stub.get("/stub/mensajes", params={"phone": telefono, "limite": 1})
+        mensajes = respuesta.json()
+        if mensajes and mensajes[0]["codigo"]:
+            return mensajes[0]["codigo"]
+        await asyncio.sleep(0.05)
+    raise TimeoutError("el código no llegó al stub")
+
+async def paso(resultados: Resultados, nombre: str, peticion) -> httpx.Response:
+    inicio = time.perf_counter()
+    try:
+        respuesta = await peticion
+    except httpx.HTTPError as e:
+        resultados.error(nombre, type(e).__name__)
+        raise
+    if respuesta.status_code >= 400:
+        resultados.error(nombre, str(respuesta.status_code))
+        raise RuntimeError(f"{nombre}: HTTP {respuesta.status_code}")
+    resultados.exito(nombre, time.perf_counter() - inicio)
+    return respuesta
+
+async def flujo(api: httpx.AsyncClient, stub: httpx.AsyncClient, resultados: Resultados, sufijo: str, numero: int, timeout_entrega: float):
+    telefono = celular_aleatorio()
+    inicio = time.perf_counter()
+    try:
+        await paso(resultados, "enviar_codigo", api.post(
+            "/whatsapp-auth/enviar-codigo-registro", json={"phone_number": telefono}
+        ))
+
+        inicio_entrega = time.perf_counter()
+        try:
+            codigo = await esperar_codigo(stub, telefono, timeout_entrega)
+        except TimeoutError:
+            resultados.error("entrega_whatsapp", "timeout")
+            return
+        resultados.exito("entrega_whatsapp", time.perf_counter() - inicio_entrega)
+
+        await paso(resultados, "verificar_codigo", api.post(
+            "/whatsapp-auth/verificar-codigo-registro", json={"phone_number": telefono, "code": codigo}
+        ))
+        await paso(resultados, "completar_registro", api.post(
+            "/whatsapp-auth/completar-registro",
+            params={"num_celular": telefono},
+            json={
+                "email": f"carga_{sufijo}_{numero}@prueba.com",
+                "nombres": "Carga",
+                "apellido_paterno": "Prueba",
+                "password": "ClaveDePrueba123",
+                "confirmar_password": "ClaveDePrueba123"
+            }
+        ))
+        resultados.exito("flujo_completo", time.perf_counter() - inicio)
+    except (RuntimeError, httpx.HTTPError):
+        resultados.error("flujo_completo", "paso_fallido")
+
+async def main(url_api: str, url_stub: str, rps: float, duracion: float, timeout_entrega: float):
+    sufijo = f"{int(time.time())}{random.randint(100, 999)}"
+    resultados = Resultados()
+    limites = httpx.Limits(max_connections=500, max_keepalive_connections=100)
+
+    async with httpx.AsyncClient(base_url=url_api, timeout=60, limits=limites) as api, \
+               httpx.AsyncClient(base_url=url_stub, timeout=10, limits=limites) as stub:
+        await stub.post("/stub/reiniciar")
+        total = int(rps * duracion)
+        print(f"🚀 {total} flujos a {rps} RPS durante {duracion}s contra {url_api} (stub {url_stub})")
+        print("="*78)
+
+        inicio = time.perf_counter()
+        tareas = []
+        for numero in range(total):
+            # Llegadas a tasa fija respecto al inicio (sin acumular deriva)
+            espera = inicio + numero / rps - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            tareas.append(asyncio.create_task(flujo(api, stub, resultados, sufijo, numero, timeout_entrega)))
+        await asyncio.gather(*tareas)
+        transcurrido = time.perf_counter() - inicio
+        estadisticas_stub = (await stub.get("/stub/estadisticas")).json()
+
+    print(f"{'paso':<20} {'ok':>6} {'error':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    print("-"*78)
+    for nombre in PASOS:
+        latencias = resultados.latencias[nombre]
+        errores = sum(resultados.errores[nombre].values())
+        if latencias:
+            p50, p95, p99 = (percentil(latencias, p) * 1000 for p in (0.5, 0.95, 0.99))
+            print(f"{nombre:<20} {len(latencias):>6} {errores:>6} {len(latencias) / transcurrido:>8.1f} "
+                  f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+        else:
+            print(f"{nombre:<20} {0:>6} {errores:>6}")
+    print("="*78)
+    for nombre in PASOS:
+        if resultados.errores[nombre]:
+            print(f"❌ {nombre}: {dict(resultados.errores[nombre])}")
+    print(f"📊 Stub: {estadisticas_stub}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga sobre el flujo enviar → verificar → completar registro")
+    parser.add_argument("--api", default="http://localhost:8000")
+    parser.add_argument("--stub", default="http://localhost:3000")
+    parser.add_argument("--rps", type=float, default=10, help="Flujos nuevos por segundo")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos generando carga")
+    parser.add_argument("--timeout-entrega", type=float, default=30, help="Espera máxima del código en el stub")
+    args = parser.parse_args()
+    asyncio.run(main(args.api, args.stub, args.rps, args.duracion, args.timeout_entrega))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Prueba de estrés: registros concurrentes con el mismo email / celular
+
+Lanza N peticiones simultáneas a POST /auth/registro contra un servidor en
+marcha (con PostgreSQL). Con las restricciones únicas como única fuente de
+verdad debe cumplirse en cada ronda:
+- exactamente 1 respuesta 201
+- el resto 400 con el mensaje de duplicado (nunca 500)
+
+Rondas:
+1. mismo email y mismo celular
+2. mismo email, celulares distintos
+3. emails distintos, mismo celular
+
+Los usuarios creados quedan en la BD (usar una base de pruebas).
+
+Uso:
+    python utils/test/estres_registro_concurrente.py --url http://localhost:8000 --concurrencia 50
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import httpx
+
+
+def datos_usuario(email: str, celular: str) -> dict:
+    return {
+        "email": email,
+        "nombres": "Prueba",
+        "apellido_paterno": "Concurrente",
+        "num_celular": celular,
+        "password": "ClaveDePrueba123"
+    }
+
+def celular_aleatorio() -> str:
+    return "9" + "".join(random.choices("0123456789", k=8))
+
+async def ejecutar_ronda(cliente: httpx.AsyncClient, nombre: str, cuerpos: list) -> bool:
+    inicio = time.perf_counter()
+    respuestas = await asyncio.gather(
+        *(cliente.post("/auth/registro", json=cuerpo) for cuerpo in cuerpos),
+        return_exceptions=True
+    )
+    duracion = time.perf_counter() - inicio
+
+    estados = Counter()
+    detalles = Counter()
+    for respuesta in respuestas:
+        if isinstance(respuesta, Exception):
+            estados[type(respuesta).__name__] += 1
+            continue
+        estados[respuesta.status_code] += 1
+        if respuesta.status_code == 400:
+            detalles[respuesta.json().get("detail")] += 1
+
+    correcto = estados.get(201, 0) == 1 and estados.get(400, 0) == len(cuerpos) - 1
+    print(f"\n{'✅' if correcto else '❌'} {nombre}  ({len(cuerpos)} peticiones en {duracion:.2f}s)")
+    for estado, cantidad in sorted(estados.items(), key=lambda item: str(item[0])):
+        print(f"   {estado}: {cantidad}")
+    for detalle, cantidad in detalles.items():
+        print(f"   400 «{detalle}»: {cantidad}")
+    return correcto
+
+async def main(url: str, concurrencia: int):
+    sufijo = f"{int(time.time())}{random.randint(100, 999)}"
+    limites = httpx.Limits(max_connections=concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limites) as cliente:
+        print(f"🚀 Registro concurrente contra {url} con {concurrencia} peticiones por ronda")
+        print("="*60)
+
+        celular = celular_aleatorio()
+        ronda1 = [datos_usuario(f"estres1_{sufijo}@prueba.com", celular) for _ in range(concurrencia)]
+
+        ronda2 = [datos_usuario(f"estres2_{sufijo}@prueba.com", celular_aleatorio()) for _ in range(concurrencia)]
+
+        celular = celular_aleatorio()
+        ronda3 = [datos_usuario(f"estres3_{sufijo}_{i}@prueba.com", celular) for i in range(concurrencia)]
+
+        resultados = [
+            await ejecutar_ronda(cliente, "Mismo email y celular", ronda1),
+            await ejecutar_ronda(cliente, "Mismo email, celulares distintos", ronda2),
+            await ejecutar_ronda(cliente, "Emails distintos, mismo celular", ronda3),
+        ]
+
+    print("\n" + "="*60)
+    print("🎉 Todas las rondas correctas" if all(resultados) else "❌ Hubo rondas con resultados inesperados")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estrés de registros concurrentes duplicados")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrencia", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.concurrencia))
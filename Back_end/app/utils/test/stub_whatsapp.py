@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Stub local del microservicio WhatsApp (Node.js)
+
+Implementa los endpoints que usa services/whatsapp.py sin enviar mensajes
+reales. Sirve para desarrollo, pruebas de carga y para comprobar la
+reutilización de conexiones del cliente compartido:
+
+- latencia configurable (fija + jitter aleatorio)
+- tasa de error configurable (responde 500 o {"success": false})
+- captura de los mensajes enviados, con el código OTP extraído, para que
+  una prueba pueda completar la verificación sin un teléfono real
+- estado conectado/desconectado simulable (para el circuit breaker)
+
+Endpoints:
+- POST /api/whatsapp/send-message  -> {"success": true}
+- GET  /api/whatsapp/status        -> {"connected": true, "authenticated": true}
+- GET  /stub/estadisticas          -> peticiones, mensajes, errores y conexiones vistas
+- GET  /stub/mensajes?phone=...    -> mensajes capturados (los más recientes primero)
+- GET  /stub/configuracion         -> configuración actual
+- POST /stub/configurar            -> cambia latencia, errores o estado en caliente
+- POST /stub/reiniciar             -> pone los contadores a cero y vacía la captura
+
+Uso:
+    python utils/test/stub_whatsapp.py --puerto 3000 --latencia-ms 200 --jitter-ms 100 --tasa-error 0.05
+    WHATSAPP_API_URL=http://localhost:3000 uvicorn main:app
+"""
+import argparse
+import asyncio
+import random
+import re
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import uvicorn
+
+app = FastAPI(title="Stub WhatsApp UBIKHA")
+
+configuracion = {
+    "latencia_ms": 0.0,
+    "jitter_ms": 0.0,
+    "tasa_error": 0.0,
+    "modo_error": "http",  # "http" -> 500, "respuesta" -> 200 con success=false
+    "conectado": True,
+    "max_capturados": 10000
+}
+
+estadisticas = {"peticiones": 0, "mensajes": 0, "errores": 0}
+conexiones = set()
+capturados = deque(maxlen=configuracion["max_capturados"])
+
+# El código es el primer número de 6 dígitos entre asteriscos del mensaje de verificación
+PATRON_CODIGO = re.compile(r"\*(\d{6})\*")
+
+
+class Configuracion(BaseModel):
+    latencia_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    tasa_error: Optional[float] = None
+    modo_error: Optional[str] = None
+    conectado: Optional[bool] = None
+
+
+def _registrar(request: Request) -> None:
+    estadisticas["peticiones"] += 1
+    if request.client:
+        # Cada conexión TCP del cliente usa un puerto de origen distinto
+        conexiones.add((request.client.host, request.client.port))
+
+async def _simular_latencia() -> None:
+    espera = configuracion["latencia_ms"] + random.uniform(0, configuracion["jitter_ms"])
+    if espera > 0:
+        await asyncio.sleep(espera / 1000)
+
+@app.post("/api/whatsapp/send-message")
+async def enviar_mensaje(request: Request):
+    _registrar(request)
+    datos = await request.json()
+    await _simular_latencia()
+
+    if not configuracion["conectado"] or random.random() < configuracion["tasa_error"]:
+        estadisticas["errores"] += 1
+        if configuracion["modo_error"] == "respuesta":
+            return {"success": False, "error": "Error simulado"}
+        return JSONResponse(status_code=500, content={"success": False, "error": "Error simulado"})
+
+    mensaje = datos.get("message", "")
+    codigo = PATRON_CODIGO.search(mensaje)
+    capturados.appendleft({
+        "phone": datos.get("phone"),
+        "message": mensaje,
+        "codigo": codigo.group(1) if codigo else None,
+        "fecha": datetime.now().isoformat()
+    })
+    estadisticas["mensajes"] += 1
+    return {"success": True, "phone": datos.get("phone")}
+
+@app.get("/api/whatsapp/status")
+async def estado(request: Request):
+    _registrar(request)
+    await _simular_latencia()
+    return {"connected": configuracion["conectado"], "authenticated": configuracion["conectado"]}
+
+@app.get("/stub/estadisticas")
+async def obtener_estadisticas():
+    return {**estadisticas, "conexiones": len(conexiones), "capturados": len(capturados)}
+
+@app.get("/stub/mensajes")
+async def obtener_mensajes(phone: Optional[str] = None, limite: int = 50):
+    """Mensajes capturados; phone acepta 9 dígitos o formato internacional"""
+    mensajes = capturados
+    if phone:
+        mensajes = (m for m in capturados if m["phone"] and m["phone"].endswith(phone[-9:]))
+    resultado = []
+    for mensaje in mensajes:
+        resultado.append(mensaje)
+        if len(resultado) >= limite:
+            break
+    return resultado
+
+@app.get("/stub/configuracion")
+async def obtener_configuracion():
+    return configuracion
+
+@app.post("/stub/configurar")
+async def configurar(cambios: Configuracion):
+    configuracion.update({clave: valor for clave, valor in cambios.model_dump().items() if valor is not None})
+    return configuracion
+
+@app.post("/stub/reiniciar")
+async def reiniciar():
+    estadisticas.update(peticiones=0, mensajes=0, errores=0)
+    conexiones.clear()
+    capturados.clear()
+    return {"ok": True}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub del microservicio WhatsApp")
+    parser.add_argument("--puerto", type=int, default=3000)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia fija por petición")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Latencia aleatoria adicional (0..jitter)")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de envíos que fallan (0..1)")
+    parser.add_argument("--modo-error", choices=["http", "respuesta"], default="http")
+    parser.add_argument("--desconectado", action="store_true", help="Simular WhatsApp sin sesión")
+    args = parser.parse_args()
+    configuracion.update(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        tasa_error=args.tasa_error,
+        modo_error=args.modo_error,
+        conectado=not args.desconectado
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.puerto, log_level="warning")
@@ -90,7 +90,7 @@ async def test_whatsapp_integration():
     # PRUEBA 4: Generar código de verificación
     print("\n🔢 PRUEBA 4: Generando código de verificación...")
     test_phone = "987654321"  # Número de prueba
-    code = whatsapp_service.generate_code(test_phone)
+    code = await whatsapp_service.generate_code(test_phone)
     print(f"✅ Código generado: {code}")
     
     # PREGUNTA AL USUARIO
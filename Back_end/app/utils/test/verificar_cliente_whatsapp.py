@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Verificación: cliente HTTP compartido de WhatsAppService contra el stub local
+
+Levanta utils/test/stub_whatsapp.py en el mismo proceso y envía N mensajes:
+1. Como antes: un httpx.AsyncClient nuevo por llamada
+2. Con WhatsAppService y el cliente compartido (keep-alive)
+
+Reporta conexiones TCP que vio el stub, tiempo total por mensaje y las métricas de
+reutilización del servicio. Con el cliente compartido las conexiones deben
+quedar acotadas por WHATSAPP_MAX_KEEPALIVE en vez de crecer con N.
+
+Uso:
+    python utils/test/verificar_cliente_whatsapp.py --mensajes 200 --concurrencia 10
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+# Agregar el directorio app/ al path para importar los módulos
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+PUERTO = puerto_libre()
+os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PUERTO}"
+
+import httpx
+import uvicorn
+
+import stub_whatsapp
+from services.whatsapp import (
+    WhatsAppService, iniciar_cliente_whatsapp, cerrar_cliente_whatsapp, metricas_http_whatsapp
+)
+
+TELEFONO = "987654321"
+
+
+async def estadisticas_stub(cliente: httpx.AsyncClient, reiniciar: bool = False) -> dict:
+    if reiniciar:
+        await cliente.post(f"http://127.0.0.1:{PUERTO}/stub/reiniciar")
+        return {}
+    return (await cliente.get(f"http://127.0.0.1:{PUERTO}/stub/estadisticas")).json()
+
+async def en_paralelo(funcion, total: int, concurrencia: int) -> float:
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def una():
+        async with semaforo:
+            await funcion()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una() for _ in range(total)))
+    return (time.perf_counter() - inicio) / total * 1000
+
+async def main(mensajes: int, concurrencia: int):
+    servidor = uvicorn.Server(uvicorn.Config(stub_whatsapp.app, host="127.0.0.1", port=PUERTO, log_level="warning"))
+    tarea_servidor = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.05)
+
+    url = f"http://127.0.0.1:{PUERTO}/api/whatsapp/send-message"
+    payload = {"phone": "51" + TELEFONO, "message": "prueba"}
+
+    async with httpx.AsyncClient() as control:
+        print(f"🚀 Stub WhatsApp en :{PUERTO} - {mensajes} mensajes, concurrencia {concurrencia}")
+        print("\n" + "="*60)
+
+        # 1. Cliente nuevo por llamada (comportamiento anterior)
+        await estadisticas_stub(control, reiniciar=True)
+
+        async def cliente_por_llamada():
+            async with httpx.AsyncClient(timeout=30.0) as cliente:
+                await cliente.post(url, json=payload)
+
+        media_antes = await en_paralelo(cliente_por_llamada, mensajes, concurrencia)
+        antes = await estadisticas_stub(control)
+
+        # 2. Cliente compartido del servicio
+        await estadisticas_stub(control, reiniciar=True)
+        await iniciar_cliente_whatsapp()
+        servicio = WhatsAppService()
+
+        async def cliente_compartido():
+            assert await servicio.send_welcome_message(TELEFONO, "Prueba")
+
+        media_despues = await en_paralelo(cliente_compartido, mensajes, concurrencia)
+        despues = await estadisticas_stub(control)
+        await cerrar_cliente_whatsapp()
+
+    print(f"{'modo':<26} {'conexiones':>10} {'peticiones':>10} {'ms/mensaje':>10}")
+    print("-"*60)
+    print(f"{'cliente por llamada':<26} {antes['conexiones']:>10} {antes['peticiones']:>10} {media_antes:>8.2f}ms")
+    print(f"{'cliente compartido':<26} {despues['conexiones']:>10} {despues['peticiones']:>10} {media_despues:>8.2f}ms")
+    print("="*60)
+    print(f"📊 Métricas del servicio: {metricas_http_whatsapp.snapshot()}")
+
+    servidor.should_exit = True
+    await tarea_servidor
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificar el cliente HTTP compartido de WhatsApp")
+    parser.add_argument("--mensajes", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.mensajes, args.concurrencia))
@@ -0,0 +1,58 @@
+"""
+Script para calibrar el factor de costo de bcrypt en la máquina de despliegue
+- Mide la latencia de bcrypt.hashpw para varios costos
+- Sugiere el mayor costo cuya mediana no supera la latencia objetivo
+- El resultado se configura con la variable de entorno BCRYPT_ROUNDS
+
+Uso:
+    python calibrar_bcrypt.py                 # objetivo 250 ms
+    python calibrar_bcrypt.py --objetivo-ms 300 --muestras 7
+"""
+import argparse
+import statistics
+import time
+
+import bcrypt
+
+COSTO_MINIMO = 10  # Por debajo de 10 el hash es demasiado barato para un atacante
+COSTO_MAXIMO = 16
+
+def medir_costo(costo: int, muestras: int) -> list[float]:
+    """Latencias (ms) de hashear una contraseña con el costo indicado"""
+    salt = bcrypt.gensalt(rounds=costo)
+    latencias = []
+    for _ in range(muestras):
+        inicio = time.perf_counter()
+        bcrypt.hashpw(b"calibracion-ubikha", salt)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+def calibrar(objetivo_ms: float, muestras: int) -> int:
+    print(f"🎯 Latencia objetivo: {objetivo_ms:.0f} ms por hash ({muestras} muestras por costo)")
+    print("\n" + "="*60)
+    print(f"{'costo':>5} | {'mediana':>10} | {'mín':>10} | {'máx':>10}")
+    print("-"*60)
+
+    elegido = COSTO_MINIMO
+    for costo in range(COSTO_MINIMO, COSTO_MAXIMO + 1):
+        latencias = medir_costo(costo, muestras)
+        mediana = statistics.median(latencias)
+        print(f"{costo:>5} | {mediana:>8.1f}ms | {min(latencias):>8.1f}ms | {max(latencias):>8.1f}ms")
+        if mediana <= objetivo_ms:
+            elegido = costo
+        else:
+            # Cada +1 duplica el tiempo: los costos siguientes también se pasan
+            break
+
+    print("="*60)
+    return elegido
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrar BCRYPT_ROUNDS para esta máquina")
+    parser.add_argument("--objetivo-ms", type=float, default=250, help="Latencia máxima por hash en ms")
+    parser.add_argument("--muestras", type=int, default=5, help="Hashes medidos por cada costo")
+    args = parser.parse_args()
+
+    costo = calibrar(args.objetivo_ms, args.muestras)
+    print(f"\n✅ Costo sugerido: BCRYPT_ROUNDS={costo}")
+    print("   Agrégalo al .env; las contraseñas con otro costo se rehashean en el siguiente login.")
@@ -0,0 +1,67 @@
+"""
+Script para ajustar las claves foráneas de las tablas de difusiones
+- difusion_destinatarios.id_usuario: ON DELETE CASCADE
+- difusiones.id_creador: nullable, ON DELETE SET NULL
+- difusiones.id_inmueble: ON DELETE SET NULL
+Sin esto, eliminar un usuario o inmueble con difusiones falla por la FK.
+"""
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# tabla, columna, tabla referenciada, columna referenciada, acción
+CLAVES = [
+    ("difusion_destinatarios", "id_usuario", "usuarios", "id_usuario", "CASCADE"),
+    ("difusiones", "id_creador", "usuarios", "id_usuario", "SET NULL"),
+    ("difusiones", "id_inmueble", "inmuebles", "id_inmueble", "SET NULL"),
+]
+
+async def fix_fk_difusiones():
+    try:
+        # Conectar a la base de datos
+        database_url = os.getenv("DATABASE_URL")
+        asyncpg_url = database_url.replace("postgresql+asyncpg://", "postgresql://")
+        conn = await asyncpg.connect(asyncpg_url)
+
+        print("✅ Conexión exitosa a la base de datos")
+        print("\n" + "="*60)
+
+        async with conn.transaction():
+            await conn.execute("ALTER TABLE difusiones ALTER COLUMN id_creador DROP NOT NULL;")
+            print("✅ difusiones.id_creador: admite NULL")
+
+            for tabla, columna, referida, columna_referida, accion in CLAVES:
+                # Nombre real de la FK actual (create_all usa el nombre por defecto de Postgres)
+                nombres = await conn.fetch("""
+                SELECT con.conname
+                FROM pg_constraint con
+                JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY(con.conkey)
+                WHERE con.contype = 'f'
+                  AND con.conrelid = $1::regclass
+                  AND att.attname = $2;
+                """, tabla, columna)
+                for fila in nombres:
+                    await conn.execute(f'ALTER TABLE {tabla} DROP CONSTRAINT "{fila["conname"]}";')
+
+                await conn.execute(f"""
+                ALTER TABLE {tabla}
+                ADD CONSTRAINT {tabla}_{columna}_fkey
+                FOREIGN KEY ({columna}) REFERENCES {referida} ({columna_referida})
+                ON DELETE {accion};
+                """)
+                print(f"✅ {tabla}.{columna:<12}: ON DELETE {accion}")
+
+        await conn.close()
+        print("\n✅ Proceso completado exitosamente!")
+
+    except Exception as e:
+        print(f"❌ Error al ajustar las claves foráneas de difusiones: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    asyncio.run(fix_fk_difusiones())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Script para migrar contraseñas en texto plano a bcrypt
+- Misma lógica que POST /auth/corregir-passwords, sin pasar por la API
+- Recorre usuarios por lotes, hashea en todos los núcleos y escribe en bloque
+- Si se interrumpe (Ctrl+C), volver a ejecutarlo continúa desde el checkpoint
+
+Uso:
+    python migrar_passwords.py
+    python migrar_passwords.py --lote 5000 --procesos 8
+    python migrar_passwords.py --desde-cero
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Agregar el directorio app/ al path para importar los módulos
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from services.migracion_passwords import MigracionPasswords, MIGRACION_TAMANO_LOTE, MIGRACION_PROCESOS
+
+async def reportar(migracion: MigracionPasswords, intervalo: float):
+    while True:
+        await asyncio.sleep(intervalo)
+        progreso = migracion.progreso()
+        eta = f", ETA {progreso['eta_segundos']:.0f}s" if progreso["eta_segundos"] else ""
+        print(f"⏳ {progreso['procesados']}/{progreso['pendientes_inicio']} ({progreso['porcentaje']}%) "
+              f"- {progreso['usuarios_por_segundo']} usuarios/s{eta}")
+
+async def migrar_passwords(lote: int, procesos: int, desde_cero: bool):
+    migracion = MigracionPasswords(tamano_lote=lote, procesos=procesos)
+    print(f"🔧 Migrando contraseñas (lote {lote}, {procesos} procesos)...")
+    print("\n" + "="*60)
+
+    reporte = asyncio.create_task(reportar(migracion, 2.0))
+    try:
+        progreso = await migracion.ejecutar(reanudar=not desde_cero)
+    finally:
+        reporte.cancel()
+
+    print("="*60)
+    if progreso["estado"] == "completada":
+        print(f"✅ Migración completada: {progreso['migrados']} contraseñas hasheadas "
+              f"({progreso['omitidos']} omitidas por cambios concurrentes)")
+    else:
+        print(f"❌ Migración {progreso['estado']}: {progreso['error']}")
+        print(f"   Vuelve a ejecutar el script para continuar desde id_usuario > {progreso['ultimo_id']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrar contraseñas en texto plano a bcrypt")
+    parser.add_argument("--lote", type=int, default=MIGRACION_TAMANO_LOTE, help="Usuarios por lote")
+    parser.add_argument("--procesos", type=int, default=MIGRACION_PROCESOS, help="Procesos para hashear")
+    parser.add_argument("--desde-cero", action="store_true", help="Ignorar el checkpoint y empezar desde el inicio")
+    args = parser.parse_args()
+    asyncio.run(migrar_passwords(args.lote, args.procesos, args.desde_cero))